@@ -0,0 +1,63 @@
+# analyze_videos.py
+import argparse
+import json
+
+from utils.batch_analysis import analyze_videos, check_seeking, split_video
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the vehicles of recorded lane videos as fast as the machine "
+                                                 "allows, every video is split into segments processed in parallel")
+    parser.add_argument('videos', nargs='+', help="local video files, one lane each unless --rois gives several")
+    parser.add_argument('--model', default='models/yolov8m.onnx')
+    parser.add_argument('--output', default='counts.csv', help="per-frame and per-lane counts, CSV or .parquet "
+                                                                 "(needs pyarrow)")
+    parser.add_argument('--rois', default=None,
+                        help="JSON file with the lane polygons of each video, e.g. [[[[0, 0.3], [1, 0.3], [1, 1], "
+                             "[0, 1]]], null] (null: one lane covering the frame)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU core), "
+                                                                  "1 runs sequentially in this process")
+    parser.add_argument('--segment-frames', type=int, default=600, help="frames per task")
+    parser.add_argument('--batch', type=int, default=4, help="frames per detection batch")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="ONNX Runtime threads per worker (default: CPU cores / workers)")
+    parser.add_argument('--progress-interval', type=float, default=5.0, help="seconds between progress reports")
+    parser.add_argument('--check-seek', action='store_true',
+                        help="first check that every segment start decodes the same frames as a sequential read")
+    args = parser.parse_args()
+
+    if args.output.endswith('.parquet'):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("Parquet output needs pyarrow (pip install pyarrow), or write a .csv file")
+
+    rois = None
+    if args.rois:
+        with open(args.rois) as f:
+            rois = json.load(f)
+        if len(rois) != len(args.videos):
+            parser.error(f"--rois has {len(rois)} entries for {len(args.videos)} videos")
+
+    if args.check_seek:
+        for video in args.videos:
+            segments, _ = split_video(video, args.segment_frames)
+            mismatches = check_seeking(video, [start for start, _ in segments[1:]] or [0])
+            if mismatches:
+                parser.error(f"{video}: seeking is not frame-exact at frames {mismatches}, "
+                             f"use --segment-frames larger than the video to read it in one segment")
+            print(f"{video}: seeking checked at {max(len(segments) - 1, 1)} segment starts")
+
+    session_options = {'intra_op_threads': args.threads} if args.threads else None
+    result = analyze_videos(args.videos, args.output, args.model, rois=rois, workers=args.workers,
+                            segment_frames=args.segment_frames, batch_size=args.batch,
+                            session_options=session_options, progress_interval=args.progress_interval)
+
+    print(f"{result['frames']} frames in {result['elapsed']:.1f} s ({result['fps']:.1f} frames/s), "
+          f"{result['rows']} rows written to {args.output}")
+    for (video, lane), total in result['totals'].items():
+        print(f"{video} lane {lane}: {total} vehicle detections")
+
+
+if __name__ == "__main__":
+    main()
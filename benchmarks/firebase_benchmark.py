@@ -0,0 +1,61 @@
+# benchmarks/firebase_benchmark.py
+"""
+Compare direct Firebase lane writes with the write-behind publisher, offline
+
+An in-memory reference with an artificial round-trip latency stands in for the
+RTDB. Each tick does what TrafficMonitor.process_lanes does to Firebase:
+update_timers() plus one update_lane() per lane.
+
+Run from the repository root:
+    python -m benchmarks.firebase_benchmark
+"""
+import argparse
+import time
+
+import numpy as np
+
+from utils.firebase_manager import FirebaseManager
+from utils.memory_database import MemoryReference
+from utils.traffic_light_manager import TrafficLightManager
+
+
+def run_ticks(firebase_manager, ticks, num_lanes=4):
+    traffic_light_manager = TrafficLightManager(num_lanes=num_lanes, firebase_manager=firebase_manager)
+    rng = np.random.default_rng(0)
+
+    times = []
+    for _ in range(ticks):
+        start = time.perf_counter()
+        traffic_light_manager.update_timers()
+        for lane_id in range(1, num_lanes + 1):
+            traffic_light_manager.update_lane(lane_id, int(rng.integers(0, 20)))
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.02, help='simulated round trip in seconds')
+    parser.add_argument('--ticks', type=int, default=50)
+    parser.add_argument('--flush-interval', type=float, default=0.2)
+    args = parser.parse_args()
+
+    for write_behind in [False, True]:
+        ref = MemoryReference('traffic_system', latency=args.latency)
+        firebase_manager = FirebaseManager(ref=ref, write_behind=write_behind, flush_interval=args.flush_interval)
+        round_trips = ref.round_trips
+
+        start = time.perf_counter()
+        times = run_ticks(firebase_manager, args.ticks)
+        firebase_manager.close()
+        total = time.perf_counter() - start
+
+        name = 'write-behind' if write_behind else 'direct'
+        print(f"{name:<13} tick mean {times.mean():8.3f} ms  p95 {np.percentile(times, 95):8.3f} ms  "
+              f"{args.ticks / total:7.1f} ticks/s  round trips {ref.round_trips - round_trips}")
+        if firebase_manager.publisher:
+            print(f"{'':<13} {firebase_manager.publisher.get_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/frame_transport_benchmark.py
+"""
+Compare passing 720p frames between processes through a SharedFrameRing and a multiprocessing.Queue
+
+A producer process writes frames as fast as it can, the consumer takes the
+newest one, touches it and reports throughput and producer-to-consumer latency.
+
+Run from the repository root:
+    python -m benchmarks.frame_transport_benchmark
+"""
+import argparse
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from utils.shared_frame_ring import SharedFrameRing
+
+SHAPE = (720, 1280, 3)
+
+
+def make_frames():
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, SHAPE, dtype=np.uint8) for _ in range(4)]
+
+
+def queue_producer(frame_queue, num_frames, stop_event):
+    frames = make_frames()
+    for i in range(num_frames):
+        if stop_event.is_set():
+            break
+        frame_queue.put((time.time(), frames[i % len(frames)]))
+    frame_queue.put(None)
+
+
+def ring_producer(ring, num_frames, stop_event):
+    frames = make_frames()
+    for i in range(num_frames):
+        if stop_event.is_set():
+            break
+        ring.write(frames[i % len(frames)])
+    ring.close_writer()
+    ring.close()
+
+
+def consume_queue(num_frames):
+    context = mp.get_context('spawn')
+    frame_queue = context.Queue(maxsize=4)
+    stop_event = context.Event()
+    producer = context.Process(target=queue_producer, args=(frame_queue, num_frames, stop_event))
+    producer.start()
+
+    latencies = []
+    first = None
+    while True:
+        item = frame_queue.get()
+        if item is None:
+            break
+        timestamp, frame = item
+        first = first or time.perf_counter()
+        frame[0, 0].sum()
+        latencies.append(time.time() - timestamp)
+    elapsed = time.perf_counter() - first
+    producer.join()
+    return len(latencies), elapsed, np.array(latencies) * 1000
+
+
+def consume_ring(num_frames):
+    context = mp.get_context('spawn')
+    ring = SharedFrameRing(SHAPE, slots=4, lock=context.Lock())
+    stop_event = context.Event()
+    producer = context.Process(target=ring_producer, args=(ring, num_frames, stop_event))
+    producer.start()
+
+    latencies = []
+    first = None
+    seq = -1
+    while True:
+        handle = ring.acquire_latest(seq)
+        if handle is None:
+            if ring.writer_closed:
+                break
+            time.sleep(0.0001)
+            continue
+        with handle:
+            first = first or time.perf_counter()
+            handle.frame[0, 0].sum()
+            latencies.append(time.time() - handle.timestamp)
+            seq = handle.seq
+    elapsed = time.perf_counter() - first
+    producer.join()
+    ring.close()
+    return len(latencies), elapsed, np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=500)
+    args = parser.parse_args()
+
+    for name, consume in [('multiprocessing.Queue', consume_queue), ('SharedFrameRing', consume_ring)]:
+        received, elapsed, latencies = consume(args.frames)
+        print(f"{name:<22} {received:>5} frames received, {received / elapsed:8.1f} frames/s, "
+              f"latency p50 {np.percentile(latencies, 50):7.3f} ms  p95 {np.percentile(latencies, 95):7.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/nms_benchmark.py
+"""
+Compare the per-class NMS loop against the single-pass batched NMS for 10 to 5,000 candidate boxes
+
+Run from the repository root:
+    python -m benchmarks.nms_benchmark
+"""
+import argparse
+import time
+
+import numpy as np
+
+from yolov8.utils import nms, batched_nms
+
+
+def legacy_multiclass_nms(boxes, scores, class_ids, iou_threshold):
+    """The per-class loop multiclass_nms used before batched_nms"""
+    keep_boxes = []
+    for class_id in np.unique(class_ids):
+        class_indices = np.where(class_ids == class_id)[0]
+        class_keep_boxes = nms(boxes[class_indices, :], scores[class_indices], iou_threshold)
+        keep_boxes.extend(class_indices[class_keep_boxes])
+    return keep_boxes
+
+
+def random_detections(rng, num_boxes, img_width=1280, img_height=720, num_classes=4):
+    """Clustered boxes, similar to what the detector produces on a busy street"""
+    num_objects = max(1, num_boxes // 20)
+    centers = rng.uniform((0, 0), (img_width, img_height), size=(num_objects, 2))
+    sizes = rng.uniform(20, 200, size=(num_objects, 2))
+
+    owner = rng.integers(0, num_objects, num_boxes)
+    xy = centers[owner] + rng.normal(0, 8, size=(num_boxes, 2))
+    wh = sizes[owner] * rng.uniform(0.8, 1.2, size=(num_boxes, 2))
+    boxes = np.concatenate((xy - wh / 2, xy + wh / 2), axis=1).astype(np.float32)
+
+    scores = rng.uniform(0.5, 1.0, num_boxes).astype(np.float32)
+    class_ids = rng.integers(0, num_classes, num_boxes)
+    return boxes, scores, class_ids
+
+
+def time_it(func, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iou-threshold', type=float, default=0.5)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'boxes':>6} {'kept':>6} {'legacy ms':>10} {'batched ms':>11} {'speedup':>8}  same")
+    for num_boxes in [10, 50, 100, 250, 500, 1000, 2000, 5000]:
+        boxes, scores, class_ids = random_detections(rng, num_boxes)
+
+        legacy_time, legacy_keep = time_it(
+            lambda: legacy_multiclass_nms(boxes, scores, class_ids, args.iou_threshold), args.repeats)
+        batched_time, batched_keep = time_it(
+            lambda: batched_nms(boxes, scores, class_ids, args.iou_threshold), args.repeats)
+
+        same = set(np.asarray(legacy_keep).tolist()) == set(batched_keep.tolist())
+        print(f"{num_boxes:>6} {len(batched_keep):>6} {legacy_time:>10.3f} {batched_time:>11.3f} "
+              f"{legacy_time / batched_time:>7.2f}x  {same}")
+
+
+if __name__ == '__main__':
+    main()
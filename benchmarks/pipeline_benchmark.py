@@ -0,0 +1,315 @@
+# benchmarks/pipeline_benchmark.py
+"""
+Run the TrafficMonitor pipeline offline and report per-stage latency and FPS
+
+Lanes read local video files (looped) or generated frames, detection uses a model given
+with --model or an auto-generated stand-in with the YOLOv8 input/output layout, and
+Firebase is replaced by an in-memory reference. No network or display is needed.
+
+Per tick, each stage is summed over the lanes:
+    capture         decoding the next frame of every lane
+    prepare_input   resize and normalization into the input tensor
+    inference       session runs
+    process_output  decoding, NMS and rescaling of the model output
+    nms             the NMS part of process_output
+    drawing         boxes, masks, lane info and grid (skipped with --headless)
+    publishing      lane updates handed to Firebase
+    tick            the whole tick
+
+Run from the repository root:
+    python -m benchmarks.pipeline_benchmark --videos lane1.mp4 lane2.mp4 --output results.json
+    python -m benchmarks.pipeline_benchmark --output new.json --baseline results.json
+    python -m benchmarks.pipeline_benchmark --headless --motion-gate --static-lanes 2
+    python -m benchmarks.pipeline_benchmark --headless --detect-every 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.standin_model import make_standin_model
+from utils.firebase_manager import FirebaseManager
+from utils.memory_database import MemoryReference
+from utils.traffic_monitor import TrafficMonitor, VEHICLE_CLASSES
+from yolov8 import YOLOv8
+
+STAGES = ['capture', 'prepare_input', 'inference', 'process_output', 'nms', 'drawing', 'publishing', 'tick']
+
+
+class SyntheticCapture:
+    """cv2.VideoCapture look-alike producing a road with vehicles moving down the frame, or standing still"""
+
+    def __init__(self, width=1280, height=720, num_vehicles=8, seed=0, moving=True):
+        rng = np.random.default_rng(seed)
+        self.width = width
+        self.height = height
+        self.background = np.full((height, width, 3), 90, dtype=np.uint8)
+        cv2.rectangle(self.background, (width // 4, 0), (3 * width // 4, height), (60, 60, 60), -1)
+        self.background += rng.integers(0, 12, self.background.shape, dtype=np.uint8)
+
+        self.positions = rng.uniform((width // 4, 0), (3 * width // 4 - 120, height), (num_vehicles, 2))
+        self.speeds = rng.uniform(4, 12, num_vehicles) if moving else np.zeros(num_vehicles)
+        # Dark vehicles on a dark road, the stand-in model finds a realistic number of them
+        self.colors = rng.integers(40, 80, (num_vehicles, 3)).tolist()
+        self.frame = np.empty_like(self.background)
+
+    def read(self, image=None):
+        frame = self.frame if image is None else image
+        np.copyto(frame, self.background)
+        self.positions[:, 1] = (self.positions[:, 1] + self.speeds) % self.height
+        for (x, y), color in zip(self.positions.astype(int), self.colors):
+            cv2.rectangle(frame, (x, y), (x + 120, y + 70), color, -1)
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        return 0
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class OfflineMonitor(TrafficMonitor):
+    """TrafficMonitor reading local videos, or generated frames when a source is None"""
+
+    def __init__(self, *args, static_lanes=0, **kwargs):
+        # The generated vehicles of the first static_lanes lanes do not move (red light queue)
+        self.static_lanes = static_lanes
+        super().__init__(*args, **kwargs)
+
+    def setup_video_captures(self):
+        caps = []
+        for i, source in enumerate(self.video_urls):
+            if source is None:
+                caps.append(SyntheticCapture(seed=i, moving=i >= self.static_lanes))
+            else:
+                cap = cv2.VideoCapture(source)
+                if not cap.isOpened():
+                    raise IOError(f"Could not open video {source}")
+                caps.append(cap)
+        return caps
+
+
+class StageTimer:
+    """Per-tick sums of the time spent in each stage"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.times = {stage: [] for stage in STAGES}
+        self.current = dict.fromkeys(STAGES, 0.0)
+
+    def add(self, stage, seconds):
+        self.current[stage] += seconds
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def end_tick(self):
+        for stage, seconds in self.current.items():
+            self.times[stage].append(seconds)
+        self.current = dict.fromkeys(STAGES, 0.0)
+
+    def summary(self):
+        summary = {}
+        for stage, times in self.times.items():
+            times = np.array(times) * 1000
+            summary[stage] = {'mean': float(times.mean()), 'p50': float(np.percentile(times, 50)),
+                              'p95': float(np.percentile(times, 95)), 'p99': float(np.percentile(times, 99))}
+        return summary
+
+
+class TimedCallable:
+    """Proxy timing the calls of an object, other attributes go to the object itself"""
+
+    def __init__(self, obj, timed_call):
+        self.obj = obj
+        self.timed_call = timed_call
+
+    def __call__(self, *args, **kwargs):
+        return self.timed_call(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.obj, name)
+
+
+def instrument(monitor, timer):
+    """Time the pipeline stages by wrapping the methods of this monitor's objects"""
+    detector = monitor.yolov8_detector
+    detector.preprocessor = TimedCallable(detector.preprocessor, timer.wrap('prepare_input', detector.preprocessor))
+    detector.inference = timer.wrap('inference', detector.inference)
+    detector.process_output = timer.wrap('process_output', detector.process_output)
+
+    # process_output calls multiclass_nms through the module globals
+    yolov8_module = sys.modules[YOLOv8.__module__]
+    yolov8_module.multiclass_nms = timer.wrap('nms', yolov8_module.multiclass_nms)
+
+    firebase_manager = monitor.firebase_manager
+    firebase_manager.update_lane_status = timer.wrap('publishing', firebase_manager.update_lane_status)
+
+
+def read_frames(caps, timer):
+    frames = []
+    for cap in caps:
+        start = time.perf_counter()
+        ret, frame = cap.read()
+        if not ret:
+            # Loop the video
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = cap.read()
+        timer.add('capture', time.perf_counter() - start)
+        if not ret:
+            raise IOError("Could not read a frame")
+        frames.append(frame)
+    return frames
+
+
+def run_tick(monitor, timer, render):
+    start = time.perf_counter()
+    frames = read_frames(monitor.caps, timer)
+    detection_frames, lane_counts = monitor.process_lanes(frames, render=render)
+    if render:
+        grid_start = time.perf_counter()
+        monitor.create_grid_frame(detection_frames)
+        timer.add('drawing', time.perf_counter() - grid_start + monitor.draw_time)
+    timer.add('tick', time.perf_counter() - start)
+    return sum(lane_counts)
+
+
+def run_benchmark(monitor, timer, ticks, warmup, render):
+    """Returns (FPS, mean vehicles counted per lane and tick)"""
+    for _ in range(warmup):
+        run_tick(monitor, timer, render)
+    timer.reset()
+
+    detections = 0
+    start = time.perf_counter()
+    for _ in range(ticks):
+        detections += run_tick(monitor, timer, render)
+        timer.end_tick()
+    elapsed = time.perf_counter() - start
+    return ticks / elapsed, detections / (ticks * len(monitor.caps))
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print the per-stage change against a baseline run, returns the stages that got slower"""
+    regressions = []
+    print(f"\nAgainst {baseline.get('commit') or 'baseline'} (p50 / p95, + is slower)")
+    for stage in STAGES:
+        if stage not in baseline['stages']:
+            continue
+        new, old = results['stages'][stage], baseline['stages'][stage]
+        changes = [(new[key] - old[key]) / old[key] if old[key] > 0 else 0.0 for key in ('p50', 'p95')]
+        flag = ''
+        if changes[0] > tolerance:
+            regressions.append(stage)
+            flag = '  REGRESSION'
+        print(f"{stage:<15} {100 * changes[0]:+7.1f}% {100 * changes[1]:+7.1f}%{flag}")
+    fps_change = (results['fps'] - baseline['fps']) / baseline['fps']
+    print(f"{'fps':<15} {100 * fps_change:+7.1f}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', nargs='*', default=[], help='local lane videos (default: generated frames)')
+    parser.add_argument('--lanes', type=int, default=4)
+    parser.add_argument('--model', default=None, help='ONNX model (default: generated stand-in model)')
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--headless', action='store_true', help='skip drawing')
+    parser.add_argument('--firebase-latency', type=float, default=0.02, help='simulated round trip in seconds')
+    parser.add_argument('--motion-gate', action='store_true', help='reuse the detections of unchanged lanes')
+    parser.add_argument('--detect-every', type=int, default=1,
+                        help='detect on every Nth frame of a lane and track the vehicles in between')
+    parser.add_argument('--static-lanes', type=int, default=0,
+                        help='generated lanes whose vehicles stand still, from lane 1')
+    parser.add_argument('--output', default=None, help='save the results as JSON')
+    parser.add_argument('--baseline', default=None, help='JSON results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='p50 slowdown of a stage reported as a regression')
+    args = parser.parse_args()
+
+    sources = [args.videos[i % len(args.videos)] if args.videos else None for i in range(args.lanes)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = args.model or make_standin_model(os.path.join(tmp_dir, 'standin.onnx'))
+        detector = YOLOv8(model_path, conf_thres=0.5, iou_thres=0.5, classes=VEHICLE_CLASSES.keys())
+        firebase_manager = FirebaseManager(ref=MemoryReference('traffic_system', latency=args.firebase_latency))
+        monitor = OfflineMonitor(sources, model_path, headless=args.headless, detector=detector,
+                                 firebase_manager=firebase_manager, static_lanes=args.static_lanes,
+                                 motion_gate={} if args.motion_gate else None, detect_every=args.detect_every)
+
+        timer = StageTimer()
+        instrument(monitor, timer)
+        fps, detections = run_benchmark(monitor, timer, args.ticks, args.warmup, render=not args.headless)
+
+        firebase_manager.close()
+        for cap in monitor.caps:
+            cap.release()
+
+    results = {
+        'commit': get_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {'videos': args.videos, 'lanes': args.lanes, 'model': args.model or 'standin',
+                   'ticks': args.ticks, 'headless': args.headless, 'firebase_latency': args.firebase_latency,
+                   'motion_gate': args.motion_gate, 'static_lanes': args.static_lanes,
+                   'detect_every': args.detect_every},
+        'fps': fps,
+        'detections_per_lane': detections,
+        'stages': timer.summary(),
+        'publisher': firebase_manager.publisher.get_stats() if firebase_manager.publisher else None,
+        'motion_gate': monitor.get_motion_gate_stats(),
+        'tracker': monitor.get_tracker_stats(),
+    }
+
+    print(f"{args.lanes} lanes, {args.ticks} ticks, {fps:.1f} FPS, {detections:.1f} detections per lane")
+    print(f"{'stage':<15} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}  (ms per tick)")
+    for stage, stats in results['stages'].items():
+        print(f"{stage:<15} {stats['mean']:8.3f} {stats['p50']:8.3f} {stats['p95']:8.3f} {stats['p99']:8.3f}")
+    for i, stats in enumerate(results['motion_gate']):
+        print(f"lane {i + 1}: detections reused on {100 * stats['hit_rate']:.0f}% of frames, "
+              f"{1000 * stats['time_saved']:.0f} ms saved")
+    for i, stats in enumerate(results['tracker']):
+        print(f"lane {i + 1}: {stats['unique_count']} vehicles tracked, {stats['active_tracks']} active tracks")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/preprocess_benchmark.py
+"""
+Compare the original YOLOv8.prepare_input path against the in-place Preprocessor on 720p frames
+
+Run from the repository root:
+    python -m benchmarks.preprocess_benchmark
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from yolov8.preprocessing import Preprocessor
+
+
+def legacy_prepare_input(image, input_width, input_height):
+    """The preprocessing path YOLOv8.prepare_input used before the Preprocessor"""
+    input_img = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    input_img = cv2.resize(input_img, (input_width, input_height))
+    input_img = input_img / 255.0
+    input_img = input_img.transpose(2, 0, 1)
+    return input_img[np.newaxis, :, :, :].astype(np.float32)
+
+
+def time_it(func, frames, repeats):
+    # Warm up once so the first-call allocations are not measured
+    func(frames[0])
+
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        func(frames[i % len(frames)])
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=640, help='model input width')
+    parser.add_argument('--height', type=int, default=480, help='model input height')
+    parser.add_argument('--repeats', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8) for _ in range(4)]
+
+    buffer = np.empty((1, 3, args.height, args.width), dtype=np.float32)
+    resize = Preprocessor(args.width, args.height)
+    letterbox = Preprocessor(args.width, args.height, letterbox=True)
+
+    candidates = {
+        'legacy': lambda frame: legacy_prepare_input(frame, args.width, args.height),
+        'preprocessor': lambda frame: resize(frame, out=buffer[0]),
+        'preprocessor (letterbox)': lambda frame: letterbox(frame, out=buffer[0]),
+    }
+
+    print(f"720p -> {args.width}x{args.height}, {args.repeats} frames")
+    baseline = None
+    for name, func in candidates.items():
+        times = time_it(func, frames, args.repeats)
+        mean = times.mean()
+        baseline = baseline or mean
+        print(f"{name:<26} mean {mean:6.3f} ms  p50 {np.percentile(times, 50):6.3f} ms  "
+              f"p95 {np.percentile(times, 95):6.3f} ms  speedup {baseline / mean:4.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/session_benchmark.py
+"""
+Startup time and steady-state inference latency of the YOLOv8 session for several ONNX Runtime settings
+
+Each configuration is started twice: the cold start runs the graph optimizations and
+saves the optimized model, the warm start loads it from the cache directory.
+
+Run from the repository root:
+    python -m benchmarks.session_benchmark --model models/yolov8m.onnx
+"""
+import argparse
+import itertools
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from yolov8 import YOLOv8, SessionConfig
+
+
+def measure_latency(detector, batch_size, repeats):
+    input_tensor = detector.get_input_buffer(batch_size if detector.dynamic_batch else detector.batch_size)
+    input_tensor[:] = np.random.default_rng(0).random(input_tensor.shape, dtype=np.float32)
+
+    # Warm up so the first-run allocations are not measured
+    for _ in range(3):
+        detector.inference(input_tensor)
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        detector.inference(input_tensor)
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='models/yolov8m.onnx')
+    parser.add_argument('--threads', type=int, nargs='+', default=[0, 1, os.cpu_count()],
+                        help='intra-op thread counts to try, 0 lets ONNX Runtime decide')
+    parser.add_argument('--modes', nargs='+', default=['sequential', 'parallel'])
+    parser.add_argument('--levels', nargs='+', default=['basic', 'extended', 'all'])
+    parser.add_argument('--batch-size', type=int, default=4, help='batch size for models with a dynamic batch')
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix='yolov8_optimized_')
+    print(f"{'threads':>7} {'mode':<10} {'level':<8} {'binding':<7} {'cold ms':>8} {'warm ms':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8}")
+    try:
+        for threads, mode, level, io_binding in itertools.product(args.threads, args.modes, args.levels,
+                                                                  [False, True]):
+            # A fresh cache directory per configuration, so the first start is really cold
+            config_dir = os.path.join(cache_dir, f"{threads}_{mode}_{level}_{io_binding}")
+            config = SessionConfig(intra_op_threads=threads, execution_mode=mode, optimization_level=level,
+                                   optimized_model_dir=config_dir, io_binding=io_binding)
+            cold = YOLOv8(args.model, session_config=config)
+            warm = YOLOv8(args.model, session_config=config)
+            times = measure_latency(warm, args.batch_size, args.repeats)
+
+            print(f"{threads:>7} {mode:<10} {level:<8} {str(io_binding):<7} {1000 * cold.startup_time:8.1f} "
+                  f"{1000 * warm.startup_time:8.1f} {np.percentile(times, 50):8.2f} "
+                  f"{np.percentile(times, 95):8.2f}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
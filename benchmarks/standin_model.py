@@ -0,0 +1,104 @@
+# benchmarks/standin_model.py
+"""
+Generate a small ONNX model with the input and output layout of a YOLOv8 detection export
+
+Input "images" is (batch, 3, height, width) and output "output0" is (batch, 4 + num_classes, anchors)
+with the anchors of the stride 8, 16 and 32 grids (8400 for 640x640). The model average-pools the
+image on the three grids and maps the pooled colors, relative to the image mean, to boxes and
+class scores with random 1x1 convolutions, so it costs a fraction of the real model but the output goes through the same
+decoding, NMS and drawing code with a realistic number of detections.
+
+Run from the repository root:
+    python -m benchmarks.standin_model models/standin.onnx
+"""
+import argparse
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+STRIDES = (8, 16, 32)
+
+
+def make_standin_model(path, input_width=640, input_height=640, num_classes=80, batch_size=None,
+                       class_bias=-2.0, vehicle_classes=(2, 3, 5, 7), seed=0):
+    """
+    Write the stand-in model to path
+
+    Args:
+    input_width, input_height (int): Model input size, multiples of 32
+    num_classes (int): Number of class score rows
+    batch_size (int): Fixed batch size, None for a dynamic batch
+    class_bias (float): Bias of the class logits, lower gives fewer detections
+    vehicle_classes (tuple): Classes whose scores dominate the others, so that they are the best class of the
+                             detections like on a road camera
+    seed (int): Seed of the random weights
+    """
+    rng = np.random.default_rng(seed)
+    channels = 4 + num_classes
+    batch = batch_size if batch_size is not None else 'batch'
+    anchors = sum((input_width // stride) * (input_height // stride) for stride in STRIDES)
+
+    # Boxes and class scores are sigmoids of the pooled colors minus the image mean, so the
+    # number of detections depends on the local contrast rather than on the overall brightness
+    weights = rng.standard_normal((channels, 3, 1, 1)).astype(np.float32)
+    weights[:4] *= 50
+    weights[4:] *= 20
+    bias = np.concatenate([rng.standard_normal(4), np.full(num_classes, class_bias)]).astype(np.float32)
+    other_classes = 4 + np.setdiff1d(np.arange(num_classes), vehicle_classes)
+    weights[other_classes] *= 0.2
+    bias[other_classes] -= 2
+    scale = np.array([input_width, input_height, input_width / 4, input_height / 4] + [1] * num_classes,
+                     dtype=np.float32).reshape(1, channels, 1)
+    # Boxes are at least 16 pixels wide and high
+    offset = np.array([0, 0, 16, 16] + [0] * num_classes, dtype=np.float32).reshape(1, channels, 1)
+
+    initializers = [numpy_helper.from_array(weights, 'W'),
+                    numpy_helper.from_array(bias, 'B'),
+                    numpy_helper.from_array(scale, 'scale'),
+                    numpy_helper.from_array(offset, 'offset'),
+                    numpy_helper.from_array(np.array([0, channels, -1], dtype=np.int64), 'shape')]
+    nodes = [helper.make_node('GlobalAveragePool', ['images'], ['mean'])]
+    branches = []
+    for stride in STRIDES:
+        nodes += [
+            helper.make_node('AveragePool', ['images'], [f'pool{stride}'],
+                             kernel_shape=[stride, stride], strides=[stride, stride]),
+            helper.make_node('Sub', [f'pool{stride}', 'mean'], [f'contrast{stride}']),
+            helper.make_node('Conv', [f'contrast{stride}', 'W', 'B'], [f'conv{stride}']),
+            helper.make_node('Reshape', [f'conv{stride}', 'shape'], [f'flat{stride}']),
+        ]
+        branches.append(f'flat{stride}')
+    nodes += [
+        helper.make_node('Concat', branches, ['logits'], axis=2),
+        helper.make_node('Sigmoid', ['logits'], ['sigmoid']),
+        helper.make_node('Mul', ['sigmoid', 'scale'], ['scaled']),
+        helper.make_node('Add', ['scaled', 'offset'], ['output0']),
+    ]
+
+    graph = helper.make_graph(
+        nodes, 'yolov8_standin',
+        [helper.make_tensor_value_info('images', TensorProto.FLOAT, [batch, 3, input_height, input_width])],
+        [helper.make_tensor_value_info('output0', TensorProto.FLOAT, [batch, channels, anchors])],
+        initializers)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output', help='where the model is saved')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=640)
+    parser.add_argument('--batch-size', type=int, default=None, help='fixed batch size (default: dynamic)')
+    args = parser.parse_args()
+
+    make_standin_model(args.output, args.width, args.height, batch_size=args.batch_size)
+    print(f"Saved {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# benchmarks/store_benchmark.py
+"""
+Ingest and query cost of the lane history store
+
+Appends simulated days of per-frame lane counts (and a light change every 30
+seconds) with virtual timestamps, then times:
+    append      the per-frame call made by TrafficMonitor
+    per-minute  vehicles per minute of every lane over one day, from the rollups
+    raw hour    decoding one hour of per-frame counts
+and compares the per-minute query with the same GROUP BY on a plain table with
+one row per frame and lane.
+
+Run from the repository root:
+    python -m benchmarks.store_benchmark --days 2 --fps 10
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from utils.timeseries_store import TimeSeriesStore
+
+START = 1_700_000_000.0
+
+
+def simulated_counts(frames, num_lanes, seed=0):
+    """Slowly varying vehicle counts with a rush hour bump, (frames, lanes)"""
+    rng = np.random.default_rng(seed)
+    hours = np.arange(frames)[:, None] / frames * 24
+    mean = 3 + 8 * np.exp(-((hours % 24 - 8) ** 2) / 2) + rng.uniform(0, 2, num_lanes)
+    return rng.poisson(mean)
+
+
+def time_call(func, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=float, default=1)
+    parser.add_argument('--fps', type=float, default=10, help='frames per second per intersection')
+    parser.add_argument('--lanes', type=int, default=4)
+    parser.add_argument('--naive', action='store_true', help='also build the one-row-per-frame table to compare')
+    args = parser.parse_args()
+
+    frames_per_day = int(24 * 3600 * args.fps)
+    num_frames = int(frames_per_day * args.days)
+    counts = simulated_counts(frames_per_day, args.lanes)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'lanes.sqlite')
+        # Flushes are triggered by hand every 5 simulated seconds, like the background thread would
+        store = TimeSeriesStore(path, flush_interval=3600)
+        flush_every = int(5 * args.fps)
+
+        append_times = []
+        flush_time = 0.0
+        for i in range(num_frames):
+            timestamp = START + i / args.fps
+            lane_counts = counts[i % frames_per_day].tolist()
+            start = time.perf_counter()
+            store.append_counts('main_intersection', timestamp, lane_counts)
+            append_times.append(time.perf_counter() - start)
+            if i % int(30 * args.fps) == 0:
+                store.append_phase('main_intersection', timestamp, (i // int(30 * args.fps)) % 2, 27, [1, 3],
+                                   lane_counts)
+            if (i + 1) % flush_every == 0:
+                start = time.perf_counter()
+                store.flush()
+                flush_time += time.perf_counter() - start
+        store.flush()
+        size = os.path.getsize(path) + (os.path.getsize(path + '-wal') if os.path.exists(path + '-wal') else 0)
+
+        append_times = np.array(append_times) * 1e6
+        stats = store.get_stats()
+        print(f"{num_frames} frames x {args.lanes} lanes ({args.days:g} days at {args.fps:g} FPS)")
+        print(f"append          mean {append_times.mean():6.2f} us  p99 {np.percentile(append_times, 99):6.2f} us")
+        print(f"flush           {1000 * flush_time / stats['flushes']:6.2f} ms per flush of {flush_every} frames, "
+              f"{1e6 * flush_time / num_frames:.2f} us per frame")
+        print(f"database        {size / 1e6:.1f} MB, {size / (num_frames * args.lanes):.2f} bytes per lane "
+              f"count (chunks {stats['bytes_written'] / 1e6:.1f} MB)")
+
+        day_start = START + 3600 * 24 * max(0.0, args.days - 1)
+        query_ms, rows = time_call(lambda: store.lane_counts('main_intersection', day_start, day_start + 86400))
+        print(f"per-minute day  {query_ms:6.2f} ms, {len(rows)} rows")
+        query_ms, (timestamps, _, _) = time_call(
+            lambda: store.frame_counts('main_intersection', day_start + 8 * 3600, day_start + 9 * 3600))
+        print(f"raw hour        {query_ms:6.2f} ms, {len(timestamps)} frames")
+        store.close()
+
+        if args.naive:
+            naive = sqlite3.connect(os.path.join(tmp_dir, 'naive.sqlite'))
+            naive.execute('CREATE TABLE counts (intersection TEXT, time REAL, lane INTEGER, vehicles INTEGER)')
+            naive.execute('CREATE INDEX counts_time ON counts (intersection, time)')
+            with naive:
+                naive.executemany('INSERT INTO counts VALUES (?, ?, ?, ?)',
+                                  (('main_intersection', START + i / args.fps, lane + 1,
+                                    int(counts[i % frames_per_day, lane]))
+                                   for i in range(num_frames) for lane in range(args.lanes)))
+            query_ms, rows = time_call(lambda: naive.execute(
+                'SELECT CAST(time / 60 AS INTEGER) AS minute, lane, avg(vehicles), max(vehicles) FROM counts '
+                'WHERE intersection = ? AND time >= ? AND time < ? GROUP BY minute, lane',
+                ('main_intersection', day_start, day_start + 86400)).fetchall(), repeat=1)
+            size = os.path.getsize(os.path.join(tmp_dir, 'naive.sqlite'))
+            print(f"row per frame   {query_ms:6.2f} ms for the per-minute day, {size / 1e6:.1f} MB")
+            naive.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# lane_history.py
+import argparse
+import csv
+import os
+import sys
+import time
+from datetime import datetime
+
+from utils.timeseries_store import TimeSeriesReader
+
+
+def parse_time(value):
+    """Seconds since the epoch, or a local date / date and time like 2024-05-01 or 2024-05-01T07:30"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lane counts and light changes kept with --store (or a "
+                                                 "multi-intersection store_path), per time bucket")
+    parser.add_argument('database', help="SQLite file of the store")
+    parser.add_argument('--intersection', default=None, help="intersection id (default: all)")
+    parser.add_argument('--start', type=parse_time, default=None, help="default: 24 hours before --end")
+    parser.add_argument('--end', type=parse_time, default=None, help="default: now")
+    parser.add_argument('--bucket', type=int, default=3600, help="seconds per row, a multiple of 60")
+    parser.add_argument('--lane', type=int, default=None)
+    parser.add_argument('--phases', action='store_true', help="list the light changes instead")
+    parser.add_argument('--csv', default=None, help="write the rows to this CSV file instead of printing them")
+    args = parser.parse_args()
+
+    end = args.end if args.end is not None else time.time()
+    start = args.start if args.start is not None else end - 24 * 3600
+
+    if not os.path.exists(args.database):
+        parser.error(f"{args.database} does not exist")
+    store = TimeSeriesReader(args.database)
+    intersections = [args.intersection] if args.intersection else store.intersections()
+
+    if args.phases:
+        header = ['intersection', 'time', 'phase', 'green_time', 'green_lanes', 'vehicles']
+        rows = [[intersection_id, format_time(timestamp), phase, green_time, ' '.join(map(str, green_lanes)),
+                 ' '.join(map(str, vehicles))]
+                for intersection_id in intersections
+                for timestamp, phase, green_time, green_lanes, vehicles in
+                store.phase_events(intersection_id, start, end)]
+    else:
+        header = ['intersection', 'time', 'lane', 'frames', 'mean_vehicles', 'max_vehicles', 'detections']
+        rows = [[intersection_id, format_time(bucket_start), lane, frames, round(mean, 2), peak, detections]
+                for intersection_id in intersections
+                for bucket_start, lane, frames, mean, peak, detections in
+                store.lane_counts(intersection_id, start, end, bucket=args.bucket, lane=args.lane)]
+    store.close()
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+        print(f"{len(rows)} rows written to {args.csv}")
+        return
+
+    writer = csv.writer(sys.stdout, delimiter='\t')
+    writer.writerow(header)
+    writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
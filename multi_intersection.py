@@ -0,0 +1,26 @@
+# multi_intersection.py
+import argparse
+
+from utils.intersection_supervisor import IntersectionSupervisor, load_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many intersections on a pool of worker processes")
+    parser.add_argument('config', help="JSON config with the model path and the intersections")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: cores)")
+    parser.add_argument('--stats-interval', type=float, default=10.0, help="seconds between throughput reports")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve Prometheus metrics, worker N listens on this port + N")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.metrics_port is not None:
+        config['metrics_port'] = args.metrics_port
+
+    supervisor = IntersectionSupervisor(config, num_workers=args.workers,
+                                        stats_interval=args.stats_interval)
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
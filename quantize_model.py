@@ -0,0 +1,63 @@
+# quantize_model.py
+import argparse
+import json
+import os
+
+from yolov8 import YOLOv8
+from yolov8.quantization import compare_models, quantize_model, sample_frames
+from utils.traffic_monitor import VEHICLE_CLASSES
+
+
+def print_report(report):
+    print(f"Vehicle counts on {report['frames']} frames, INT8 vs FP32")
+    print(f"{'class':<12} {'agreement':>9} {'mean err':>9} {'FP32 total':>10} {'INT8 total':>10}")
+    for name, stats in report['classes'].items():
+        print(f"{name:<12} {100 * stats['exact_agreement']:8.1f}% {stats['mean_abs_error']:9.3f} "
+              f"{stats['reference_total']:10d} {stats['candidate_total']:10d}")
+    print(f"{'all vehicles':<12} {100 * report['total']['exact_agreement']:8.1f}% "
+          f"{report['total']['mean_abs_error']:9.3f}")
+    for name, label in (('reference', 'FP32'), ('candidate', 'INT8')):
+        latency = report[f'{name}_latency_ms']
+        print(f"{label} latency: p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an INT8 YOLOv8 model calibrated on recorded lane videos "
+                                                 "and compare its vehicle counts with the FP32 model")
+    parser.add_argument('videos', nargs='+', help="recorded lane videos used for calibration and the comparison")
+    parser.add_argument('--model', default='models/yolov8m.onnx', help="FP32 model")
+    parser.add_argument('--output', default=None, help="INT8 model (default: <model>.int8.onnx)")
+    parser.add_argument('--calibration-frames', type=int, default=200)
+    parser.add_argument('--calibration-method', default='minmax', choices=['minmax', 'entropy', 'percentile'])
+    parser.add_argument('--eval-frames', type=int, default=200,
+                        help="frames for the comparison, taken between the calibration frames")
+    parser.add_argument('--letterbox', action='store_true', help="the detector runs with letterbox preprocessing")
+    parser.add_argument('--report', default=None, help="also save the comparison report as JSON")
+    args = parser.parse_args()
+
+    output_path = args.output or os.path.splitext(args.model)[0] + '.int8.onnx'
+    if os.path.abspath(output_path) == os.path.abspath(args.model):
+        parser.error("the INT8 model would overwrite the FP32 model, choose another --output")
+
+    frames = sample_frames(args.videos, args.calibration_frames)
+    print(f"Calibrating on {len(frames)} frames from {len(args.videos)} videos")
+    quantize_model(args.model, output_path, frames, letterbox=args.letterbox,
+                   calibration_method=args.calibration_method)
+    print(f"Saved {output_path}")
+
+    # The INT8 model is loaded like any other model
+    reference = YOLOv8(args.model, conf_thres=0.5, iou_thres=0.5, letterbox=args.letterbox,
+                       classes=VEHICLE_CLASSES.keys())
+    candidate = YOLOv8(output_path, conf_thres=0.5, iou_thres=0.5, letterbox=args.letterbox,
+                       classes=VEHICLE_CLASSES.keys())
+    eval_frames = sample_frames(args.videos, args.eval_frames, offset=0.5)
+    report = compare_models(reference, candidate, eval_frames, VEHICLE_CLASSES)
+    print_report(report)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
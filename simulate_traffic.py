@@ -0,0 +1,78 @@
+# simulate_traffic.py
+import argparse
+import itertools
+import time
+
+from utils.scheduling_policy import POLICIES, make_policy
+from utils.simulation import IntersectionSimulator, load_arrival_trace, poisson_arrivals
+from utils.traffic_light_manager import MAX_GREEN_TIME, MIN_GREEN_TIME, REWARD_MULTIPLIER
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the traffic light timing offline, faster than real time. "
+                                                 "Several values per parameter run every combination.")
+    parser.add_argument('--rates', type=float, nargs='+', default=[0.3, 0.1, 0.3, 0.1],
+                        help="mean vehicle arrivals per second of each lane (synthetic traffic)")
+    parser.add_argument('--trace', default=None,
+                        help="replay arrivals from a CSV file with time,lane[,count] columns instead")
+    parser.add_argument('--lanes', type=int, default=4, help="number of lanes of the trace")
+    parser.add_argument('--duration', type=float, default=24 * 3600, help="simulated seconds (synthetic traffic)")
+    parser.add_argument('--step', type=float, default=1.0, help="simulation step in seconds")
+    parser.add_argument('--saturation-flow', type=float, default=0.5, help="vehicles per second of green per lane")
+    parser.add_argument('--min-green', type=float, nargs='+', default=[MIN_GREEN_TIME])
+    parser.add_argument('--max-green', type=float, nargs='+', default=[MAX_GREEN_TIME])
+    parser.add_argument('--reward', type=float, nargs='+', default=[REWARD_MULTIPLIER],
+                        help="reward multiplier")
+    parser.add_argument('--policy', nargs='+', default=['reward'], choices=sorted(POLICIES),
+                        help="scheduling policy: reward (groups in turn, reward rule) or max_pressure "
+                             "(queue discharge with lookahead)")
+    parser.add_argument('--horizon', type=float, default=None,
+                        help="lookahead seconds of max_pressure (default: sized from the arrival rates)")
+    parser.add_argument('--phase-groups', nargs='+', default=None,
+                        help="lanes green together, one comma separated group per phase, e.g. 1,4 2,5 3,6 "
+                             "(default: odd and even lanes)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    phase_groups = None
+    if args.phase_groups:
+        phase_groups = [tuple(int(lane) for lane in group.split(',')) for group in args.phase_groups]
+
+    if args.trace:
+        arrivals = load_arrival_trace(args.trace, args.lanes, args.step)
+    else:
+        arrivals = poisson_arrivals(args.rates, args.duration, args.step, args.seed)
+
+    print(f"{arrivals.shape[1]} lanes, {len(arrivals) * args.step / 3600:.1f} simulated hours, "
+          f"{int(arrivals.sum())} vehicles")
+    print(f"{'policy':<12} {'min':>5} {'max':>5} {'reward':>6} {'veh/h':>8} {'wait s':>8} {'avg queue':>10} "
+          f"{'max queue':>10} {'cycles':>8} {'cycles/s':>9} {'decision us':>12}")
+
+    results = []
+    for policy_name, min_green, max_green, reward in itertools.product(args.policy, args.min_green, args.max_green,
+                                                                       args.reward):
+        options = {}
+        if policy_name == 'max_pressure':
+            options = {'horizon': args.horizon, 'saturation_flow': args.saturation_flow}
+        policy = make_policy(policy_name, **options)
+        simulator = IntersectionSimulator(arrivals, step=args.step, saturation_flow=args.saturation_flow,
+                                          min_green_time=min_green, max_green_time=max_green,
+                                          reward_multiplier=reward, phase_groups=phase_groups, policy=policy)
+        start = time.perf_counter()
+        result = simulator.run()
+        elapsed = time.perf_counter() - start
+        results.append(((policy_name, min_green, max_green, reward), result))
+
+        print(f"{policy_name:<12} {min_green:5.0f} {max_green:5.0f} {reward:6.2f} {result['throughput_per_hour']:8.0f} "
+              f"{result['average_wait']:8.1f} {sum(result['average_queue']):10.1f} {max(result['max_queue']):10d} "
+              f"{result['cycles']:8.0f} {result['cycles'] / elapsed:9.0f} "
+              f"{1e6 * policy.get_stats()['mean_decision_seconds']:12.1f}")
+
+    if len(results) > 1:
+        (policy_name, min_green, max_green, reward), result = min(results, key=lambda item: item[1]['average_wait'])
+        print(f"Lowest average wait: {policy_name}, min {min_green:.0f}, max {max_green:.0f}, reward {reward:.2f} "
+              f"({result['average_wait']:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
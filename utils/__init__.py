@@ -1,2 +1,2 @@
-from .video_capture import setup_video_capture
+from .video_capture import setup_video_capture, ThreadedCapture, CaptureGroup
 from .traffic_monitor import TrafficMonitor
\ No newline at end of file
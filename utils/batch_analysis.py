@@ -0,0 +1,304 @@
+# utils/batch_analysis.py
+import csv
+import multiprocessing as mp
+import os
+import time
+
+import cv2
+import numpy as np
+
+from .lane_roi import LaneROI
+from .traffic_monitor import VEHICLE_CLASSES
+
+COLUMNS = ['video', 'lane', 'frame', 'time', 'vehicles'] + list(VEHICLE_CLASSES.values())
+
+# Seconds decoded before the first frame of a segment, more than the seek error of the video backends
+SEEK_PREROLL = 2.0
+
+# Detector of a worker process, loaded once by init_worker
+_detector = None
+
+
+def split_video(path, segment_frames):
+    """
+    Frame ranges covering a video
+
+    The frame count in the container may be off, so the last segment reads
+    until the end of the video.
+
+    Returns:
+    tuple: ([(start, end), ...] with end None for the last segment, frame count of the container)
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video {path}")
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    starts = list(range(0, max(frame_count, 1), segment_frames))
+    return [(start, start + segment_frames) for start in starts[:-1]] + [(starts[-1], None)], frame_count
+
+
+def open_at(path, start):
+    """
+    Capture positioned on frame start
+
+    The backend's seek can land a few frames off on videos with B-frames or open
+    GOPs, so it seeks SEEK_PREROLL seconds early and decodes forward to start,
+    telling the frames by their timestamp. Without consistent timestamps it
+    decodes from the first frame.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video {path}")
+    if start == 0:
+        return cap
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    seek = start - round(SEEK_PREROLL * fps)
+    if fps > 0 and seek > 0 and cap.grab():
+        # Timestamp of the first frame
+        origin = cap.get(cv2.CAP_PROP_POS_MSEC)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, seek)
+        previous = None
+        while cap.grab():
+            index = round((cap.get(cv2.CAP_PROP_POS_MSEC) - origin) * fps / 1000)
+            if (previous is not None and index != previous + 1) or index >= start:
+                break
+            if index == start - 1:
+                return cap
+            previous = index
+        cap.release()
+        cap = cv2.VideoCapture(path)
+
+    # Skip the frames from the start without converting them
+    for _ in range(start):
+        if not cap.grab():
+            break
+    return cap
+
+
+def check_seeking(path, starts, frames=3):
+    """
+    Starts (of segments) where open_at() does not return the same frames as decoding from the first frame
+
+    Args:
+    path (str): Local video file
+    starts (list): Frame numbers to open the video at
+    frames (int): Frames compared after every start
+    """
+    starts = sorted(starts)
+    expected = {}
+    cap = cv2.VideoCapture(path)
+    for frame_number in range(starts[-1] + frames):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if any(start <= frame_number < start + frames for start in starts):
+            expected[frame_number] = frame
+    cap.release()
+
+    mismatches = []
+    for start in starts:
+        cap = open_at(path, start)
+        for frame_number in range(start, start + frames):
+            ret, frame = cap.read()
+            if ret != (frame_number in expected) or (ret and not np.array_equal(frame, expected[frame_number])):
+                mismatches.append(start)
+                break
+        cap.release()
+    return mismatches
+
+
+def init_worker(model_path, session_options):
+    """Load the detector of a worker process"""
+    global _detector
+    # Imported here so the parent process never loads a model
+    from yolov8 import YOLOv8, SessionConfig
+    _detector = YOLOv8(model_path, conf_thres=0.5, iou_thres=0.5, classes=VEHICLE_CLASSES.keys(),
+                       session_config=SessionConfig(**session_options))
+
+
+def analyze_segment(task):
+    """
+    Count the vehicles of every lane on every frame of a video segment
+
+    Args:
+    task (tuple): (segment index, video index, path, start, end, lane polygons, batch size)
+
+    Returns:
+    tuple: (segment index, frames read, rows) with one row per frame and lane, see COLUMNS
+    """
+    index, video_index, path, start, end, polygons, batch_size = task
+    rois = [LaneROI(polygon) if polygon is not None else None for polygon in polygons]
+    class_ids = np.array(list(VEHICLE_CLASSES))
+
+    cap = open_at(path, start)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    rows = []
+    frame_number = start
+    frames_read = 0
+    while end is None or frame_number < end:
+        # Batches never span two segments, so the results do not depend on the number of workers
+        frames = []
+        while len(frames) < batch_size and (end is None or frame_number + len(frames) < end):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        if not frames:
+            break
+
+        crops = [roi.crop(frame) if roi else frame for frame in frames for roi in rois]
+        detections = _detector.detect_batch(crops)
+        for i, frame in enumerate(frames):
+            for lane, roi in enumerate(rois):
+                boxes, scores, lane_class_ids = detections[i * len(rois) + lane]
+                if roi:
+                    boxes, scores, lane_class_ids = roi.filter(frame.shape, boxes, scores, lane_class_ids)
+                per_class = (np.asarray(lane_class_ids)[:, None] == class_ids).sum(axis=0)
+                rows.append([video_index, lane + 1, frame_number + i, round((frame_number + i) / fps, 3) if fps
+                             else 0.0, int(per_class.sum())] + per_class.tolist())
+        frame_number += len(frames)
+        frames_read += len(frames)
+
+    cap.release()
+    return index, frames_read, rows
+
+
+class CsvWriter:
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """One row group per segment, needs pyarrow"""
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.schema = pa.schema([('video', pa.string()), ('lane', pa.int32()), ('frame', pa.int64()),
+                                 ('time', pa.float64())] + [(name, pa.int32()) for name in COLUMNS[4:]])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        if rows:
+            self.writer.write_table(self.pa.Table.from_pylist([dict(zip(COLUMNS, row)) for row in rows],
+                                                              schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(path):
+    """CSV writer, or Parquet for a .parquet path"""
+    return ParquetWriter(path) if path.endswith('.parquet') else CsvWriter(path)
+
+
+def analyze_videos(videos, output_path, model_path, rois=None, workers=None, segment_frames=600, batch_size=4,
+                   session_options=None, progress_interval=5.0):
+    """
+    Count the vehicles of recorded lane videos with a pool of worker processes
+
+    Every video is split into segments of segment_frames frames that the workers
+    process in any order with their own detector, seeking straight to the first
+    frame of their segment. The rows are written in video, frame and lane order as
+    soon as the segments before them are done, so the output is the same for any
+    number of workers, and workers=1 is the sequential run (in this process).
+
+    Args:
+    videos (list): Local video files
+    output_path (str): CSV file, or Parquet when it ends with .parquet
+    model_path (str): YOLOv8 ONNX model
+    rois (list): Lane polygons of each video (see LaneROI), None for one lane per video covering the frame
+    workers (int): Worker processes, one per CPU core if None
+    segment_frames (int): Frames per task
+    batch_size (int): Frames per detect_batch call
+    session_options (dict): SessionConfig options of the workers, the CPU cores are split between them by default
+    progress_interval (float): Seconds between two progress reports
+
+    Returns:
+    dict: frames, rows, elapsed seconds, frames per second and the vehicle total of every video and lane
+    """
+    rois = rois or [None] * len(videos)
+    tasks = []
+    total_frames = 0
+    for video_index, path in enumerate(videos):
+        polygons = rois[video_index] or [None]
+        segments, frame_count = split_video(path, segment_frames)
+        first = len(tasks)
+        tasks.extend((first + i, video_index, path, start, end, polygons, batch_size)
+                     for i, (start, end) in enumerate(segments))
+        total_frames += frame_count
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    session_options = dict(session_options or {})
+    session_options.setdefault('intra_op_threads', max(1, (os.cpu_count() or 1) // workers))
+
+    writer = open_writer(output_path)
+    pool = None
+    if workers == 1:
+        init_worker(model_path, session_options)
+        results = map(analyze_segment, tasks)
+    else:
+        pool = mp.Pool(workers, initializer=init_worker, initargs=(model_path, session_options))
+        results = pool.imap_unordered(analyze_segment, tasks)
+
+    # Segments finishing early wait here until the ones before them are written
+    pending = {}
+    next_index = 0
+    frames = 0
+    num_rows = 0
+    totals = {}
+    start_time = time.perf_counter()
+    last_report = start_time
+    try:
+        for index, frames_read, rows in results:
+            pending[index] = rows
+            frames += frames_read
+            while next_index in pending:
+                rows = pending.pop(next_index)
+                for row in rows:
+                    row[0] = videos[row[0]]
+                    key = (row[0], row[1])
+                    totals[key] = totals.get(key, 0) + row[4]
+                writer.write(rows)
+                num_rows += len(rows)
+                next_index += 1
+
+            now = time.perf_counter()
+            if now - last_report >= progress_interval:
+                fps = frames / (now - start_time)
+                remaining = (total_frames - frames) / fps if fps and total_frames > frames else 0
+                print(f"{next_index}/{len(tasks)} segments written, {frames}/{total_frames} frames, "
+                      f"{fps:.1f} frames/s, about {remaining:.0f} s left")
+                last_report = now
+    except BaseException:
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        writer.close()
+    if pool:
+        pool.close()
+        pool.join()
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        'frames': frames,
+        'rows': num_rows,
+        'elapsed': elapsed,
+        'fps': frames / elapsed if elapsed else 0.0,
+        'totals': totals,
+    }
@@ -0,0 +1,99 @@
+# utils/control_flags.py
+import threading
+import time
+
+from .metrics import REGISTRY
+
+DEFAULT_FLAGS = {'isAuto': True, 'needSync': False}
+
+
+class ControlFlags:
+    """
+    Local mirror of an intersection's control flags (isAuto, needSync)
+
+    Reads are plain memory lookups. The mirror is kept current either by
+    Firebase listeners (pushed changes) or, when the reference cannot listen,
+    by a background thread that refreshes it every ttl seconds. Listeners only
+    call back on changes, so the thread also refreshes every keepalive seconds
+    to confirm the mirror is still current.
+    """
+
+    def __init__(self, intersection_ref, ttl=1.0, use_listener=True, keepalive=30.0, metrics=None):
+        """
+        Args:
+        intersection_ref: Reference to intersections/<intersection_id>
+        ttl (float): Refresh period of the polling mode, in seconds
+        use_listener (bool): Use ref.listen() when the reference supports it
+        keepalive (float): Refresh period, in seconds, while listening
+        metrics (MetricsRegistry): Where the round trips are recorded, the default registry if None
+        """
+        self.ref = intersection_ref
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        self.values = dict(DEFAULT_FLAGS)
+        self.last_refresh = None
+        self.sync_requested = False
+
+        self.listeners = []
+        self.stop_event = threading.Event()
+
+        # Populate the mirror once before the first read
+        self.refresh()
+
+        self.interval = ttl
+        if use_listener and hasattr(self.ref, 'listen'):
+            for flag in DEFAULT_FLAGS:
+                self.listeners.append(self.ref.child(flag).listen(
+                    lambda event, flag=flag: self._set(flag, event.data)))
+            self.interval = keepalive
+        self.thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self.thread.start()
+
+    def refresh(self):
+        """Read the flags from the database now"""
+        try:
+            for flag in DEFAULT_FLAGS:
+                with self.metrics.timer('firebase_round_trip_seconds', operation='get'):
+                    value = self.ref.child(flag).get()
+                self._set(flag, value)
+        except Exception as e:
+            print(f"Error refreshing control flags: {e}")
+            self.metrics.inc('firebase_errors_total', operation='get')
+
+    def _refresh_loop(self):
+        while not self.stop_event.wait(self.interval):
+            self.refresh()
+
+    def _set(self, flag, value):
+        if value is None:
+            value = DEFAULT_FLAGS[flag]
+
+        with self.lock:
+            # A sync request is the False -> True edge of needSync
+            if flag == 'needSync' and value and not self.values['needSync']:
+                self.sync_requested = True
+            self.values[flag] = value
+            self.last_refresh = time.monotonic()
+
+    def get(self, flag):
+        return self.values[flag]
+
+    def consume_sync_request(self):
+        """Return True once for every needSync request"""
+        with self.lock:
+            requested, self.sync_requested = self.sync_requested, False
+        return requested
+
+    def get_staleness(self):
+        """Seconds since the mirror was last confirmed by the database (a listener event or a refresh)"""
+        if self.last_refresh is None:
+            return float('inf')
+        return time.monotonic() - self.last_refresh
+
+    def close(self):
+        self.stop_event.set()
+        for listener in self.listeners:
+            listener.close()
+        self.thread.join(timeout=1)
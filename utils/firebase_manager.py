@@ -2,17 +2,42 @@
 from firebase_admin import credentials, initialize_app, db
 import time
 
+from .control_flags import ControlFlags
+from .firebase_publisher import FirebasePublisher
+from .metrics import REGISTRY
+
 
 class FirebaseManager:
-    def __init__(self, credential_path):
-        # Initialize Firebase
-        cred = credentials.Certificate(credential_path)
-        initialize_app(cred, {
-            'databaseURL': 'https://smart-traffic-light-03-default-rtdb.asia-southeast1.firebasedatabase.app'
-        })
-        self.ref = db.reference('traffic_system')
+    def __init__(self, credential_path=None, ref=None, write_behind=True, flush_interval=0.5, flags_ttl=1.0,
+                 metrics=None):
+        """
+        Args:
+        credential_path (str): Firebase service account file
+        ref: Use this reference (for example a MemoryReference) instead of connecting to Firebase
+        write_behind (bool): Batch lane updates and send them from a background thread
+        flush_interval (float): Seconds between two batched updates
+        flags_ttl (float): Refresh period of the control flags when they cannot be listened to
+        metrics (MetricsRegistry): Where the Firebase round trips are recorded, the default registry if None
+        """
+        self.metrics = metrics if metrics is not None else REGISTRY
+        if ref is None:
+            # Initialize Firebase
+            cred = credentials.Certificate(credential_path)
+            initialize_app(cred, {
+                'databaseURL': 'https://smart-traffic-light-03-default-rtdb.asia-southeast1.firebasedatabase.app'
+            })
+            ref = db.reference('traffic_system')
+        self.ref = ref
+        self.flags_ttl = flags_ttl
+        self.control_flags = {}
         self._setup_initial_data()
 
+        # Lane updates are coalesced and sent as one multi-path update per flush
+        self.publisher = None
+        if write_behind:
+            self.publisher = FirebasePublisher(self.ref, flush_interval=flush_interval,
+                                               group_filter=self.is_auto_mode, metrics=self.metrics)
+
     def _setup_initial_data(self):
         """Initialize default data structure in Firebase"""
         default_data = {
@@ -35,28 +60,71 @@ class FirebaseManager:
         if not self.ref.get():
             self.ref.set(default_data)
 
+    def get_control_flags(self, intersection_id):
+        """Local mirror of the intersection's isAuto/needSync flags, created on first use"""
+        flags = self.control_flags.get(intersection_id)
+        if flags is None:
+            flags = ControlFlags(self.ref.child(f'intersections/{intersection_id}'), ttl=self.flags_ttl,
+                                 metrics=self.metrics)
+            self.control_flags[intersection_id] = flags
+        return flags
+
     def is_auto_mode(self, intersection_id):
         """Check if intersection is in auto mode"""
-        return self.ref.child(f'intersections/{intersection_id}/isAuto').get()
+        return self.get_control_flags(intersection_id).get('isAuto')
 
     def is_need_sync(self, intersection_id):
-        return self.ref.child(f'intersections/{intersection_id}/needSync').get()
+        return self.get_control_flags(intersection_id).get('needSync')
+
+    def consume_need_sync(self, intersection_id):
+        """Return True once per needSync request, the flag itself is left to the client that set it"""
+        return self.get_control_flags(intersection_id).consume_sync_request()
+
+    def get_flags_staleness(self, intersection_id):
+        """Seconds since the control flags of the intersection were confirmed by Firebase"""
+        return self.get_control_flags(intersection_id).get_staleness()
 
     def update_lane_status(self, intersection_id, lane_id, status_data):
         """Update lane status in Firebase based on auto mode"""
-        lane_ref = self.ref.child(f'intersections/{intersection_id}/lanes/{str(lane_id)}')
+        lane_path = f'intersections/{intersection_id}/lanes/{str(lane_id)}'
+
+        # Create a new dict excluding vehicle_count and last_update
+        auto_status = {k: v for k, v in status_data.items()
+                       if k not in ['vehicle_count', 'last_update']}
+
+        if self.publisher:
+            # Always update vehicle count regardless of auto mode
+            if 'vehicle_count' in status_data:
+                self.publisher.write({
+                    f'{lane_path}/vehicle_count': status_data['vehicle_count'],
+                    f'{lane_path}/last_update': status_data['last_update']
+                })
+
+            # Other status data is only sent if the intersection is in auto mode at flush time
+            if auto_status:
+                self.publisher.write({f'{lane_path}/{k}': v for k, v in auto_status.items()},
+                                     group=intersection_id)
+            return
+
+        lane_ref = self.ref.child(lane_path)
 
         # Always update vehicle count regardless of auto mode
         if 'vehicle_count' in status_data:
-            lane_ref.update({
-                'vehicle_count': status_data['vehicle_count'],
-                'last_update': status_data['last_update']
-            })
+            with self.metrics.timer('firebase_round_trip_seconds', operation='update'):
+                lane_ref.update({
+                    'vehicle_count': status_data['vehicle_count'],
+                    'last_update': status_data['last_update']
+                })
 
         # Update other status data only if in auto mode
         if self.is_auto_mode(intersection_id):
-            # Create a new dict excluding vehicle_count and last_update
-            auto_status = {k: v for k, v in status_data.items()
-                           if k not in ['vehicle_count', 'last_update']}
             if auto_status:  # Only update if there are other fields to update
-                lane_ref.update(auto_status)
\ No newline at end of file
+                with self.metrics.timer('firebase_round_trip_seconds', operation='update'):
+                    lane_ref.update(auto_status)
+
+    def close(self):
+        """Send the pending lane updates and stop the background publisher"""
+        if self.publisher:
+            self.publisher.close()
+        for flags in self.control_flags.values():
+            flags.close()
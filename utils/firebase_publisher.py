@@ -0,0 +1,120 @@
+# utils/firebase_publisher.py
+import threading
+import time
+
+from .metrics import REGISTRY
+
+
+class FirebasePublisher:
+    """
+    Write-behind publisher for a Firebase RTDB reference
+
+    Writes are collected in memory and sent from a background thread as a single
+    multi-path update() every flush_interval seconds. Writing the same path twice
+    before a flush only sends the last value, so what is pending stays bounded
+    by the number of distinct paths however slow the network is. write() never
+    blocks on the network.
+    """
+
+    def __init__(self, ref, flush_interval=0.5, group_filter=None, metrics=None):
+        """
+        Args:
+        ref: Firebase reference (or MemoryReference) the paths are relative to
+        flush_interval (float): Seconds between two flushes
+        group_filter (callable): Called with a group name at flush time, the group's
+                                 writes are only sent when it returns True
+        metrics (MetricsRegistry): Where the round trips are recorded, the default registry if None
+        """
+        self.ref = ref
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.flush_interval = flush_interval
+        self.group_filter = group_filter
+
+        # group -> {path: value}, writes without a group are stored under None
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+        # Statistics
+        self.writes = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.paths_sent = 0
+        self.last_flush_latency = 0.0
+
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.thread.start()
+
+    def write(self, updates, group=None):
+        """
+        Queue updates ({path: value}) to be sent with the next flush
+
+        Args:
+        updates (dict): Paths relative to the reference and their new values
+        group (str): Optional group name checked with group_filter at flush time
+        """
+        with self.lock:
+            group_updates = self.pending.setdefault(group, {})
+            for path, value in updates.items():
+                if path in group_updates:
+                    self.coalesced += 1
+                group_updates[path] = value
+            self.writes += len(updates)
+
+    def flush(self):
+        """Send everything that is pending now as one multi-path update"""
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+
+            updates = {}
+            for group, group_updates in pending.items():
+                if group is None or self.group_filter is None or self.group_filter(group):
+                    updates.update(group_updates)
+
+            if not updates:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                self.ref.update(updates)
+            except Exception as e:
+                print(f"Error publishing to Firebase: {e}")
+                self.metrics.inc('firebase_errors_total', operation='update')
+                # Keep the values for the next flush unless they were overwritten meanwhile
+                with self.lock:
+                    for group, group_updates in pending.items():
+                        newer = self.pending.setdefault(group, {})
+                        for path, value in group_updates.items():
+                            newer.setdefault(path, value)
+                return 0
+            self.last_flush_latency = time.perf_counter() - start
+            self.metrics.observe('firebase_round_trip_seconds', self.last_flush_latency, operation='update')
+            self.metrics.set('firebase_paths_per_update', len(updates))
+            self.flushes += 1
+            self.paths_sent += len(updates)
+            return len(updates)
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def _pending_count(self):
+        return sum(len(group_updates) for group_updates in self.pending.values())
+
+    def get_stats(self):
+        return {
+            'writes': self.writes,
+            'coalesced': self.coalesced,
+            'flushes': self.flushes,
+            'paths_sent': self.paths_sent,
+            'pending': self._pending_count(),
+            'last_flush_latency': self.last_flush_latency,
+        }
+
+    def close(self):
+        """Stop the background thread and send what is left"""
+        self.stop_event.set()
+        self.thread.join(timeout=max(1.0, self.flush_interval * 2))
+        self.flush()
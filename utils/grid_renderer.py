@@ -0,0 +1,54 @@
+# utils/grid_renderer.py
+import cv2
+import numpy as np
+
+from yolov8.utils import draw_detections_inplace
+
+
+class GridRenderer:
+    """
+    Draw the lanes of an intersection into one preallocated grid canvas
+
+    Each lane is written into its tile through a view of the canvas and the
+    detections are drawn on top in place, so rendering a tick allocates no
+    full-frame arrays and its cost depends on the number of detections.
+    """
+
+    def __init__(self, tile_width, tile_height, num_lanes=4, cols=2, mask_alpha=0.4):
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.mask_alpha = mask_alpha
+
+        rows = -(-num_lanes // cols)
+        self.canvas = np.zeros((rows * tile_height, cols * tile_width, 3), dtype=np.uint8)
+        self.tiles = [self.canvas[row * tile_height:(row + 1) * tile_height,
+                                  col * tile_width:(col + 1) * tile_width]
+                      for row in range(rows) for col in range(cols)][:num_lanes]
+
+    def draw_frame(self, index, frame):
+        """Copy (and resize if needed) a lane frame into its tile, returns the tile view"""
+        tile = self.tiles[index]
+        if frame.shape[:2] == tile.shape[:2]:
+            np.copyto(tile, frame)
+        else:
+            cv2.resize(frame, (self.tile_width, self.tile_height), dst=tile)
+        return tile
+
+    def draw_lane(self, index, frame, boxes, scores, class_ids):
+        """Draw a lane frame and its detections into its tile, returns the tile view"""
+        tile = self.draw_frame(index, frame)
+
+        if len(boxes):
+            # Boxes are in frame coordinates, map them to the tile
+            img_height, img_width = frame.shape[:2]
+            scale = np.array([self.tile_width / img_width, self.tile_height / img_height] * 2, dtype=np.float32)
+            draw_detections_inplace(tile, np.asarray(boxes) * scale, scores, class_ids, self.mask_alpha)
+
+        return tile
+
+    def draw_polygon(self, index, points, frame_shape, color=(0, 255, 255), thickness=2):
+        """Draw a polygon given in frame pixel coordinates onto a lane tile"""
+        img_height, img_width = frame_shape[:2]
+        scale = (self.tile_width / img_width, self.tile_height / img_height)
+        points = np.round(points * scale).astype(np.int32)
+        cv2.polylines(self.tiles[index], [points], True, color, thickness)
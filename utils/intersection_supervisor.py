@@ -0,0 +1,297 @@
+# utils/intersection_supervisor.py
+import json
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+
+MAX_RESTART_DELAY = 30
+
+
+def load_config(config_path):
+    """
+    Load a multi-intersection config file
+
+    Example:
+    {
+        "model_path": "models/yolov8m.onnx",
+        "firebase_credentials": null,
+        "shared_inference": true,
+        "max_batch_size": 8,
+        "max_batch_delay": 0.01,
+        "metrics_port": 9100,
+        "target_fps": 10,
+        "resolution": 480,
+        "policy": "max_pressure",
+        "policy_options": {"budget": 0.002},
+        "store_path": "history/lanes.sqlite",
+        "motion_gate": {"refresh_interval": 30},
+        "tracking": {"max_age": 15},
+        "detect_every": 3,
+        "session": {"intra_op_threads": 4, "optimization_level": "all",
+                    "optimized_model_dir": "models/optimized", "io_binding": true},
+        "intersections": [
+            {"id": "main_intersection", "video_urls": ["...", "...", "...", "..."]},
+            {"id": "second_intersection", "video_urls": ["...", "..."], "lane_rois": [null, null],
+             "stop_lines": [[[0.0, 0.8], [1.0, 0.8]], null]},
+            {"id": "six_way", "video_urls": ["...", "...", "...", "...", "...", "..."],
+             "phase_groups": [[1, 4], [2, 5], [3, 6]], "policy_options": {"horizon": 40}}
+        ]
+    }
+    """
+    with open(config_path) as f:
+        config = json.load(f)
+
+    ids = [intersection['id'] for intersection in config['intersections']]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Intersection ids must be unique")
+    return config
+
+
+def assign_intersections(intersections, num_workers):
+    """Spread the intersections over the workers, round robin"""
+    assignments = [[] for _ in range(num_workers)]
+    for i, intersection in enumerate(intersections):
+        assignments[i % num_workers].append(intersection)
+    return assignments
+
+
+def run_monitor_loop(monitor, stop_event, errors):
+    """Monitoring loop of one intersection thread, an exception stops the monitor and is added to errors"""
+    try:
+        while monitor.is_running() and not stop_event.is_set():
+            if not monitor.step():
+                # No new frame on any lane yet
+                time.sleep(0.001)
+    except Exception as e:
+        errors.append((monitor.intersection_id, e))
+        monitor.stopped = True
+
+
+def run_worker(worker_id, num_workers, config, intersections, stats_queue, stats_interval):
+    """
+    Worker process: one detector and one Firebase connection shared by all its intersections
+
+    An intersection that fails makes the whole worker fail, so the supervisor restarts it.
+    """
+    # Imported here so the supervisor process never loads a model
+    from yolov8 import YOLOv8, InferenceServer, SessionConfig
+    from .firebase_manager import FirebaseManager
+    from .traffic_monitor import TrafficMonitor, VEHICLE_CLASSES
+    from .metrics import REGISTRY, MetricsServer
+    from .scheduling_policy import make_policy
+    from .timeseries_store import TimeSeriesStore
+
+    # Every worker serves its own metrics, on metrics_port + worker id
+    metrics_server = None
+    if config.get('metrics_port') is not None:
+        metrics_server = MetricsServer(REGISTRY, port=config['metrics_port'] + worker_id)
+
+    # The cores are split between the workers unless the config sets the threads
+    session_options = dict(config.get('session', {}))
+    session_options.setdefault('intra_op_threads', max(1, (os.cpu_count() or 1) // num_workers))
+    session_config = SessionConfig(**session_options)
+    detector = YOLOv8(config['model_path'], conf_thres=0.5, iou_thres=0.5, classes=VEHICLE_CLASSES.keys(),
+                      session_config=session_config, metrics=REGISTRY)
+    firebase_manager = None
+    if config.get('firebase_credentials'):
+        firebase_manager = FirebaseManager(config['firebase_credentials'])
+    # All workers append to the same SQLite file, WAL mode serializes their batched writes
+    store = TimeSeriesStore(config['store_path']) if config.get('store_path') else None
+
+    # With shared inference every intersection runs on its own thread and the
+    # server merges their frames into micro-batches for the single session
+    server = None
+    if config.get('shared_inference', True):
+        server = InferenceServer(detector, max_batch_size=config.get('max_batch_size', 8),
+                                 max_delay=config.get('max_batch_delay', 0.01))
+
+    monitors = [TrafficMonitor(intersection['video_urls'], config['model_path'], headless=True,
+                               lane_rois=intersection.get('lane_rois'), intersection_id=intersection['id'],
+                               detector=server.connect(intersection['id']) if server else detector,
+                               firebase_manager=firebase_manager, target_fps=config.get('target_fps'),
+                               resolution=config.get('resolution', 720),
+                               phase_groups=intersection.get('phase_groups'),
+                               policy=make_policy(intersection.get('policy', config.get('policy')),
+                                                  **intersection.get('policy_options',
+                                                                     config.get('policy_options', {}))),
+                               store=store,
+                               motion_gate=intersection.get('motion_gate', config.get('motion_gate')),
+                               tracking=intersection.get('tracking', config.get('tracking')),
+                               detect_every=intersection.get('detect_every', config.get('detect_every', 1)),
+                               stop_lines=intersection.get('stop_lines'))
+                for intersection in intersections]
+
+    stop_event = threading.Event()
+    threads = []
+    errors = []
+    try:
+        for monitor in monitors:
+            monitor.start()
+
+        if server:
+            threads = [threading.Thread(target=run_monitor_loop, args=(monitor, stop_event, errors), daemon=True)
+                       for monitor in monitors]
+            for thread in threads:
+                thread.start()
+
+        last_report = time.perf_counter()
+        while any(monitor.is_running() for monitor in monitors) and not errors:
+            if server:
+                time.sleep(0.05)
+            else:
+                processed = False
+                for monitor in monitors:
+                    if monitor.is_running() and monitor.step():
+                        processed = True
+                if not processed:
+                    # No new frame on any intersection yet
+                    time.sleep(0.001)
+
+            if time.perf_counter() - last_report >= stats_interval:
+                for monitor in monitors:
+                    stats_queue.put({'worker': worker_id, 'intersection_id': monitor.intersection_id,
+                                     **monitor.stats.summary()})
+                    monitor.stats.reset()
+                if server:
+                    stats_queue.put({'worker': worker_id, 'inference': server.get_stats()})
+                last_report = time.perf_counter()
+
+        if errors:
+            intersection_id, error = errors[0]
+            raise RuntimeError(f"Intersection {intersection_id} failed") from error
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        for thread in threads:
+            thread.join(timeout=5)
+        for monitor in monitors:
+            monitor.stop()
+        if server:
+            server.close()
+        if firebase_manager:
+            firebase_manager.close()
+        if store:
+            store.close()
+        if metrics_server:
+            metrics_server.close()
+
+
+class IntersectionSupervisor:
+    """
+    Run many intersections from one config on a pool of worker processes
+
+    The pool scales with the number of cores. Each worker loads the model once
+    and runs several intersections, crashed workers are restarted with an
+    exponential backoff and every worker reports per-intersection throughput.
+    """
+
+    def __init__(self, config, num_workers=None, stats_interval=10.0, max_restarts=5):
+        self.config = config
+        intersections = config['intersections']
+        self.num_workers = max(1, min(len(intersections), num_workers or os.cpu_count() or 1))
+        self.assignments = assign_intersections(intersections, self.num_workers)
+        self.stats_interval = stats_interval
+        self.max_restarts = max_restarts
+
+        self.stats_queue = mp.Queue()
+        self.processes = [None] * self.num_workers
+        self.restarts = [0] * self.num_workers
+        self.restart_at = [None] * self.num_workers
+        self.finished = [False] * self.num_workers
+
+        # intersection id -> latest throughput report
+        self.throughput = {}
+        # worker id -> latest inference server report
+        self.inference_stats = {}
+
+    def start_worker(self, worker_id):
+        process = mp.Process(target=run_worker, name=f"intersection-worker-{worker_id}",
+                             args=(worker_id, self.num_workers, self.config, self.assignments[worker_id],
+                                   self.stats_queue, self.stats_interval),
+                             daemon=True)
+        process.start()
+        self.processes[worker_id] = process
+        self.restart_at[worker_id] = None
+
+    def check_workers(self):
+        """Restart crashed workers, returns False once every worker is done for good"""
+        now = time.monotonic()
+        active = False
+        for worker_id, process in enumerate(self.processes):
+            if self.finished[worker_id]:
+                continue
+            active = True
+
+            if self.restart_at[worker_id] is not None:
+                if now >= self.restart_at[worker_id]:
+                    print(f"Restarting worker {worker_id} (restart {self.restarts[worker_id]})")
+                    self.start_worker(worker_id)
+                continue
+
+            if process.is_alive():
+                continue
+
+            if process.exitcode == 0 or self.restarts[worker_id] >= self.max_restarts:
+                print(f"Worker {worker_id} stopped with exit code {process.exitcode}")
+                self.finished[worker_id] = True
+                continue
+
+            # Crashed: restart after a backoff
+            self.restarts[worker_id] += 1
+            delay = min(2 ** self.restarts[worker_id], MAX_RESTART_DELAY)
+            print(f"Worker {worker_id} crashed with exit code {process.exitcode}, restarting in {delay}s")
+            self.restart_at[worker_id] = now + delay
+        return active
+
+    def collect_stats(self, timeout=1.0):
+        try:
+            stats = self.stats_queue.get(timeout=timeout)
+        except queue.Empty:
+            return False
+
+        while True:
+            if 'inference' in stats:
+                self.inference_stats[stats['worker']] = stats['inference']
+            else:
+                self.throughput[stats['intersection_id']] = stats
+            try:
+                stats = self.stats_queue.get_nowait()
+            except queue.Empty:
+                return True
+
+    def report(self):
+        total_fps = 0.0
+        for intersection_id, stats in sorted(self.throughput.items()):
+            total_fps += stats['fps']
+            print(f"[worker {stats['worker']}] {intersection_id}: {stats['fps']:.1f} FPS, "
+                  f"CPU {stats['cpu_percent']:.0f}%")
+        for worker_id, stats in sorted(self.inference_stats.items()):
+            print(f"[worker {worker_id}] inference: queue depth {stats['queue_depth']} "
+                  f"(max {stats['max_queue_depth']}), mean batch {stats['mean_batch_size']:.1f}, "
+                  f"{stats['mean_inference_ms']:.1f} ms per batch, wait " +
+                  ", ".join(f"{name} {client['mean_wait_ms']:.1f} ms" for name, client in stats['clients'].items()))
+        print(f"Total: {total_fps:.1f} FPS over {len(self.throughput)} intersections, "
+              f"{self.num_workers} workers, {sum(self.restarts)} restarts")
+
+    def run(self):
+        print(f"Running {len(self.config['intersections'])} intersections on {self.num_workers} workers")
+        for worker_id in range(self.num_workers):
+            self.start_worker(worker_id)
+
+        try:
+            while self.check_workers():
+                if self.collect_stats():
+                    self.report()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+                process.join(timeout=5)
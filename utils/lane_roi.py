@@ -0,0 +1,76 @@
+# utils/lane_roi.py
+import cv2
+import numpy as np
+
+
+class LaneROI:
+    """
+    Region of a camera frame that belongs to a lane
+
+    Detection runs on the bounding crop of the polygon only, so the model input
+    is spent on the road instead of the sky and sidewalks, and detections whose
+    bottom-center point (where the vehicle touches the road) falls outside the
+    polygon are dropped before counting.
+    """
+
+    def __init__(self, polygon):
+        """
+        Args:
+        polygon (list): (x, y) points normalized to 0..1 of the frame width and height
+        """
+        self.polygon = np.array(polygon, dtype=np.float32).reshape(-1, 2)
+        if len(self.polygon) < 3:
+            raise ValueError("A lane ROI polygon needs at least 3 points")
+
+        # (img_height, img_width) -> (x, y, width, height, mask)
+        self.cache = {}
+
+    def get_geometry(self, img_height, img_width):
+        """Bounding rectangle and polygon mask for a frame size, computed once per resolution"""
+        geometry = self.cache.get((img_height, img_width))
+        if geometry is None:
+            points = self.get_points(img_width, img_height)
+            x, y, width, height = cv2.boundingRect(points)
+            x, y = max(x, 0), max(y, 0)
+            width, height = min(width, img_width - x), min(height, img_height - y)
+
+            # Mask of the polygon inside the crop
+            mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.fillPoly(mask, [points - (x, y)], 1)
+
+            geometry = (x, y, width, height, mask.astype(bool))
+            self.cache[(img_height, img_width)] = geometry
+        return geometry
+
+    def get_points(self, img_width, img_height):
+        """Polygon in pixel coordinates of a frame of the given size"""
+        return np.round(self.polygon * (img_width, img_height)).astype(np.int32)
+
+    def crop(self, frame):
+        """View of the frame cropped to the polygon's bounding rectangle (no copy)"""
+        x, y, width, height, _ = self.get_geometry(*frame.shape[:2])
+        return frame[y:y + height, x:x + width]
+
+    def filter(self, frame_shape, boxes, scores, class_ids):
+        """
+        Map detections from crop to frame coordinates and drop the ones outside the polygon
+
+        Args:
+        frame_shape (tuple): Shape of the full frame the crop was taken from
+        boxes, scores, class_ids: Detections on the crop
+
+        Returns:
+        tuple: (boxes, scores, class_ids) in frame coordinates
+        """
+        if len(scores) == 0:
+            return boxes, scores, class_ids
+
+        x, y, width, height, mask = self.get_geometry(*frame_shape[:2])
+
+        # Bottom-center point of each box, in crop coordinates
+        anchor_x = np.clip(((boxes[:, 0] + boxes[:, 2]) / 2).astype(int), 0, width - 1)
+        anchor_y = np.clip(boxes[:, 3].astype(int), 0, height - 1)
+        inside = mask[anchor_y, anchor_x]
+
+        boxes = boxes[inside] + np.array([x, y, x, y], dtype=boxes.dtype)
+        return boxes, scores[inside], class_ids[inside]
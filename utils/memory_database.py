@@ -0,0 +1,75 @@
+# utils/memory_database.py
+import copy
+import threading
+import time
+
+
+class MemoryReference:
+    """
+    In-memory stand-in for a firebase_admin.db.Reference
+
+    Supports the calls used by this project (child, get, set, update with
+    multi-path keys) so the Firebase code can run and be measured offline.
+    An artificial latency can be added to every call to mimic network round trips.
+    """
+
+    def __init__(self, path='', latency=0.0, _root=None):
+        self.path = path.strip('/')
+        self.latency = latency
+        self._root = _root if _root is not None else {'data': None, 'lock': threading.Lock(), 'round_trips': 0}
+
+    @property
+    def round_trips(self):
+        return self._root['round_trips']
+
+    def child(self, path):
+        return MemoryReference(f'{self.path}/{path}' if self.path else path, self.latency, self._root)
+
+    def get(self):
+        self._round_trip()
+        with self._root['lock']:
+            node = self._root['data']
+            for key in self._keys(self.path):
+                if not isinstance(node, dict) or key not in node:
+                    return None
+                node = node[key]
+            return copy.deepcopy(node)
+
+    def set(self, value):
+        self._round_trip()
+        with self._root['lock']:
+            self._set(self._keys(self.path), copy.deepcopy(value))
+
+    def update(self, value):
+        """Update children of this node, keys may be paths such as 'lanes/1/vehicle_count'"""
+        self._round_trip()
+        with self._root['lock']:
+            for path, child_value in value.items():
+                self._set(self._keys(self.path) + self._keys(path), copy.deepcopy(child_value))
+
+    def _round_trip(self):
+        self._root['round_trips'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _set(self, keys, value):
+        if not keys:
+            self._root['data'] = value
+            return
+
+        if not isinstance(self._root['data'], dict):
+            self._root['data'] = {}
+        node = self._root['data']
+        for key in keys[:-1]:
+            if not isinstance(node.get(key), dict):
+                node[key] = {}
+            node = node[key]
+
+        if value is None:
+            node.pop(keys[-1], None)
+        else:
+            node[keys[-1]] = value
+
+    @staticmethod
+    def _keys(path):
+        return [key for key in str(path).split('/') if key]
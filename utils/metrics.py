@@ -0,0 +1,326 @@
+# utils/metrics.py
+import bisect
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, observing is a bisect and two additions"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate of the q quantile, interpolated inside its bucket"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self):
+        return {'count': self.count, 'sum': self.sum,
+                'mean': self.sum / self.count if self.count else 0.0,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99)}
+
+
+class Timer:
+    """Context manager observing the time spent in its block"""
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and latency histograms keyed by name and labels
+
+    Metrics are created on first use, e.g.
+        metrics.observe('stage_seconds', 0.012, stage='capture', intersection='main_intersection')
+    and exported in the Prometheus text format or as JSON. Disabling the
+    registry turns every call into a no-op.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.descriptions = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def describe(self, name, description):
+        self.descriptions[name] = description
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        """with metrics.timer('stage_seconds', stage='detection'): ..."""
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name, labels)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        self.gauges[self._key(name, labels)] = value
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        labels = list(labels) + list(extra)
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+    def to_prometheus(self):
+        """Prometheus text exposition format"""
+        with self.lock:
+            histograms = {key: (list(h.counts), h.count, h.sum, h.buckets) for key, h in self.histograms.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+
+        lines = []
+        for metrics, metric_type in ((counters, 'counter'), (gauges, 'gauge'), (histograms, 'histogram')):
+            for name in sorted({name for name, _ in metrics}):
+                if name in self.descriptions:
+                    lines.append(f"# HELP {name} {self.descriptions[name]}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for (metric_name, labels), value in sorted(metrics.items()):
+                    if metric_name != name:
+                        continue
+                    if metric_type != 'histogram':
+                        lines.append(f"{name}{self._format_labels(labels)} {value}")
+                        continue
+                    counts, count, total, buckets = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{self._format_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {total}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        """JSON-friendly snapshot, histograms are summarized with estimated percentiles"""
+        def entries(metrics, convert):
+            result = {}
+            for (name, labels), value in sorted(metrics.items()):
+                result.setdefault(name, []).append({'labels': dict(labels), **convert(value)})
+            return result
+
+        with self.lock:
+            return {
+                'counters': entries(self.counters, lambda value: {'value': value}),
+                'gauges': entries(self.gauges, lambda value: {'value': value}),
+                'histograms': entries(self.histograms, lambda histogram: histogram.summary()),
+            }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that can be switched on and off at run time
+
+    A background thread samples the stacks of all other threads every interval
+    seconds. The pipeline is not instrumented, so it costs nothing while stopped.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        # Guards samples and num_samples, written by the sampling thread and read by the HTTP handlers
+        self.lock = threading.Lock()
+        self.samples = Counter()
+        self.num_samples = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._sample_loop, name='sampling-profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+            self.num_samples = 0
+
+    def snapshot(self):
+        """Copy of the sampled stacks and their counts"""
+        with self.lock:
+            return Counter(dict(self.samples))
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks.append(tuple(reversed(stack)))
+            with self.lock:
+                self.samples.update(stacks)
+                self.num_samples += 1
+
+    def collapsed(self):
+        """Stacks in the collapsed format read by flamegraph tools, one 'a;b;c count' per line"""
+        return '\n'.join(f"{';'.join(stack)} {count}" for stack, count in self.snapshot().most_common()) + '\n'
+
+    def top(self, limit=20):
+        """Functions where the sampled threads spent their time, as (function, share of samples)"""
+        leaves = Counter()
+        for stack, count in self.snapshot().items():
+            if stack:
+                leaves[stack[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [(function, count / total) for function, count in leaves.most_common(limit)]
+
+
+class MetricsServer:
+    """
+    Local HTTP endpoint for scraping the metrics and driving the profiler
+
+    GET /metrics          Prometheus text format
+    GET /metrics.json     JSON snapshot
+    GET /profiler/start   start sampling
+    GET /profiler/stop    stop sampling
+    GET /profiler         collapsed stacks sampled so far
+    """
+
+    def __init__(self, registry, port=9100, host='127.0.0.1', profiler=None):
+        self.registry = registry
+        self.profiler = profiler or SamplingProfiler()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True)
+        self.thread.start()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                routes = {
+                    '/metrics': lambda: ('text/plain; version=0.0.4', server.registry.to_prometheus()),
+                    '/metrics.json': lambda: ('application/json', server.registry.to_json()),
+                    '/profiler': lambda: ('text/plain', server.profiler.collapsed()),
+                    '/profiler/start': lambda: ('text/plain', server._profiler_command(server.profiler.start)),
+                    '/profiler/stop': lambda: ('text/plain', server._profiler_command(server.profiler.stop)),
+                }
+                route = routes.get(self.path.split('?')[0])
+                if route is None:
+                    self.send_error(404)
+                    return
+                content_type, body = route()
+                body = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes are not logged
+                pass
+
+        return Handler
+
+    def _profiler_command(self, command):
+        command()
+        return f"profiler running: {self.profiler.running}, {self.profiler.num_samples} samples\n"
+
+    def close(self):
+        self.profiler.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Registry used by the pipeline unless another one is passed in
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,87 @@
+# utils/motion_gate.py
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Skips detection on a lane whose frame has not changed since its last detection
+
+    The frame is shrunk to a small grayscale thumbnail (the area averaging also
+    smooths out sensor and compression noise) and compared with the thumbnail
+    of the frame the cached detections come from. The lane needs detection again
+    when enough thumbnail pixels changed by more than pixel_threshold gray levels,
+    and at least every refresh_interval frames whatever the motion, so slow
+    changes (a parked car leaving little by little, light changes) are picked up.
+    Comparing with the last detected frame rather than the previous frame means
+    slow drift adds up until it triggers detection.
+    """
+
+    def __init__(self, refresh_interval=30, pixel_threshold=8, min_changed_fraction=0.002, thumbnail_width=64):
+        """
+        Args:
+        refresh_interval (int): Frames after which detection runs even without motion
+        pixel_threshold (int): Gray level change for a thumbnail pixel to count as changed
+        min_changed_fraction (float): Share of changed thumbnail pixels that means motion
+        thumbnail_width (int): Width of the thumbnail, the height keeps the frame's aspect ratio. Resizing is
+                               fastest when it divides the frame width (64 for 1280 and 1920 px frames)
+        """
+        self.refresh_interval = refresh_interval
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.thumbnail_width = thumbnail_width
+
+        self.reference = None
+        self.thumbnail = None
+        self.detections = None
+        self.frames_since_detection = 0
+
+        # Statistics
+        self.frames = 0
+        self.hits = 0
+        self.forced_refreshes = 0
+        self.time_saved = 0.0
+
+    def make_thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        size = (self.thumbnail_width, max(1, round(self.thumbnail_width * height / width)))
+        thumbnail = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        return thumbnail
+
+    def needs_detection(self, frame):
+        """True when the cached detections can not be reused for this frame, call once per frame"""
+        self.frames += 1
+        self.thumbnail = self.make_thumbnail(frame)
+        if self.detections is None or self.reference.shape != self.thumbnail.shape:
+            return True
+        if self.frames_since_detection + 1 >= self.refresh_interval:
+            self.forced_refreshes += 1
+            return True
+
+        changed = cv2.absdiff(self.thumbnail, self.reference) > self.pixel_threshold
+        if np.count_nonzero(changed) > self.min_changed_fraction * changed.size:
+            return True
+
+        self.hits += 1
+        self.frames_since_detection += 1
+        return False
+
+    def update(self, detections):
+        """Cache the detections of the frame last passed to needs_detection()"""
+        self.detections = detections
+        self.reference = self.thumbnail
+        self.frames_since_detection = 0
+
+    def add_saved_time(self, seconds):
+        self.time_saved += seconds
+
+    def get_stats(self):
+        return {
+            'frames': self.frames,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.frames if self.frames else 0.0,
+            'forced_refreshes': self.forced_refreshes,
+            'time_saved': self.time_saved,
+        }
@@ -0,0 +1,272 @@
+# utils/scheduling_policy.py
+import time
+
+import numpy as np
+
+# Vehicles a lane discharges per second of green (1800 vehicles per hour)
+SATURATION_FLOW = 0.5
+# Largest time step, in seconds, MaxPressurePolicy falls back to when it runs over its CPU budget
+MAX_COARSENING = 8
+
+
+class SchedulingPolicy:
+    """
+    Decides which phase group of a TrafficLightManager gets green next, and for how long
+
+    Subclasses implement choose(manager) and return (phase index, green time, score),
+    the score (the reward, or the predicted delay for MaxPressurePolicy) is exported
+    as the controller_reward metric. decide() times every call.
+    """
+    name = None
+
+    def __init__(self):
+        self.decisions = 0
+        self.decision_seconds = 0.0
+        self.max_decision_seconds = 0.0
+        self.last_decision_seconds = 0.0
+
+    def decide(self, manager):
+        start = time.perf_counter()
+        decision = self.choose(manager)
+        elapsed = self.last_decision_seconds = time.perf_counter() - start
+        self.decisions += 1
+        self.decision_seconds += elapsed
+        self.max_decision_seconds = max(self.max_decision_seconds, elapsed)
+        return decision
+
+    def choose(self, manager):
+        raise NotImplementedError
+
+    def get_stats(self):
+        return {'decisions': self.decisions,
+                'mean_decision_seconds': self.decision_seconds / self.decisions if self.decisions else 0.0,
+                'max_decision_seconds': self.max_decision_seconds}
+
+
+class RewardPolicy(SchedulingPolicy):
+    """
+    Phase groups get green in turn. The green time is the base green time plus
+    the reward of the next group: how far its busiest lane is above the average
+    of all lanes, times the reward multiplier of the manager.
+    """
+    name = 'reward'
+
+    def choose(self, manager):
+        phase = manager.next_phase()
+        next_green = manager.next_green_mask()
+        if not next_green.any():
+            return phase, manager.base_green_time, 0.0
+
+        # Compare the busiest lane of the next group with the average of all lanes
+        avg_other_lanes = manager.total_vehicles.mean()
+        max_reward = float((manager.total_vehicles[next_green].max() - avg_other_lanes) * manager.reward_multiplier)
+
+        # Ensure green time stays within bounds
+        green_time = manager.base_green_time + max_reward
+        green_time = round(min(max(green_time, manager.min_green_time), manager.max_green_time))
+        return phase, green_time, max_reward
+
+
+class MaxPressurePolicy(SchedulingPolicy):
+    """
+    Picks the next phase group and its green time by minimizing the queueing
+    delay predicted over a short horizon (that group, then the best second one).
+    The time steps are coarsened and the candidate groups cut, by decreasing
+    pressure, to keep every decision within budget seconds of computation.
+    """
+    name = 'max_pressure'
+
+    def __init__(self, horizon=None, saturation_flow=SATURATION_FLOW, smoothing=0.3, max_wait=90,
+                 budget=0.002, step=1):
+        """
+        Args:
+        horizon (float): Seconds of lookahead, None sizes it from the arrival rates (see get_horizon)
+        saturation_flow (float): Vehicles per second a green lane discharges
+        smoothing (float): Weight of the newest arrival rate sample, 0..1
+        max_wait (float): Seconds a lane may stay red before its group is forced
+        budget (float): CPU seconds of computation per decision
+        step (int): Seconds between two candidate green times
+        """
+        super().__init__()
+        self.horizon = horizon
+        self.saturation_flow = saturation_flow
+        self.smoothing = smoothing
+        self.max_wait = max_wait
+        self.budget = budget
+        self.step = step
+
+        self.rates = None
+        self.last_green = None
+        self.last_unique = None
+        self.last_time = None
+        self.budget_exceeded = 0
+        # Multiplies the time and green time steps while decisions run over budget
+        self.coarsening = 1
+        # Measured seconds per (green time, time step, lane) cell of the delay precompute
+        self.cell_seconds = None
+
+    def update_rates(self, manager, current_time):
+        """Smoothed arrivals per second of every lane"""
+        if self.rates is None or len(self.rates) != len(manager.lane_ids):
+            self.rates = np.zeros(len(manager.lane_ids))
+            self.last_green = np.full(len(manager.lane_ids), current_time)
+            self.last_time = None
+
+        self.last_green[manager.is_green] = current_time
+        if manager.tracked:
+            # New tracks are arrivals, on green lanes too
+            if self.last_time is not None and current_time > self.last_time:
+                samples = (manager.unique_vehicles - self.last_unique) / (current_time - self.last_time)
+                self.rates += self.smoothing * (samples - self.rates)
+            self.last_unique = manager.unique_vehicles.copy()
+            self.last_time = current_time
+            return
+
+        elapsed = current_time - manager.start_time
+        red = ~manager.is_green & (elapsed > 0)
+        samples = np.maximum(0, manager.total_vehicles[red] - manager.vehicles_at_change[red]) / elapsed[red]
+        self.rates[red] += self.smoothing * (samples - self.rates[red])
+
+    def get_horizon(self, manager):
+        """
+        Lookahead of the two-phase plan
+
+        The plan favors green times of about half the horizon, so the horizon is
+        the share of two groups in Webster's optimal cycle for the current rates,
+        (1.5 * lost time + 5) / (1 - sum of the critical flow ratio of each group).
+        """
+        if self.horizon is not None:
+            return self.horizon
+        masks = manager.phase_masks
+        flow_ratios = np.where(masks, self.rates / self.saturation_flow, 0).max(axis=1).sum()
+        lost_time = len(masks) * manager.clearance_time
+        cycle = (1.5 * lost_time + 5) / max(1 - flow_ratios, 0.05)
+        horizon = 2 * cycle / max(len(masks), 2)
+        return float(np.clip(horizon, 2 * (manager.min_green_time + manager.clearance_time),
+                             2 * (manager.max_green_time + manager.clearance_time)))
+
+    def queue_delay(self, queues, times, resolution, green_start, green_end):
+        """
+        Vehicle seconds each lane queues over the horizon with one green interval
+
+        Args:
+        queues (np.ndarray): (lanes,) vehicles queued now
+        times (np.ndarray): (steps,) seconds from now, one every resolution seconds over the horizon
+        green_start, green_end (np.ndarray): (plans,) green interval of each plan
+
+        Returns:
+        np.ndarray: (plans, lanes)
+        """
+        rates = self.rates
+        arrived = queues + rates * times[:, None]
+        green_start, green_end = green_start[:, None, None], green_end[:, None, None]
+        green_elapsed = np.clip(times[None, :, None] - green_start, 0, green_end - green_start)
+        # Queues still discharging, or regrowing from empty once the green is over
+        queued = np.maximum(arrived - self.saturation_flow * green_elapsed,
+                            rates * np.maximum(times[None, :, None] - green_end, 0))
+        return queued.sum(axis=1) * resolution
+
+    def choose(self, manager):
+        start = time.perf_counter()
+        current_time = manager.clock()
+        self.update_rates(manager, current_time)
+
+        masks = manager.phase_masks
+        if len(masks) == 1:
+            # A single group alternates between green and red, the red is kept short
+            if manager.is_green.any():
+                return 0, manager.min_green_time, 0.0
+            candidates = [0]
+        else:
+            candidates = [phase for phase in range(len(masks)) if phase != manager.phase]
+            starving = current_time - self.last_green > self.max_wait
+            if starving.any():
+                # Serve the lane that has waited longest
+                longest = int(np.argmax(np.where(starving, current_time - self.last_green, -np.inf)))
+                candidates = [phase for phase in candidates if masks[phase, longest]] or candidates
+
+        queues = manager.total_vehicles.astype(np.float64)
+        horizon = self.get_horizon(manager)
+        resolution, steps = self.get_grid(manager, horizon, start)
+        times = np.arange(1, steps + 1, dtype=np.float64) * resolution
+        horizon = float(times[-1])
+        green_times = np.arange(manager.min_green_time, max(manager.min_green_time, manager.max_green_time) + 1,
+                                self.step * resolution, dtype=np.float64)
+
+        # Delay of every lane when it is green first, green second or red all the horizon, (green times, lanes)
+        precompute_start = time.perf_counter()
+        red_delay = (queues + self.rates * times[:, None]).sum(axis=0) * resolution
+        first_delay = self.queue_delay(queues, times, resolution, np.zeros_like(green_times), green_times) - red_delay
+        second_start = np.minimum(green_times + manager.clearance_time, horizon)
+        second_delay = self.queue_delay(queues, times, resolution, second_start, np.full_like(green_times, horizon)) - red_delay
+        second_by_group = second_delay @ masks.T
+        cells = 2 * len(green_times) * len(times) * len(queues)
+        cell_seconds = (time.perf_counter() - precompute_start) / cells
+        self.cell_seconds = cell_seconds if self.cell_seconds is None \
+            else max(cell_seconds, 0.8 * self.cell_seconds + 0.2 * cell_seconds)
+
+        # Highest pressure first, so running out of budget still leaves a good decision
+        pressures = masks[candidates] @ queues
+        order = [candidates[i] for i in np.argsort(-pressures, kind='stable')]
+
+        best = None
+        phase_seconds = 0.0
+        for phase in order:
+            # Stop before a phase that would not fit in the budget, the first one is always evaluated
+            phase_start = time.perf_counter()
+            if best is not None and phase_start - start + phase_seconds > self.budget:
+                self.budget_exceeded += 1
+                break
+            # Lanes of both groups are already green in the first one, (green times, second groups)
+            delays = (red_delay.sum() + first_delay @ masks[phase])[:, None] + second_by_group \
+                - second_delay @ (masks & masks[phase]).T
+            if len(masks) > 1:
+                delays[:, phase] = np.inf
+            i = int(np.argmin(delays.min(axis=1)))
+            delay = float(delays[i].min())
+            if best is None or delay < best[2]:
+                best = (phase, round(float(green_times[i])), delay)
+            phase_seconds = max(phase_seconds, time.perf_counter() - phase_start)
+
+        elapsed = time.perf_counter() - start
+        if elapsed > self.budget:
+            self.coarsening = min(self.coarsening * 2, MAX_COARSENING)
+        elif elapsed < self.budget / 4 and self.coarsening > 1:
+            self.coarsening //= 2
+        return best
+
+    def get_grid(self, manager, horizon, start):
+        """(seconds per time step, number of time steps) that fit the delay precompute in half the budget left"""
+        num_lanes = len(manager.lane_ids)
+        green_range = max(manager.max_green_time - manager.min_green_time, 0)
+        allowed = max(self.budget - (time.perf_counter() - start), 0) / 2
+
+        def cells(resolution, steps):
+            return 2 * (green_range // (self.step * resolution) + 1) * steps * num_lanes
+
+        resolution = self.coarsening
+        steps = max(1, int(np.ceil(horizon / resolution)))
+        if self.cell_seconds is None:
+            return resolution, steps
+        while resolution < MAX_COARSENING and cells(resolution, steps) * self.cell_seconds > allowed:
+            resolution *= 2
+            steps = max(1, int(np.ceil(horizon / resolution)))
+        # Shorter horizon, it still covers at least the first green time and the clearance
+        min_steps = max(1, int(np.ceil((manager.min_green_time + manager.clearance_time) / resolution)) + 1)
+        affordable = int(allowed / max(cells(resolution, 1) * self.cell_seconds, 1e-12))
+        return resolution, max(min_steps, min(steps, affordable))
+
+    def get_stats(self):
+        return {**super().get_stats(), 'budget_exceeded': self.budget_exceeded}
+
+
+POLICIES = {policy.name: policy for policy in (RewardPolicy, MaxPressurePolicy)}
+
+
+def make_policy(name=None, **options):
+    """Policy by name ('reward' or 'max_pressure'), the reward policy if None"""
+    if name is None:
+        return RewardPolicy()
+    if name not in POLICIES:
+        raise ValueError(f"Unknown scheduling policy {name!r}, expected one of {sorted(POLICIES)}")
+    return POLICIES[name](**options)
@@ -0,0 +1,203 @@
+# utils/shared_frame_ring.py
+import multiprocessing as mp
+import sys
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+# Header layout: [latest slot, frames written, frames dropped, writer closed]
+HEADER_FIELDS = 4
+LATEST, WRITTEN, DROPPED, CLOSED = range(HEADER_FIELDS)
+# Per slot: [sequence number, reader pins, being written]
+SLOT_FIELDS = 3
+SEQ, PINS, WRITING = range(SLOT_FIELDS)
+
+
+class FrameHandle:
+    """A frame pinned in the ring, the view stays valid until release()"""
+
+    def __init__(self, ring, slot, seq, frame, timestamp):
+        self.ring = ring
+        self.slot = slot
+        self.seq = seq
+        self.frame = frame
+        self.timestamp = timestamp
+
+    def release(self):
+        if self.slot is not None:
+            self.ring._unpin(self.slot)
+            self.slot = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class SharedFrameRing:
+    """
+    Ring of fixed-size frame slots in shared memory, one writer and any number of readers
+
+    The writer decodes straight into a free slot and publishes it with a new
+    sequence number. Readers pin the newest slot and get a read-only numpy view
+    of it without copying. The writer never touches a pinned slot or the slot
+    it is filling, so frames are never torn; it overwrites the oldest unpinned
+    slot, so slow readers only ever miss frames. The lock only guards the few
+    header integers, never the frame data.
+    """
+
+    def __init__(self, shape, slots=4, dtype=np.uint8, name=None, lock=None, create=True):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.dtype = np.dtype(dtype)
+        self.lock = lock if lock is not None else mp.Lock()
+        self.owner = create
+
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        header_bytes = 8 * (HEADER_FIELDS + slots * SLOT_FIELDS) + 8 * slots
+        size = header_bytes + frame_bytes * slots
+
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            # Only the creating process unlinks the segment; child processes share its
+            # resource tracker, so attaching does not need to be untracked before Python 3.13
+            if sys.version_info >= (3, 13):
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            else:
+                self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+        offset = 0
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        offset += 8 * HEADER_FIELDS
+        self.slot_info = np.ndarray((slots, SLOT_FIELDS), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        offset += 8 * slots * SLOT_FIELDS
+        self.timestamps = np.ndarray((slots,), dtype=np.float64, buffer=self.shm.buf, offset=offset)
+        offset += 8 * slots
+        self.frames = np.ndarray((slots, *self.shape), dtype=self.dtype, buffer=self.shm.buf, offset=offset)
+
+        if create:
+            self.header[:] = 0
+            self.header[LATEST] = -1
+            self.slot_info[:] = 0
+            self.slot_info[:, SEQ] = -1
+
+    def __getstate__(self):
+        # Other processes attach to the same segment by name
+        return {'shape': self.shape, 'slots': self.slots, 'dtype': self.dtype.str,
+                'name': self.name, 'lock': self.lock}
+
+    def __setstate__(self, state):
+        self.__init__(state['shape'], state['slots'], np.dtype(state['dtype']), name=state['name'],
+                      lock=state['lock'], create=False)
+
+    # Writer side
+
+    def begin_write(self):
+        """Reserve the oldest slot nobody is reading, returns (slot, writable view) or (None, None)"""
+        with self.lock:
+            latest = self.header[LATEST]
+            candidates = [slot for slot in range(self.slots)
+                          if slot != latest and self.slot_info[slot, PINS] == 0]
+            if not candidates:
+                # Every slot is pinned by a reader, the frame is dropped
+                self.header[DROPPED] += 1
+                return None, None
+            slot = min(candidates, key=lambda slot: self.slot_info[slot, SEQ])
+            self.slot_info[slot, WRITING] = 1
+            self.slot_info[slot, SEQ] = -1
+        return slot, self.frames[slot]
+
+    def commit_write(self, slot, timestamp=None):
+        """Publish a slot filled after begin_write() as the newest frame"""
+        with self.lock:
+            seq = self.header[WRITTEN]
+            self.timestamps[slot] = time.time() if timestamp is None else timestamp
+            self.slot_info[slot, SEQ] = seq
+            self.slot_info[slot, WRITING] = 0
+            self.header[WRITTEN] = seq + 1
+            self.header[LATEST] = slot
+        return seq
+
+    def abort_write(self, slot):
+        with self.lock:
+            self.slot_info[slot, WRITING] = 0
+
+    def write(self, frame, timestamp=None):
+        """Copy a frame into the ring, returns its sequence number or None if it was dropped"""
+        slot, view = self.begin_write()
+        if slot is None:
+            return None
+        if frame.shape == self.shape:
+            np.copyto(view, frame)
+        else:
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=view)
+        return self.commit_write(slot, timestamp)
+
+    def read_from_capture(self, cap):
+        """Decode the next frame of a cv2.VideoCapture directly into a slot"""
+        slot, view = self.begin_write()
+        if slot is None:
+            # Still consume the frame so the stream keeps moving
+            ret, _ = cap.read()
+            return ret, None
+
+        ret, frame = cap.read(view)
+        if not ret:
+            self.abort_write(slot)
+            return False, None
+        if not np.shares_memory(frame, view):
+            # The source has another resolution than the slots
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=view)
+        return True, self.commit_write(slot)
+
+    def close_writer(self):
+        with self.lock:
+            self.header[CLOSED] = 1
+
+    # Reader side
+
+    def acquire_latest(self, after_seq=-1):
+        """
+        Pin the newest frame if it is newer than after_seq
+
+        Returns:
+        FrameHandle: read-only view of the frame, or None if there is no newer frame
+        """
+        with self.lock:
+            slot = self.header[LATEST]
+            if slot < 0 or self.slot_info[slot, SEQ] <= after_seq:
+                return None
+            self.slot_info[slot, PINS] += 1
+            seq = int(self.slot_info[slot, SEQ])
+            timestamp = float(self.timestamps[slot])
+
+        frame = self.frames[slot]
+        frame.flags.writeable = False
+        return FrameHandle(self, slot, seq, frame, timestamp)
+
+    def _unpin(self, slot):
+        with self.lock:
+            self.slot_info[slot, PINS] -= 1
+
+    def get_stats(self):
+        return {'frames_written': int(self.header[WRITTEN]), 'frames_dropped': int(self.header[DROPPED])}
+
+    @property
+    def writer_closed(self):
+        return bool(self.header[CLOSED])
+
+    def close(self):
+        # Views must be dropped before the segment can be closed
+        del self.header, self.slot_info, self.timestamps, self.frames
+        try:
+            self.shm.close()
+        except BufferError:
+            # A frame view is still referenced, the mapping goes away with the process
+            pass
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,382 @@
+# utils/timeseries_store.py
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from .metrics import REGISTRY
+
+# A chunk never spans more than this many seconds, so a time range query knows how far back to look
+MAX_CHUNK_SECONDS = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS count_chunks (
+    intersection TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    num_rows INTEGER NOT NULL,
+    num_lanes INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS count_chunks_time ON count_chunks (intersection, start_time);
+
+CREATE TABLE IF NOT EXISTS lane_minutes (
+    intersection TEXT NOT NULL,
+    minute INTEGER NOT NULL,
+    lane INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    vehicles_sum INTEGER NOT NULL,
+    vehicles_max INTEGER NOT NULL,
+    detections_sum INTEGER NOT NULL,
+    PRIMARY KEY (intersection, minute, lane)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS phase_events (
+    intersection TEXT NOT NULL,
+    time REAL NOT NULL,
+    phase INTEGER NOT NULL,
+    green_time REAL NOT NULL,
+    green_lanes TEXT NOT NULL,
+    vehicles TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS phase_events_time ON phase_events (intersection, time);
+"""
+
+
+def encode_chunk(timestamps, vehicles, detections):
+    """
+    Compress one chunk of per-frame lane counts
+
+    Timestamps are stored as millisecond deltas and every lane's counts are
+    stored contiguously (column by column), which compresses far better than
+    rows of small integers.
+    """
+    offsets = np.round((timestamps - timestamps[0]) * 1000).astype(np.int64)
+    deltas = np.diff(offsets, prepend=0).astype('<u4')
+    counts = np.clip(np.concatenate([vehicles.T, detections.T]), 0, 65535).astype('<u2')
+    return zlib.compress(deltas.tobytes() + counts.tobytes(), 6)
+
+
+def decode_chunk(data, start_time, num_rows, num_lanes):
+    """Returns (timestamps, vehicles, detections), counts are (rows, lanes)"""
+    raw = zlib.decompress(data)
+    deltas = np.frombuffer(raw, dtype='<u4', count=num_rows)
+    counts = np.frombuffer(raw, dtype='<u2', offset=4 * num_rows).reshape(2 * num_lanes, num_rows)
+    timestamps = start_time + np.cumsum(deltas, dtype=np.int64) / 1000
+    return timestamps, counts[:num_lanes].T.astype(np.int64), counts[num_lanes:].T.astype(np.int64)
+
+
+class TimeSeriesReader:
+    """Queries of a TimeSeriesStore database, opened read-only unless a connection is given"""
+
+    def __init__(self, path, connection=None):
+        self.path = path
+        if connection is None:
+            connection = sqlite3.connect(pathlib.Path(path).resolve().as_uri() + '?mode=ro', uri=True,
+                                         timeout=30, check_same_thread=False)
+        self.read_connection = connection
+        self.read_lock = threading.Lock()
+
+    def _query(self, sql, parameters):
+        with self.read_lock:
+            return self.read_connection.execute(sql, parameters).fetchall()
+
+    def lane_counts(self, intersection_id, start, end, bucket=60, lane=None):
+        """
+        Per-lane vehicle statistics in time buckets, from the per-minute rollups
+
+        Args:
+        start, end (float): Time range in seconds since the epoch, end excluded
+        bucket (int): Bucket size in seconds, a multiple of 60
+        lane (int): Only this lane, all lanes if None
+
+        Returns:
+        list: (bucket start time, lane, frames, mean vehicles per frame, max vehicles, detections) tuples
+        """
+        if bucket % 60:
+            raise ValueError("Buckets are whole minutes, use frame_counts() for finer resolution")
+        minutes_per_bucket = bucket // 60
+        sql = ('SELECT minute / ? * ? AS bucket, lane, sum(frames), sum(vehicles_sum), max(vehicles_max), '
+               'sum(detections_sum) FROM lane_minutes WHERE intersection = ? AND minute >= ? AND minute < ?')
+        parameters = [minutes_per_bucket, minutes_per_bucket, intersection_id,
+                      int(start // 60), -int(-end // 60)]
+        if lane is not None:
+            sql += ' AND lane = ?'
+            parameters.append(lane)
+        sql += ' GROUP BY bucket, lane ORDER BY bucket, lane'
+        return [(bucket_minute * 60, lane_id, frames, total / frames if frames else 0.0, peak, found)
+                for bucket_minute, lane_id, frames, total, peak, found in self._query(sql, parameters)]
+
+    def frame_counts(self, intersection_id, start, end):
+        """
+        Raw per-frame counts, only the chunks overlapping the range are decoded
+
+        Returns:
+        tuple: (timestamps, vehicles, detections) arrays, counts are (frames, lanes)
+        """
+        rows = self._query('SELECT start_time, num_rows, num_lanes, data FROM count_chunks '
+                           'WHERE intersection = ? AND start_time >= ? AND start_time < ? AND end_time >= ? '
+                           'ORDER BY start_time', (intersection_id, start - MAX_CHUNK_SECONDS, end, start))
+        timestamps, vehicles, detections = [], [], []
+        for start_time, num_rows, num_lanes, data in rows:
+            chunk = decode_chunk(data, start_time, num_rows, num_lanes)
+            keep = (chunk[0] >= start) & (chunk[0] < end)
+            timestamps.append(chunk[0][keep])
+            vehicles.append(chunk[1][keep])
+            detections.append(chunk[2][keep])
+        if not timestamps:
+            return np.zeros(0), np.zeros((0, 0), dtype=np.int64), np.zeros((0, 0), dtype=np.int64)
+        if len({counts.shape[1] for counts in vehicles}) > 1:
+            raise ValueError(f"The number of lanes of {intersection_id} changed within the range")
+        return np.concatenate(timestamps), np.concatenate(vehicles), np.concatenate(detections)
+
+    def phase_events(self, intersection_id, start, end):
+        """
+        Light changes in the range
+
+        Returns:
+        list: (time, phase, green time, green lane ids, vehicles per lane) tuples
+        """
+        rows = self._query('SELECT time, phase, green_time, green_lanes, vehicles FROM phase_events '
+                           'WHERE intersection = ? AND time >= ? AND time < ? ORDER BY time',
+                           (intersection_id, start, end))
+        return [(timestamp, phase, green_time, [int(lane) for lane in green_lanes.split(',') if lane],
+                 [int(count) for count in vehicles.split(',') if count])
+                for timestamp, phase, green_time, green_lanes, vehicles in rows]
+
+    def intersections(self):
+        return [row[0] for row in self._query('SELECT DISTINCT intersection FROM lane_minutes', ())]
+
+    def close(self):
+        self.read_connection.close()
+
+
+class TimeSeriesStore(TimeSeriesReader):
+    """
+    Append-only SQLite history of lane counts and light phase changes
+
+    Appends are buffered and written by a background thread every flush_interval
+    seconds, with per-minute rollups for range queries. Call flush() before
+    querying to include the buffer.
+    """
+
+    def __init__(self, path, flush_interval=5.0, max_pending=100000, metrics=None):
+        """
+        Args:
+        path (str): SQLite database file, created if missing
+        flush_interval (float): Seconds between two writes
+        max_pending (int): Buffered frames (all intersections) above which appending blocks
+        metrics (MetricsRegistry): Where the write times are recorded, the default registry if None
+        """
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.metrics = metrics if metrics is not None else REGISTRY
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.connection = self._connect()
+        self.connection.executescript(SCHEMA)
+        # Queries get their own connection, WAL lets them read while the writer writes
+        super().__init__(path, self._connect())
+
+        # intersection -> list of (timestamp, vehicles, detections)
+        self.pending_counts = {}
+        self.pending_phases = []
+        self.pending_rows = 0
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+
+        # Statistics
+        self.rows_written = 0
+        self.chunks_written = 0
+        self.bytes_written = 0
+        self.phases_written = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.blocked_time = 0.0
+
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._flush_loop, name='timeseries-store', daemon=True)
+        self.thread.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _wait_for_room(self):
+        if self.pending_rows < self.max_pending:
+            return
+        start = time.perf_counter()
+        while self.pending_rows >= self.max_pending and not self.stop_event.is_set():
+            self.condition.wait()
+        self.blocked_time += time.perf_counter() - start
+
+    def append_counts(self, intersection_id, timestamp, vehicles, detections=None):
+        """
+        Buffer the counts of one frame
+
+        Args:
+        intersection_id (str): Intersection the lanes belong to
+        timestamp (float): Seconds since the epoch
+        vehicles (list): Vehicles counted on each lane
+        detections (list): All detections on each lane, the vehicle counts if None
+        """
+        vehicles = np.asarray(vehicles, dtype=np.int64)
+        detections = vehicles if detections is None else np.asarray(detections, dtype=np.int64)
+        with self.condition:
+            self._wait_for_room()
+            self.pending_counts.setdefault(intersection_id, []).append((timestamp, vehicles, detections))
+            self.pending_rows += 1
+
+    def append_phase(self, intersection_id, timestamp, phase, green_time, green_lanes, vehicles):
+        """
+        Buffer a light change
+
+        Args:
+        phase (int): Index of the phase group that got green
+        green_time (float): Its green time in seconds
+        green_lanes (list): Lane ids that got green
+        vehicles (list): Vehicles counted on each lane at the change
+        """
+        with self.condition:
+            self._wait_for_room()
+            self.pending_phases.append((intersection_id, timestamp, int(phase), float(green_time),
+                                        ','.join(str(int(lane)) for lane in green_lanes),
+                                        ','.join(str(int(count)) for count in vehicles)))
+            self.pending_rows += 1
+
+    def flush(self):
+        """Write everything buffered now in one transaction, returns the number of frames written"""
+        with self.flush_lock:
+            with self.condition:
+                pending_counts, self.pending_counts = self.pending_counts, {}
+                pending_phases, self.pending_phases = self.pending_phases, []
+                self.pending_rows = 0
+                self.condition.notify_all()
+
+            if not pending_counts and not pending_phases:
+                return 0
+
+            start = time.perf_counter()
+            chunks, minutes = [], []
+            rows = 0
+            for intersection_id, frames in pending_counts.items():
+                # Already in order unless the wall clock was set back
+                frames.sort(key=lambda frame: frame[0])
+                # Lane count changes (a restart with other lanes) start a new chunk
+                for group in self._split_by_lanes(frames):
+                    chunks.extend(self._make_chunks(intersection_id, group))
+                    minutes.extend(self._make_minutes(intersection_id, group))
+                    rows += len(group)
+
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT INTO count_chunks (intersection, start_time, end_time, num_rows, num_lanes, data) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', chunks)
+                self.connection.executemany(
+                    'INSERT INTO lane_minutes (intersection, minute, lane, frames, vehicles_sum, vehicles_max, '
+                    'detections_sum) VALUES (?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (intersection, minute, lane) DO UPDATE SET '
+                    'frames = frames + excluded.frames, vehicles_sum = vehicles_sum + excluded.vehicles_sum, '
+                    'vehicles_max = max(vehicles_max, excluded.vehicles_max), '
+                    'detections_sum = detections_sum + excluded.detections_sum', minutes)
+                self.connection.executemany(
+                    'INSERT INTO phase_events (intersection, time, phase, green_time, green_lanes, vehicles) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', pending_phases)
+
+            self.last_flush_seconds = time.perf_counter() - start
+            self.metrics.observe('store_flush_seconds', self.last_flush_seconds)
+            self.flushes += 1
+            self.rows_written += rows
+            self.chunks_written += len(chunks)
+            self.bytes_written += sum(len(chunk[-1]) for chunk in chunks)
+            self.phases_written += len(pending_phases)
+            return rows
+
+    @staticmethod
+    def _split_by_lanes(frames):
+        groups = [[frames[0]]]
+        for frame in frames[1:]:
+            if len(frame[1]) != len(groups[-1][-1][1]):
+                groups.append([])
+            groups[-1].append(frame)
+        return groups
+
+    @staticmethod
+    def _make_chunks(intersection_id, frames):
+        timestamps = np.array([frame[0] for frame in frames], dtype=np.float64)
+        vehicles = np.array([frame[1] for frame in frames])
+        detections = np.array([frame[2] for frame in frames])
+
+        # Frames arrive in order, a chunk ends where MAX_CHUNK_SECONDS is reached
+        bounds = [0]
+        while bounds[-1] < len(timestamps):
+            limit = timestamps[bounds[-1]] + MAX_CHUNK_SECONDS
+            bounds.append(max(int(np.searchsorted(timestamps, limit, side='left')), bounds[-1] + 1))
+
+        chunks = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            chunks.append((intersection_id, float(timestamps[start]), float(timestamps[end - 1]), end - start,
+                           vehicles.shape[1], encode_chunk(timestamps[start:end], vehicles[start:end],
+                                                           detections[start:end])))
+        return chunks
+
+    @staticmethod
+    def _make_minutes(intersection_id, frames):
+        """Per-minute per-lane rollup rows of these frames"""
+        timestamps = np.array([frame[0] for frame in frames], dtype=np.float64)
+        vehicles = np.array([frame[1] for frame in frames])
+        detections = np.array([frame[2] for frame in frames])
+
+        minutes, index = np.unique((timestamps // 60).astype(np.int64), return_inverse=True)
+        num_lanes = vehicles.shape[1]
+        frame_counts = np.bincount(index, minlength=len(minutes))
+        vehicles_sum = np.zeros((len(minutes), num_lanes), dtype=np.int64)
+        vehicles_max = np.zeros((len(minutes), num_lanes), dtype=np.int64)
+        detections_sum = np.zeros((len(minutes), num_lanes), dtype=np.int64)
+        np.add.at(vehicles_sum, index, vehicles)
+        np.maximum.at(vehicles_max, index, vehicles)
+        np.add.at(detections_sum, index, detections)
+
+        return [(intersection_id, minute, lane + 1, frames, total, peak, found)
+                for minute, frames, totals, peaks, founds in zip(minutes.tolist(), frame_counts.tolist(),
+                                                                  vehicles_sum.tolist(), vehicles_max.tolist(),
+                                                                  detections_sum.tolist())
+                for lane, (total, peak, found) in enumerate(zip(totals, peaks, founds))]
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Error writing lane history to {self.path}: {e}")
+                self.metrics.inc('store_errors_total')
+
+    def get_stats(self):
+        return {
+            'rows_written': self.rows_written,
+            'chunks_written': self.chunks_written,
+            'bytes_written': self.bytes_written,
+            'phases_written': self.phases_written,
+            'flushes': self.flushes,
+            'pending': self.pending_rows,
+            'last_flush_seconds': self.last_flush_seconds,
+            'blocked_time': self.blocked_time,
+        }
+
+    def close(self):
+        """Stop the background thread, write what is left and close the database"""
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+        self.thread.join(timeout=max(1.0, self.flush_interval * 2))
+        self.flush()
+        self.connection.close()
+        super().close()
@@ -1,221 +1,289 @@
+import logging
 import time
+
+import numpy as np
+
 from .firebase_manager import FirebaseManager
+from .metrics import REGISTRY
+from .scheduling_policy import RewardPolicy
+
+logger = logging.getLogger(__name__)
 
 MIN_GREEN_TIME = 5
 MAX_GREEN_TIME = 30
 BASE_GREEN_TIME = 10
 REWARD_MULTIPLIER = 0.5
 
+# Thời gian đèn vàng: các làn đỏ chờ thêm 3 giây sau khi nhóm xanh hết giờ
+CLEARANCE_TIME = 3
+
 class TrafficLightManager:
-    def __init__(self, num_lanes=4, firebase_manager=None):
+    """
+    Light timing of one intersection
+
+    Lane state is kept in one numpy array per field, indexed through a lane id
+    to index map, so per-lane access is O(1) and timers and phase changes are
+    computed for all lanes at once. Lanes that get green together form a phase
+    group, a scheduling policy picks the group that gets green next and its
+    green time.
+    """
+
+    def __init__(self, num_lanes=4, firebase_manager=None, intersection_id='main_intersection', metrics=None,
+                 clock=None, min_green_time=MIN_GREEN_TIME, max_green_time=MAX_GREEN_TIME,
+                 base_green_time=BASE_GREEN_TIME, reward_multiplier=REWARD_MULTIPLIER, clearance_time=CLEARANCE_TIME,
+                 phase_groups=None, policy=None, store=None):
+        """
+        Args:
+        clock (callable): Returns the current time in seconds, time.time by default. A
+                          simulation passes a virtual clock to run faster than real time
+        min_green_time, max_green_time, base_green_time, reward_multiplier: Scheduling parameters
+        clearance_time (int): Seconds between the end of a green and the next group's green
+        phase_groups (list): Lane ids sharing a green phase, in phase order, e.g. [(1, 4), (2, 5), (3, 6)]
+                             for 6 approaches. Every lane needs a group, a lane may be in several.
+                             Default: odd and even lanes, [(1, 3), (2, 4)] with 4 lanes, the even lanes
+                             starting green. Custom groups start with the first group green.
+        policy (SchedulingPolicy): Picks the next group and its green time, a RewardPolicy (groups in
+                                   turn, green time from the reward rule) if None
+        store (TimeSeriesStore): Where every light change is recorded, nothing is recorded if None
+        """
         self.firebase = firebase_manager
-        self.intersection_id = 'main_intersection'
-        self.lanes = [
-            {
-                'id': lane_id,
-                'is_green': lane_id in [2, 4],  # True/False: Mặc định làn 2 và 4 có đèn xanh
-                'green_time': BASE_GREEN_TIME,  # Thời gian đèn xanh mặc định
-                'red_time': BASE_GREEN_TIME + 3,  # Thời gian đèn đỏ mặc định
-                'remaining_time': BASE_GREEN_TIME,  # Thời gian còn lại của đèn
-                'start_time': time.time(),  # Thời điểm bắt đầu lượt
-                'vehicles_at_change': 0,  # Số xe tại thời điểm chuyển đèn
-                'total_vehicles': 0,  # Tổng số xe trong làn
-                'cycle_count': 0,  # Số lần chu kỳ đèn giao thông
-                'ready_to_switch': False,
-            } for lane_id in range(1, num_lanes + 1)
-        ]
-        self.opposite_pairs = [(1, 3), (2, 4)]
+        self.intersection_id = intersection_id
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.clock = clock or time.time
+        self.min_green_time = min_green_time
+        self.max_green_time = max_green_time
+        self.base_green_time = base_green_time
+        self.reward_multiplier = reward_multiplier
+        self.clearance_time = clearance_time
+        self.policy = policy or RewardPolicy()
+        self.store = store
+
+        self.lane_ids = np.arange(1, num_lanes + 1)
+        self.lane_index = {lane_id: i for i, lane_id in enumerate(self.lane_ids.tolist())}
+
+        if phase_groups is None:
+            # Nhóm làn đối diện: các làn lẻ và các làn chẵn, mặc định các làn chẵn (2 và 4) có đèn xanh
+            phase_groups = [tuple(range(1, num_lanes + 1, 2)), tuple(range(2, num_lanes + 1, 2))]
+            phase_groups = [group for group in phase_groups if group]
+            self.phase = len(phase_groups) - 1
+        else:
+            self.phase = 0
+        self.phase_groups = [tuple(group) for group in phase_groups]
+        self.phase_masks = self._build_phase_masks(self.phase_groups)
+
+        start_time = self.clock()
+        self.is_green = self.phase_masks[self.phase].copy()
+        self.green_time = np.full(num_lanes, base_green_time, dtype=np.int64)  # Thời gian đèn xanh
+        self.red_time = self.green_time + self.clearance_time  # Thời gian đèn đỏ
+        self.remaining_time = self.green_time.copy()  # Thời gian còn lại của đèn
+        self.start_time = np.full(num_lanes, start_time, dtype=np.float64)  # Thời điểm bắt đầu lượt
+        self.vehicles_at_change = np.zeros(num_lanes, dtype=np.int64)  # Số xe tại thời điểm chuyển đèn
+        self.total_vehicles = np.zeros(num_lanes, dtype=np.int64)  # Tổng số xe trong làn
+        self.cycle_count = np.zeros(num_lanes, dtype=np.int64)  # Số lần chu kỳ đèn giao thông
+        # Cumulative vehicles seen and stop line crossings per lane, only known when the lanes are tracked
+        self.tracked = False
+        self.unique_vehicles = np.zeros(num_lanes, dtype=np.int64)
+        self.crossings = np.zeros(num_lanes, dtype=np.int64)
+        self.ready_to_switch = np.zeros(num_lanes, dtype=bool)
+        # When the current light of each lane ends, kept in step with start_time, green_time and red_time
+        self.end_time = self.start_time + np.where(self.is_green, self.green_time, self.red_time)
+        self.time_buffer = np.empty(num_lanes)
+
+    def _build_phase_masks(self, phase_groups):
+        """(groups, lanes) boolean matrix, row i is True for the lanes of group i"""
+        if not phase_groups:
+            raise ValueError("At least one phase group is needed")
+        masks = np.zeros((len(phase_groups), len(self.lane_ids)), dtype=bool)
+        for i, group in enumerate(phase_groups):
+            for lane_id in group:
+                if lane_id not in self.lane_index:
+                    raise ValueError(f"Phase group {group} has unknown lane {lane_id}")
+                masks[i, self.lane_index[lane_id]] = True
+        missing = self.lane_ids[~masks.any(axis=0)]
+        if missing.size:
+            raise ValueError(f"Lanes {missing.tolist()} are in no phase group")
+        return masks
+
+    def next_phase(self):
+        """Group after the current one in phase order"""
+        return (self.phase + 1) % len(self.phase_groups)
+
+    def next_green_mask(self):
+        """Lanes that get green at the next switch"""
+        if len(self.phase_groups) == 1:
+            # A single group alternates between green and red
+            return ~self.is_green & self.phase_masks[0]
+        return self.phase_masks[self.next_phase()]
+
+    def _publish(self, **fields):
+        """Send the status of every lane to Firebase, fields are per-lane arrays or plain values"""
+        columns = {key: value.tolist() if isinstance(value, np.ndarray) else [value] * len(self.lane_ids)
+                   for key, value in fields.items()}
+        for i, lane_id in enumerate(self.lane_ids.tolist()):
+            status_data = {key: column[i] for key, column in columns.items()}
+            self.firebase.update_lane_status(self.intersection_id, lane_id, status_data)
 
     def update_timers(self):
         """Update all lane timers and check if ready to switch"""
-        current_time = time.time()
-        all_ready = True
-
-        for lane in self.lanes:
-            elapsed_time = current_time - lane['start_time']
-            target_time = lane['green_time'] if lane['is_green'] else lane['red_time']
-            lane['remaining_time'] = round(max(0, target_time - elapsed_time))
-
-            if lane['remaining_time'] <= 0:
-                lane['ready_to_switch'] = True
-            else:
-                all_ready = False
-
-            # Update Firebase with new remaining time
-            if self.firebase:
-                status_data = {
-                    'remaining_time': lane['remaining_time'],
-                    'green_time': lane['green_time'],
-                    'last_update': int(current_time)
-                }
-                self.firebase.update_lane_status(
-                    self.intersection_id,
-                    lane['id'],
-                    status_data
-                )
-
-        return all_ready
+        current_time = self.clock()
+        remaining_time = np.subtract(self.end_time, current_time, out=self.time_buffer)
+        np.maximum(remaining_time, 0, out=remaining_time)
+        self.remaining_time[:] = np.rint(remaining_time, out=remaining_time)
+        expired = self.remaining_time <= 0
+        self.ready_to_switch |= expired
+
+        # Update Firebase with new remaining time
+        if self.firebase:
+            self._publish(remaining_time=self.remaining_time,
+                          green_time=self.green_time, last_update=int(current_time))
+
+        return bool(expired.all())
 
     def update_lane(self, lane_id, vehicles_count):
         """Cập nhật thông tin xe và trạng thái cho một làn"""
-        for lane in self.lanes:
-            if lane['id'] == lane_id:
-                lane['total_vehicles'] = vehicles_count
-
-                # Update Firebase if available
-                if self.firebase:
-                    status_data = {
-                        'vehicle_count': vehicles_count,
-                        'is_green': lane['is_green'],
-                        'remaining_time': lane['remaining_time'],
-                        'green_time': lane['green_time'],
-                        'last_update': int(time.time())
-                    }
-                    self.firebase.update_lane_status(
-                        self.intersection_id,
-                        lane_id,
-                        status_data
-                    )
-                break
+        i = self.lane_index.get(lane_id)
+        if i is None:
+            return
+        self.total_vehicles[i] = vehicles_count
+
+        # Update Firebase if available
+        if self.firebase:
+            status_data = {
+                'vehicle_count': vehicles_count,
+                'is_green': bool(self.is_green[i]),
+                'remaining_time': int(self.remaining_time[i]),
+                'green_time': int(self.green_time[i]),
+                'last_update': int(self.clock())
+            }
+            self.firebase.update_lane_status(
+                self.intersection_id,
+                lane_id,
+                status_data
+            )
+
+    def update_lanes(self, vehicle_counts):
+        """Cập nhật số xe của tất cả các làn, theo thứ tự lane id"""
+        self.total_vehicles[:] = vehicle_counts
+
+        if self.firebase:
+            self._publish(vehicle_count=self.total_vehicles, is_green=self.is_green,
+                          remaining_time=self.remaining_time, green_time=self.green_time,
+                          last_update=int(self.clock()))
+
+    def update_flows(self, unique_vehicles, crossings):
+        """Cumulative vehicles seen and stop line crossings of all lanes from a tracker, in lane id order"""
+        self.tracked = True
+        self.unique_vehicles[:] = unique_vehicles
+        self.crossings[:] = crossings
 
     def update_vehicle_at_change(self, lane_id, vehicles_at_change):
         """Cập nhật thông tin xe và trạng thái cho một làn"""
-        for lane in self.lanes:
-            if lane['id'] == lane_id:
-                lane['vehicles_at_change'] = vehicles_at_change
-                lane['cycle_count'] += 1
-                break
+        i = self.lane_index.get(lane_id)
+        if i is not None:
+            self.vehicles_at_change[i] = vehicles_at_change
+            self.cycle_count[i] += 1
+
     def switch_traffic_lights(self):
-        """Chuyển trạng thái đèn giao thông cho các làn đối diện"""
-        green_time = self.schedule()
-
-        for pair in self.opposite_pairs:
-            lane1, lane2 = pair
-            lane1_obj = next(lane for lane in self.lanes if lane['id'] == lane1)
-            lane2_obj = next(lane for lane in self.lanes if lane['id'] == lane2)
-
-            # Cập nhật thời gian và số xe tại thời điểm chuyển
-            for lane in [lane1_obj, lane2_obj]:
-                lane['is_green'] = not lane['is_green']
-                lane['green_time'] = green_time
-                lane['red_time'] = green_time + 3
-                lane['remaining_time'] = lane['green_time'] if lane['is_green'] else lane['red_time']
-                lane['start_time'] = time.time()
-                lane['vehicles_at_change'] = lane['total_vehicles']
-                lane['cycle_count'] += 1
-                lane['ready_to_switch'] = False
-
-                # Update Firebase if available
-                if self.firebase:
-                    status_data = {
-                        'is_green': lane['is_green'],
-                        'remaining_time': lane['remaining_time'],
-                        'green_time': lane['green_time'],
-                        'vehicle_count': lane['total_vehicles'],
-                        'last_update': int(time.time())
-                    }
-                    self.firebase.update_lane_status(
-                        self.intersection_id,
-                        lane['id'],
-                        status_data
-                    )
+        """Chuyển đèn xanh sang nhóm làn do policy chọn, các nhóm khác đèn đỏ"""
+        phase, green_time = self.schedule()
+        self.metrics.inc('controller_switches_total', intersection=self.intersection_id)
+
+        if len(self.phase_groups) > 1:
+            self.phase = phase
+            self.is_green = self.phase_masks[phase].copy()
+        else:
+            self.is_green = self.next_green_mask().copy()
+
+        # Cập nhật thời gian và số xe tại thời điểm chuyển
+        self.green_time[:] = green_time
+        self.red_time[:] = self.green_time + self.clearance_time
+        self.remaining_time[:] = np.where(self.is_green, self.green_time, self.red_time)
+        self.start_time[:] = self.clock()
+        self.end_time[:] = self.start_time + self.remaining_time
+        self.vehicles_at_change[:] = self.total_vehicles
+        self.cycle_count += 1
+        self.ready_to_switch[:] = False
+
+        if self.store:
+            self.store.append_phase(self.intersection_id, float(self.start_time[0]), phase, green_time,
+                                    self.lane_ids[self.is_green].tolist(), self.total_vehicles.tolist())
+
+        # Update Firebase if available
+        if self.firebase:
+            self._publish(is_green=self.is_green, remaining_time=self.remaining_time,
+                          green_time=self.green_time, vehicle_count=self.total_vehicles,
+                          last_update=int(self.clock()))
 
         return self.lanes
 
     def schedule(self):
-        """Synchronize green times for opposite lane pairs"""
-        # Duyệt qua từng cặp làn đối diện
-        current_red_pair = None
-        for pair in self.opposite_pairs:
-            # Lấy đối tượng làn dựa trên ID
-            lane1_obj = next(lane for lane in self.lanes if lane['id'] == pair[0])
-            lane2_obj = next(lane for lane in self.lanes if lane['id'] == pair[1])
-
-            # Kiểm tra xem trạng thái đèn xanh của cả hai làn
-            if not lane1_obj['is_green'] and not lane2_obj['is_green']:
-                current_red_pair = (lane1_obj, lane2_obj)
-                break
-        if not current_red_pair:
-            return BASE_GREEN_TIME
-
-        # Get all vehicle counts for comparison
-        all_vehicle_counts = [lane['total_vehicles'] for lane in self.lanes]
-        avg_other_lanes = sum(all_vehicle_counts) / len(all_vehicle_counts)
-
-        # Calculate rewards for both lanes in the current red pair
-        lane1, lane2 = current_red_pair
-        lane1_vehicles = lane1['total_vehicles']
-        lane2_vehicles = lane2['total_vehicles']
-
-        # Calculate reward based on difference from average
-        lane1_reward = (lane1_vehicles - avg_other_lanes) * REWARD_MULTIPLIER
-        lane2_reward = (lane2_vehicles - avg_other_lanes) * REWARD_MULTIPLIER
-
-        # Use the maximum reward from the pair
-        max_reward = max(lane1_reward, lane2_reward)
-
-        # Calculate final green time
-        green_time = BASE_GREEN_TIME + max_reward
-        # Ensure green time stays within bounds
-        green_time = round(min(max(green_time, MIN_GREEN_TIME), MAX_GREEN_TIME))
-
-        print(f"Vehicle counts - Lane {lane1['id']}: {lane1_vehicles}, Lane {lane2['id']}: {lane2_vehicles}")
-        print(f"Average vehicles in other lanes: {avg_other_lanes:.2f}")
-        print(f"Reward: {max_reward:.2f}")
-        print(f"Final green time: {green_time}")
-
-        return green_time
+        """Ask the policy for the next phase group and its green time, returns (phase, green time)"""
+        phase, green_time, score = self.policy.decide(self)
+
+        self.metrics.inc('controller_decisions_total', intersection=self.intersection_id)
+        self.metrics.observe('controller_decision_seconds', self.policy.last_decision_seconds,
+                             intersection=self.intersection_id)
+        self.metrics.set('controller_reward', score, intersection=self.intersection_id)
+        self.metrics.set('controller_green_time_seconds', green_time, intersection=self.intersection_id)
+        if logger.isEnabledFor(logging.DEBUG):
+            lanes = self.phase_masks[phase]
+            logger.debug("%s: %s policy, phase %d, vehicle counts %s, average %.2f, score %.2f, green time %d",
+                         self.intersection_id, self.policy.name, phase,
+                         ", ".join(f"lane {lane_id}: {count}" for lane_id, count in
+                                   zip(self.lane_ids[lanes].tolist(), self.total_vehicles[lanes].tolist())),
+                         self.total_vehicles.mean(), score, green_time)
+
+        return phase, green_time
 
     def update_remaining_time(self):
         """Cập nhật thời gian còn lại cho mỗi làn"""
-        current_time = time.time()
-        for lane in self.lanes:
-            elapsed_time = current_time - lane['start_time']
-
-            if lane['is_green']:
-                lane['remaining_time'] = max(0, lane['green_time'] - elapsed_time)
-                if lane['remaining_time'] <= 0:
-                    lane['start_time'] = current_time
-                    lane['remaining_time'] = lane['red_time']
-            else:
-                lane['remaining_time'] = max(0, lane['red_time'] - elapsed_time)
-                if lane['remaining_time'] <= 0:
-                    lane['start_time'] = current_time
-                    lane['remaining_time'] = lane['green_time']
+        current_time = self.clock()
+        remaining_time = np.maximum(0, self.end_time - current_time)
+
+        # Lanes whose time is up start the opposite light
+        expired = remaining_time <= 0
+        self.start_time[expired] = current_time
+        remaining_time[expired] = np.where(self.is_green, self.red_time, self.green_time)[expired]
+        self.end_time[expired] = current_time + remaining_time[expired]
+        self.remaining_time[:] = np.round(remaining_time)
 
     def get_lane_status(self, lane_id):
         """Lấy trạng thái chi tiết của một làn"""
-        for lane in self.lanes:
-            if lane['id'] == lane_id:
-                return lane
-        return None
+        i = self.lane_index.get(lane_id)
+        if i is None:
+            return None
+        return {
+            'id': lane_id,
+            'is_green': bool(self.is_green[i]),
+            'green_time': int(self.green_time[i]),
+            'red_time': int(self.red_time[i]),
+            'remaining_time': int(self.remaining_time[i]),
+            'start_time': float(self.start_time[i]),
+            'vehicles_at_change': int(self.vehicles_at_change[i]),
+            'total_vehicles': int(self.total_vehicles[i]),
+            'cycle_count': int(self.cycle_count[i]),
+            'unique_vehicles': int(self.unique_vehicles[i]),
+            'crossings': int(self.crossings[i]),
+            'ready_to_switch': bool(self.ready_to_switch[i]),
+        }
 
     def get_all_lanes_status(self):
         """Lấy trạng thái của tất cả các làn"""
-        return self.lanes
+        return [self.get_lane_status(lane_id) for lane_id in self.lane_ids.tolist()]
+
+    @property
+    def lanes(self):
+        """Snapshot of every lane as a dict, like get_lane_status"""
+        return self.get_all_lanes_status()
 
     def switch_traffic_lights_immediately(self):
         """Chuyển trạng thái đèn giao thông về đèn vàng để chuẩn bị chuyển đèn"""
-        for pair in self.opposite_pairs:
-            lane1, lane2 = pair
-            lane1_obj = next(lane for lane in self.lanes if lane['id'] == lane1)
-            lane2_obj = next(lane for lane in self.lanes if lane['id'] == lane2)
-
-            # Cập nhật thời gian và số xe tại thời điểm chuyển
-            for lane in [lane1_obj, lane2_obj]:
-                lane['remaining_time'] = 0 if lane['is_green'] else 3
-
-                # Update Firebase if available
-                if self.firebase:
-                    status_data = {
-                        'remaining_time': lane['remaining_time'],
-                        'vehicle_count': lane['total_vehicles'],
-                        'last_update': int(time.time())
-                    }
-                    self.firebase.update_lane_status(
-                        self.intersection_id,
-                        lane['id'],
-                        status_data
-                    )
+        # Cập nhật thời gian và số xe tại thời điểm chuyển
+        self.remaining_time[:] = np.where(self.is_green, 0, self.clearance_time)
+
+        # Update Firebase if available
+        if self.firebase:
+            self._publish(remaining_time=self.remaining_time,
+                          vehicle_count=self.total_vehicles, last_update=int(self.clock()))
 
         return self.lanes
@@ -1,23 +1,142 @@
+import functools
+import time
+
 import cv2
 import numpy as np
-from yolov8 import YOLOv8
-from cap_from_youtube import cap_from_youtube
+from yolov8 import YOLOv8, Tracker
 from .traffic_light_manager import TrafficLightManager
 from .firebase_manager import FirebaseManager
+from .video_capture import CaptureGroup, ProcessCaptureGroup
+from .grid_renderer import GridRenderer
+from .lane_roi import LaneROI
+from .metrics import REGISTRY
+from .motion_gate import MotionGate
+from .video_source import open_source
+
+VEHICLE_CLASSES = {2: 'car', 3: 'motorcycle', 5: 'bus', 7: 'truck'}
+
+
+class LoopStats:
+    """Frame rate, CPU usage and rendering cost of the monitoring loop"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.ticks = 0
+        self.rendered = 0
+        self.render_time = 0.0
+        self.start_time = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def add_tick(self, render_time=None):
+        self.ticks += 1
+        if render_time is not None:
+            self.rendered += 1
+            self.render_time += render_time
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        cpu = time.process_time() - self.start_cpu
+        return {
+            'fps': self.ticks / elapsed,
+            'cpu_percent': 100 * cpu / elapsed,
+            'render_ms': 1000 * self.render_time / self.rendered if self.rendered else 0.0,
+            'render_share': self.render_time / elapsed,
+            'ticks': self.ticks,
+            'rendered': self.rendered,
+        }
+
+    def format(self):
+        summary = self.summary()
+        return (f"FPS: {summary['fps']:.1f} | CPU: {summary['cpu_percent']:.0f}% | "
+                f"rendered {summary['rendered']}/{summary['ticks']} ticks, "
+                f"{summary['render_ms']:.1f} ms each ({100 * summary['render_share']:.1f}% of loop time)")
+
 
 class TrafficMonitor:
-    def __init__(self, video_urls, model_path, firebase_credentials=None):
+    def __init__(self, video_urls, model_path, firebase_credentials=None, headless=False, render_every=1,
+                 stats_interval=10.0, lane_rois=None, intersection_id='main_intersection',
+                 detector=None, firebase_manager=None, capture_processes=False, metrics=None,
+                 target_fps=None, resolution=720, phase_groups=None, policy=None, store=None, motion_gate=None,
+                 tracking=None, detect_every=1, stop_lines=None):
+        """
+        Args:
+        video_urls (list): One video URL per lane
+        model_path (str): YOLOv8 ONNX model
+        firebase_credentials (str): Firebase service account file, Firebase is disabled if None
+        headless (bool): Skip all drawing and windows, only count vehicles and control the lights
+        render_every (int): Render and show the grid only every Nth tick (preview mode)
+        stats_interval (float): Seconds between two frame rate / CPU usage reports
+        lane_rois (list): Optional polygon per lane, (x, y) points normalized to 0..1,
+                          None for a lane that uses the whole frame
+        intersection_id (str): Firebase id of the intersection
+        detector (YOLOv8): Share an already loaded detector instead of loading model_path
+        firebase_manager (FirebaseManager): Share an existing Firebase connection
+        capture_processes (bool): Decode each lane in its own process and pass frames through shared memory
+        metrics (MetricsRegistry): Where stage and lane metrics are recorded, the default registry if None
+        target_fps (float): Frames per second processed per lane, the other frames are skipped undecoded
+        resolution (int): Preferred frame height at decode time (YouTube stream, camera, image directory)
+        phase_groups (list): Lane numbers that get green together, one group per phase, odd/even lanes if None
+        policy (SchedulingPolicy): Picks the next phase and its green time, the reward rule if None
+        store (TimeSeriesStore): Local history of the lane counts and light changes, not kept if None
+        motion_gate (dict): MotionGate options, lanes whose frame did not change reuse their last detections,
+                            {} for the defaults, detection runs on every frame if None
+        tracking (dict): Tracker options, lanes count their tracked vehicles instead of the detections of the
+                         frame, {} for the defaults, no tracking if None
+        detect_every (int): Run detection on every Nth frame of a lane only, the tracker predicts the other
+                            frames (tracking is enabled with the defaults if needed), lanes take turns
+        stop_lines (list): Optional stop line per lane, two (x, y) points normalized to 0..1, tracked vehicles
+                           crossing it are counted
+        video_urls may also be local files, RTSP/HTTP streams, image directories or camera indexes
+        """
         self.video_urls = video_urls
-        self.vehicle_classes = {2: 'car', 3: 'motorcycle', 5: 'bus', 7: 'truck'}
+        self.num_lanes = len(video_urls)
+        self.intersection_id = intersection_id
+        self.capture_processes = capture_processes
+        self.target_fps = target_fps
+        self.resolution = resolution
+        self.headless = headless
+        self.render_every = max(1, render_every)
+        self.render_requested = False
+        self.stats_interval = stats_interval
+        self.stats = LoopStats()
+        self.draw_time = 0.0
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.store = store
+
+        # Detection runs only on the ROI crop of each lane
+        lane_rois = lane_rois or [None] * len(video_urls)
+        self.lane_rois = [LaneROI(polygon) if polygon is not None else None for polygon in lane_rois]
+        self.vehicle_classes = dict(VEHICLE_CLASSES)
         self.vehicle_counts_at_change = [0] * len(video_urls)
 
+        # Static lanes skip detection and reuse their cached results
+        self.motion_gates = None
+        if motion_gate is not None:
+            self.motion_gates = [MotionGate(**motion_gate) for _ in video_urls]
+        self.lane_detection_time = 0.0
+
+        # Tracked lanes keep their vehicle ids between frames, so detection may skip frames
+        self.detect_every = max(1, detect_every)
+        if tracking is None and self.detect_every > 1:
+            tracking = {}
+        self.tracking = tracking
+        self.stop_lines = stop_lines or [None] * len(video_urls)
+        self.trackers = [None] * len(video_urls) if tracking is not None else None
+        self.frame_index = 0
+
         # Setup Firebase if credentials provided
-        self.firebase_manager = None
-        if firebase_credentials:
-            self.firebase_manager = FirebaseManager(firebase_credentials)
+        self.firebase_manager = firebase_manager
+        self.owns_firebase_manager = firebase_manager is None
+        if self.firebase_manager is None and firebase_credentials:
+            self.firebase_manager = FirebaseManager(firebase_credentials, metrics=self.metrics)
 
         # Setup YOLO model
-        self.yolov8_detector = YOLOv8(model_path, conf_thres=0.5, iou_thres=0.5)
+        self.yolov8_detector = detector
+        if self.yolov8_detector is None:
+            self.yolov8_detector = YOLOv8(model_path, conf_thres=0.5, iou_thres=0.5,
+                                          classes=self.vehicle_classes.keys(), metrics=self.metrics)
 
         # Setup video captures
         self.caps = self.setup_video_captures()
@@ -25,15 +144,29 @@ class TrafficMonitor:
         # Determine uniform frame size
         self.frame_width, self.frame_height = self.get_uniform_frame_size()
 
+        # Lanes are drawn straight into one preallocated grid canvas
+        self.renderer = None
+        if not headless:
+            self.renderer = GridRenderer(self.frame_width, self.frame_height, num_lanes=len(video_urls))
+
         # Initialize traffic light manager
-        self.traffic_light_manager = TrafficLightManager(firebase_manager=self.firebase_manager)
+        self.traffic_light_manager = TrafficLightManager(num_lanes=self.num_lanes,
+                                                         firebase_manager=self.firebase_manager,
+                                                         intersection_id=intersection_id,
+                                                         metrics=self.metrics,
+                                                         phase_groups=phase_groups, policy=policy, store=store)
+
+        self.captures = None
+        self.stopped = False
+        self.tick = 0
+        self.last_seqs = None
 
     def setup_video_captures(self):
         """Set up video captures with error handling"""
         caps = []
         for url in self.video_urls:
             try:
-                cap = cap_from_youtube(url, resolution='720p')
+                cap = open_source(url, target_fps=self.target_fps, resolution=self.resolution)
                 caps.append(cap)
             except Exception as e:
                 print(f"Error capturing video {url}: {e}")
@@ -57,43 +190,141 @@ class TrafficMonitor:
 
     def create_grid_frame(self, frames):
         """Create a grid frame from input frames"""
-        # Resize all frames to uniform size
-        resized_frames = [cv2.resize(frame, (self.frame_width, self.frame_height))
-                          for frame in frames]
+        # Frames that are already tiles of the grid canvas are not copied again
+        for i, frame in enumerate(frames):
+            if not np.shares_memory(frame, self.renderer.canvas):
+                self.renderer.draw_frame(i, frame)
 
-        # Create a 2x2 grid
-        top_row = np.hstack((resized_frames[0], resized_frames[1]))
-        bottom_row = np.hstack((resized_frames[2], resized_frames[3]))
+        return self.renderer.canvas
 
-        combined_frame = np.vstack((top_row, bottom_row))
+    def request_render(self):
+        """Render and show the next tick, whatever render_every is"""
+        self.render_requested = True
 
-        return combined_frame
+    def should_render(self, tick):
+        if self.headless:
+            return False
+        return self.render_requested or tick % self.render_every == 0
 
-    def process_lanes(self, frames):
+    def process_lanes(self, frames, render=None):
+        """Count, control the lights and draw the lanes (render None draws unless the monitor is headless)"""
+        if render is None:
+            render = self.renderer is not None
         detection_frames = []
         lane_counts = []
+        detection_counts = []
+        self.draw_time = 0.0
 
-        if  self.firebase_manager.is_need_sync('main_intersection'):
-            self.traffic_light_manager.switch_traffic_lights_immediately()
+        with self.metrics.timer('stage_seconds', stage='controller', intersection=self.intersection_id):
+            if self.firebase_manager and self.firebase_manager.consume_need_sync(self.intersection_id):
+                self.traffic_light_manager.switch_traffic_lights_immediately()
 
-        # Check if all lanes are ready to switch
-        if self.traffic_light_manager.update_timers():
-            self.traffic_light_manager.switch_traffic_lights()
+            # Check if all lanes are ready to switch
+            if self.traffic_light_manager.update_timers():
+                self.traffic_light_manager.switch_traffic_lights()
+
+        # Run inference for all lanes at once, on the ROI crops when lanes have one
+        with self.metrics.timer('stage_seconds', stage='detection', intersection=self.intersection_id):
+            crops = [roi.crop(frame) if roi else frame for frame, roi in zip(frames, self.lane_rois)]
+            lanes = self.get_detection_lanes()
+            detections = dict(zip(lanes, self.detect_lanes(crops, lanes)))
+            self.frame_index += 1
 
         for i, frame in enumerate(frames):
-            boxes, scores, class_ids = self.yolov8_detector(frame)
+            roi = self.lane_rois[i]
+            if i in detections:
+                boxes, scores, class_ids = detections[i]
+                if roi:
+                    boxes, scores, class_ids = roi.filter(frame.shape, boxes, scores, class_ids)
+                if self.trackers:
+                    boxes, scores, class_ids, _ = self.get_tracker(i, frame).update(boxes, scores, class_ids)
+            else:
+                # Lanes without detection on this frame are tracked lanes
+                boxes, scores, class_ids, _ = self.get_tracker(i, frame).predict()
+
             vehicle_count = sum(1 for class_id in class_ids if class_id in self.vehicle_classes)
             lane_counts.append(vehicle_count)
+            detection_counts.append(len(class_ids))
+            self.metrics.set('lane_vehicles', vehicle_count, intersection=self.intersection_id, lane=i + 1)
 
-            self.traffic_light_manager.update_lane(i + 1, vehicle_count)
             lane_status = self.traffic_light_manager.get_lane_status(i + 1)
 
-            detection_frame = self.yolov8_detector.draw_detections(frame)
-            self._draw_lane_info(detection_frame, i + 1, vehicle_count, lane_status)
-            detection_frames.append(detection_frame)
+            if render:
+                start = time.perf_counter()
+                detection_frame = self.renderer.draw_lane(i, frame, boxes, scores, class_ids)
+                if roi:
+                    self.renderer.draw_polygon(i, roi.get_points(*frame.shape[1::-1]), frame.shape)
+                self._draw_lane_info(detection_frame, i + 1, vehicle_count, lane_status)
+                detection_frames.append(detection_frame)
+                lane_draw_time = time.perf_counter() - start
+                self.draw_time += lane_draw_time
+                self.metrics.observe('lane_draw_seconds', lane_draw_time, intersection=self.intersection_id,
+                                     lane=i + 1)
+
+        self.traffic_light_manager.update_lanes(lane_counts)
+        if self.trackers:
+            unique_vehicles = [tracker.unique_count if tracker else 0 for tracker in self.trackers]
+            crossings = [tracker.crossing_count if tracker else 0 for tracker in self.trackers]
+            self.traffic_light_manager.update_flows(unique_vehicles, crossings)
+            for i, (unique, crossed) in enumerate(zip(unique_vehicles, crossings)):
+                self.metrics.set('lane_vehicles_seen', unique, intersection=self.intersection_id, lane=i + 1)
+                self.metrics.set('lane_stop_line_crossings', crossed, intersection=self.intersection_id, lane=i + 1)
+        if self.store:
+            self.store.append_counts(self.intersection_id, self.traffic_light_manager.clock(), lane_counts,
+                                     detection_counts)
 
         return detection_frames, lane_counts
 
+    def get_detection_lanes(self):
+        """Lanes that run detection on this frame, every lane unless detect_every skips frames"""
+        if self.detect_every == 1:
+            return list(range(self.num_lanes))
+        # The lanes take turns so that every frame runs about the same number of detections
+        return [i for i in range(self.num_lanes) if (self.frame_index + i) % self.detect_every == 0]
+
+    def get_tracker(self, lane, frame):
+        """Tracker of a lane, created on its first frame to scale the stop line to the frame size"""
+        tracker = self.trackers[lane]
+        if tracker is None:
+            stop_line = self.stop_lines[lane]
+            if stop_line is not None:
+                stop_line = np.array(stop_line, dtype=np.float64).reshape(2, 2) * frame.shape[1::-1]
+            tracker = self.trackers[lane] = Tracker(stop_line=stop_line, **self.tracking)
+        return tracker
+
+    def detect_lanes(self, crops, lanes):
+        """Detections of the crops of the given lanes, the motion gates reuse the cached ones of unchanged lanes"""
+        if not self.motion_gates:
+            return self.yolov8_detector.detect_batch([crops[i] for i in lanes])
+
+        changed = [i for i in lanes if self.motion_gates[i].needs_detection(crops[i])]
+        if changed:
+            start = time.perf_counter()
+            results = self.yolov8_detector.detect_batch([crops[i] for i in changed])
+            # Moving average of the detection time of one lane, to estimate the time saved by the cache
+            lane_time = (time.perf_counter() - start) / len(changed)
+            self.lane_detection_time = lane_time if not self.lane_detection_time \
+                else 0.9 * self.lane_detection_time + 0.1 * lane_time
+            for i, result in zip(changed, results):
+                self.motion_gates[i].update(result)
+
+        changed = set(changed)
+        for i in lanes:
+            if i in changed:
+                self.metrics.inc('lane_detections_total', intersection=self.intersection_id, lane=i + 1)
+            else:
+                self.motion_gates[i].add_saved_time(self.lane_detection_time)
+                self.metrics.inc('lane_detections_reused_total', intersection=self.intersection_id, lane=i + 1)
+        return [self.motion_gates[i].detections for i in lanes]
+
+    def get_motion_gate_stats(self):
+        """Per lane cache statistics of the motion gates, empty if they are disabled"""
+        return [gate.get_stats() for gate in self.motion_gates or []]
+
+    def get_tracker_stats(self):
+        """Per lane statistics of the trackers, empty if tracking is disabled"""
+        return [tracker.get_stats() if tracker else Tracker().get_stats() for tracker in self.trackers or []]
+
     def _draw_lane_info(self, frame, lane_number, vehicle_count, lane_status):
         cv2.putText(frame, f"Lane {lane_number}", (10, 30),
                     cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
@@ -108,30 +339,68 @@ class TrafficMonitor:
         cv2.putText(frame, f"{status} Light: {time_text}", (10, 110),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
 
-    def run(self):
-        """Main monitoring loop"""
-        cv2.namedWindow("Traffic Monitoring", cv2.WINDOW_NORMAL)
-
-        while all(cap.isOpened() for cap in self.caps):
-            # Check for quit
-            if cv2.waitKey(1) == ord('q'):
-                break
+    def start(self):
+        """Start the capture threads, call before step()"""
+        if not self.headless:
+            cv2.namedWindow("Traffic Monitoring", cv2.WINDOW_NORMAL)
 
-            # Read frames
-            frames = []
+        # Each lane is decoded on its own thread (or process), the loop always takes the newest frames
+        if self.capture_processes:
+            frame_shapes = [(int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+                            for cap in self.caps]
             for cap in self.caps:
-                ret, frame = cap.read()
-                if not ret:
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Reset video to the first frame
-                    ret, frame = cap.read()
-                    #break
-                frames.append(frame)
-
-            if len(frames) < 4:
-                break
-
-            # Process lanes
-            detection_frames, lane_counts = self.process_lanes(frames)
+                cap.release()
+            open_capture = functools.partial(open_source, target_fps=self.target_fps, resolution=self.resolution)
+            self.captures = ProcessCaptureGroup(self.video_urls[:len(frame_shapes)], frame_shapes,
+                                                open_capture=open_capture)
+        else:
+            self.captures = CaptureGroup(self.caps)
+        self.captures.wait_until_ready()
+
+        # Every lane needs a working capture
+        self.stopped = len(self.caps) < self.num_lanes
+        self.tick = 0
+        self.last_seqs = None
+        self.stats.reset()
+
+    def is_running(self):
+        return not self.stopped and self.captures is not None and self.captures.isOpened()
+
+    def step(self):
+        """
+        Run one tick of the monitoring loop
+
+        Returns:
+        bool: True if new frames were processed, False if no lane had a new frame yet
+        """
+        # Check for quit, 'r' renders the next tick in preview mode
+        if not self.headless:
+            key = cv2.waitKey(1)
+            if key == ord('q'):
+                self.stopped = True
+                return False
+            if key == ord('r'):
+                self.request_render()
+
+        # Read frames
+        tick_start = time.perf_counter()
+        ret, frames, seqs = self.captures.read()
+        if not ret or seqs == self.last_seqs:
+            return False
+        self.last_seqs = seqs
+        self.metrics.observe('stage_seconds', time.perf_counter() - tick_start, stage='capture',
+                             intersection=self.intersection_id)
+        for i, stats in enumerate(self.captures.get_stats()):
+            self.metrics.set('lane_frames_dropped', stats['frames_dropped'], intersection=self.intersection_id,
+                             lane=i + 1)
+
+        # Counting and light control run on every tick, rendering only when needed
+        render = self.should_render(self.tick)
+        detection_frames, lane_counts = self.process_lanes(frames, render=render)
+
+        render_time = None
+        if render:
+            start = time.perf_counter() - self.draw_time
 
             # Create grid frame
             combined_frame = self.create_grid_frame(detection_frames)
@@ -139,8 +408,52 @@ class TrafficMonitor:
             # Show frame
             cv2.resizeWindow("Traffic Monitoring", 1280, 720)
             cv2.imshow("Traffic Monitoring", combined_frame)
+            self.render_requested = False
+            render_time = time.perf_counter() - start
+            self.metrics.observe('stage_seconds', render_time, stage='render', intersection=self.intersection_id)
+
+        self.metrics.observe('stage_seconds', time.perf_counter() - tick_start, stage='tick',
+                             intersection=self.intersection_id)
+        self.stats.add_tick(render_time)
+        self.tick += 1
+        return True
+
+    def stop(self):
+        """Stop the capture threads and release everything started by start()"""
+        print(self.stats.format())
+        if self.captures:
+            for i, stats in enumerate(self.captures.get_stats()):
+                print(f"Lane {i + 1}: {stats['frames_read']} frames read, {stats['frames_dropped']} dropped")
+            self.captures.release()
+            self.captures = None
+        for i, stats in enumerate(self.get_motion_gate_stats()):
+            print(f"Lane {i + 1}: detections reused on {stats['hits']}/{stats['frames']} frames "
+                  f"({100 * stats['hit_rate']:.0f}%), {stats['forced_refreshes']} forced refreshes, "
+                  f"{stats['time_saved']:.1f} s of detection saved")
+        for i, stats in enumerate(self.get_tracker_stats()):
+            print(f"Lane {i + 1}: {stats['unique_count']} vehicles tracked, {stats['crossing_count']} crossed the "
+                  f"stop line, {stats['active_tracks']} active tracks")
+        if self.firebase_manager and self.owns_firebase_manager:
+            self.firebase_manager.close()
+        if not self.headless:
+            cv2.destroyAllWindows()
+
+    def run(self, max_ticks=None):
+        """Main monitoring loop"""
+        self.start()
+
+        last_report = time.perf_counter()
+        try:
+            while self.is_running() and (max_ticks is None or self.tick < max_ticks):
+                if not self.step():
+                    # No new frame on any lane yet
+                    time.sleep(0.001)
+
+                if time.perf_counter() - last_report >= self.stats_interval:
+                    print(self.stats.format())
+                    last_report = time.perf_counter()
+        except KeyboardInterrupt:
+            pass
 
         # Cleanup
-        for cap in self.caps:
-            cap.release()
-        cv2.destroyAllWindows()
\ No newline at end of file
+        self.stop()
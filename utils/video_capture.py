@@ -1,6 +1,14 @@
 # utils/video_capture.py
+import multiprocessing as mp
+import threading
+import time
+from collections import deque
+
 import cv2
 from cap_from_youtube import cap_from_youtube
+
+from .shared_frame_ring import SharedFrameRing
+
 def setup_video_capture(video_url, start_time=5, resolution='720p'):
     """
     Set up video capture from YouTube URL
@@ -19,4 +27,279 @@ def setup_video_capture(video_url, start_time=5, resolution='720p'):
     fps = cap.get(cv2.CAP_PROP_FPS)
     cap.set(cv2.CAP_PROP_POS_FRAMES, int(start_time * fps))
 
-    return cap
\ No newline at end of file
+    return cap
+
+
+def open_youtube_capture(video_url):
+    """Open a YouTube URL the way TrafficMonitor does (720p)"""
+    return cap_from_youtube(video_url, resolution='720p')
+
+
+class FramePacer:
+    """Sleep between frames so a file or VOD stream is read at its own FPS, like a live camera"""
+
+    def __init__(self, fps):
+        self.frame_interval = 1 / fps if fps and fps > 0 else 0
+        self.next_frame_time = time.perf_counter()
+
+    def wait(self, stop_event):
+        if not self.frame_interval:
+            return
+        self.next_frame_time += self.frame_interval
+        delay = self.next_frame_time - time.perf_counter()
+        if delay > 0:
+            stop_event.wait(delay)
+        elif delay < -self.frame_interval:
+            # Decoding fell behind, do not try to catch up with a burst of frames
+            self.next_frame_time = time.perf_counter()
+
+
+class ThreadedCapture:
+    """
+    Read frames from a cv2.VideoCapture on a background thread
+
+    Only the most recent frames are kept (latest frame wins), older ones are
+    dropped and counted, so a slow consumer never works on stale video and a
+    slow source never blocks the consumer.
+    """
+
+    def __init__(self, cap, buffer_size=1, loop=True, realtime=True):
+        """
+        Args:
+        cap (cv2.VideoCapture): Opened video capture, owned by this object from now on
+        buffer_size (int): Number of frames kept before the oldest one is dropped
+        loop (bool): Rewind to the first frame at the end of the stream
+        realtime (bool): Pace reading to the FPS reported by the source, so files
+                         and VOD streams play like a live camera
+        """
+        self.cap = cap
+        self.loop = loop
+        self.buffer = deque(maxlen=buffer_size)
+        self.lock = threading.Lock()
+
+        self.pacer = FramePacer(cap.get(cv2.CAP_PROP_FPS) if realtime else 0)
+
+        # Statistics
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.rewinds = 0
+
+        self.last_frame = None
+        self.last_seq = -1
+        self.ended = False
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._reader, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _reader(self):
+        while not self.stop_event.is_set():
+            ret, frame = self.cap.read()
+            if not ret and self.loop:
+                # Reset video to the first frame
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                self.rewinds += 1
+                ret, frame = self.cap.read()
+            if not ret:
+                break
+
+            with self.lock:
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.frames_dropped += 1
+                self.buffer.append((self.frames_read, frame))
+                self.frames_read += 1
+
+            self.pacer.wait(self.stop_event)
+
+        self.ended = True
+        if self.stop_event.is_set():
+            # release() did not wait for a read blocked in the capture, it is released once the read returns
+            self.cap.release()
+
+    def read(self):
+        """
+        Get the newest frame without blocking
+
+        Returns:
+        tuple: (ret, frame, seq), the last frame is returned again when no new one arrived
+        """
+        with self.lock:
+            if self.buffer:
+                # Frames older than the newest one are never looked at
+                self.frames_dropped += len(self.buffer) - 1
+                self.last_seq, self.last_frame = self.buffer[-1]
+                self.buffer.clear()
+
+        return self.last_frame is not None, self.last_frame, self.last_seq
+
+    def isOpened(self):
+        return not self.ended and self.cap.isOpened()
+
+    def get(self, prop_id):
+        return self.cap.get(prop_id)
+
+    def release(self):
+        """Stop the reader thread, the capture is released by the thread itself if it is still reading"""
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=1)
+        if not self.thread.is_alive():
+            self.cap.release()
+
+
+class CaptureGroup:
+    """Threaded captures for several lanes, read together as one set of frames"""
+
+    def __init__(self, caps, buffer_size=1, loop=True, realtime=True):
+        self.captures = [ThreadedCapture(cap, buffer_size, loop, realtime).start() for cap in caps]
+
+    def __len__(self):
+        return len(self.captures)
+
+    def wait_until_ready(self, timeout=10.0):
+        """Block until every lane produced its first frame, returns False on timeout"""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if all(capture.frames_read > 0 for capture in self.captures):
+                return True
+            if not self.isOpened():
+                return False
+            time.sleep(0.01)
+        return False
+
+    def read(self):
+        """
+        Take the newest frame of every lane without blocking
+
+        Returns:
+        tuple: (ret, frames, seqs), ret is False until every lane has a frame
+        """
+        results = [capture.read() for capture in self.captures]
+        frames = [frame for _, frame, _ in results]
+        seqs = [seq for _, _, seq in results]
+        return all(ret for ret, _, _ in results), frames, seqs
+
+    def isOpened(self):
+        return all(capture.isOpened() for capture in self.captures)
+
+    def get_stats(self):
+        return [{
+            'frames_read': capture.frames_read,
+            'frames_dropped': capture.frames_dropped,
+            'rewinds': capture.rewinds,
+        } for capture in self.captures]
+
+    def release(self):
+        for capture in self.captures:
+            capture.release()
+
+
+def run_capture_process(source, ring, open_capture, loop, realtime, stop_event):
+    """Capture process: decode one source straight into its shared memory ring"""
+    cap = open_capture(source)
+    pacer = FramePacer(cap.get(cv2.CAP_PROP_FPS) if realtime else 0)
+    try:
+        while not stop_event.is_set():
+            ret, _ = ring.read_from_capture(cap)
+            if not ret and loop:
+                # Reset video to the first frame
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, _ = ring.read_from_capture(cap)
+            if not ret:
+                break
+            pacer.wait(stop_event)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close_writer()
+        cap.release()
+        ring.close()
+
+
+class ProcessCaptureGroup:
+    """
+    Capture every lane in its own process, frames come back through shared memory
+
+    Same interface as CaptureGroup. The frames returned by read() are read-only
+    views of shared memory, valid until the next read() or release().
+    """
+
+    def __init__(self, sources, frame_shapes, open_capture=open_youtube_capture, slots=4, loop=True,
+                 realtime=True):
+        context = mp.get_context('spawn')
+        self.rings = [SharedFrameRing(shape, slots=slots, lock=context.Lock()) for shape in frame_shapes]
+        self.stop_event = context.Event()
+        self.processes = [context.Process(target=run_capture_process, name=f"capture-{i}",
+                                          args=(source, ring, open_capture, loop, realtime, self.stop_event),
+                                          daemon=True)
+                          for i, (source, ring) in enumerate(zip(sources, self.rings))]
+        for process in self.processes:
+            process.start()
+
+        self.handles = [None] * len(self.rings)
+        self.frames_consumed = [0] * len(self.rings)
+
+    def __len__(self):
+        return len(self.rings)
+
+    def wait_until_ready(self, timeout=30.0):
+        """Block until every lane produced its first frame, returns False on timeout"""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if all(ring.get_stats()['frames_written'] > 0 for ring in self.rings):
+                return True
+            if not self.isOpened():
+                return False
+            time.sleep(0.01)
+        return False
+
+    def read(self):
+        """
+        Take the newest frame of every lane without blocking or copying
+
+        Returns:
+        tuple: (ret, frames, seqs), ret is False until every lane has a frame
+        """
+        for i, ring in enumerate(self.rings):
+            previous = self.handles[i]
+            handle = ring.acquire_latest(previous.seq if previous else -1)
+            if handle is not None:
+                if previous:
+                    previous.release()
+                self.handles[i] = handle
+                self.frames_consumed[i] += 1
+
+        ret = all(handle is not None for handle in self.handles)
+        frames = [handle.frame if handle else None for handle in self.handles]
+        seqs = [handle.seq if handle else -1 for handle in self.handles]
+        return ret, frames, seqs
+
+    def isOpened(self):
+        return all(process.is_alive() and not ring.writer_closed
+                   for process, ring in zip(self.processes, self.rings))
+
+    def get_stats(self):
+        stats = []
+        for ring, consumed in zip(self.rings, self.frames_consumed):
+            ring_stats = ring.get_stats()
+            stats.append({
+                'frames_read': ring_stats['frames_written'],
+                # Frames overwritten before the consumer looked at them, plus frames no slot was free for
+                'frames_dropped': ring_stats['frames_written'] - consumed + ring_stats['frames_dropped'],
+            })
+        return stats
+
+    def release(self):
+        self.stop_event.set()
+        for i, handle in enumerate(self.handles):
+            if handle:
+                handle.release()
+            self.handles[i] = None
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for ring in self.rings:
+            ring.close()
@@ -0,0 +1,259 @@
+# utils/video_source.py
+import os
+import re
+import threading
+
+import cv2
+import numpy as np
+
+MAX_RECONNECT_DELAY = 30
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+# imread flags that decode a JPEG directly at a fraction of its size
+REDUCED_READ_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                      (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def get_source_kind(uri):
+    """'youtube', 'stream', 'camera', 'images' or 'file'"""
+    if isinstance(uri, int) or (isinstance(uri, str) and uri.isdigit()):
+        return 'camera'
+    if 'youtube.com/' in uri or 'youtu.be/' in uri:
+        return 'youtube'
+    if uri.split('://')[0].lower() in ('rtsp', 'rtmp', 'http', 'https', 'udp', 'tcp'):
+        return 'stream'
+    if os.path.isdir(uri):
+        return 'images'
+    return 'file'
+
+
+def get_stream_height(stream):
+    """Height of a listed YouTube stream, from its label ('720p', '720p60') when the format has none"""
+    if stream.height:
+        return int(stream.height)
+    match = re.match(r'(\d+)p', str(stream.resolution))
+    return int(match.group(1)) if match else 0
+
+
+def open_youtube(url, resolution=None):
+    """Open the smallest YouTube stream at least resolution pixels high (the best one if None)"""
+    from cap_from_youtube import list_video_streams
+
+    # The streams are listed once and the chosen one is opened by its URL, a single yt-dlp extraction
+    streams, _ = list_video_streams(url)
+    if not streams:
+        raise IOError(f"No video stream found for {url}")
+    if resolution is None:
+        stream = streams[-1]
+    else:
+        # The 30 FPS stream comes before the 60 FPS one of the same height ('720p' < '720p60')
+        candidates = [stream for stream in streams if get_stream_height(stream) >= resolution]
+        if candidates:
+            stream = min(candidates, key=lambda stream: (get_stream_height(stream), str(stream.resolution)))
+        else:
+            stream = max(streams, key=lambda stream: (get_stream_height(stream), str(stream.resolution)))
+    return cv2.VideoCapture(stream.url)
+
+
+class ImageDirectoryCapture:
+    """cv2.VideoCapture look-alike reading the images of a directory in name order"""
+
+    def __init__(self, path, fps=10.0, resolution=None):
+        """
+        Args:
+        path (str): Directory with the images
+        fps (float): Frame rate reported to the pacing code
+        resolution (int): JPEGs are decoded at 1/2, 1/4 or 1/8 size when that is still at least this high
+        """
+        self.paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.lower().endswith(IMAGE_EXTENSIONS))
+        self.fps = fps
+        self.position = 0
+        self.read_flag = cv2.IMREAD_COLOR
+
+        self.width = self.height = 0
+        if self.paths:
+            first = cv2.imread(self.paths[0])
+            self.height, self.width = first.shape[:2]
+            if resolution:
+                for factor, flag in REDUCED_READ_FLAGS:
+                    if self.height // factor >= resolution:
+                        self.read_flag = flag
+                        self.height, self.width = -(-self.height // factor), -(-self.width // factor)
+                        break
+
+    def grab(self):
+        if self.position >= len(self.paths):
+            return False
+        self.position += 1
+        return True
+
+    def retrieve(self, image=None):
+        frame = cv2.imread(self.paths[self.position - 1], self.read_flag)
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get(self, prop_id):
+        return {cv2.CAP_PROP_FPS: self.fps, cv2.CAP_PROP_FRAME_COUNT: len(self.paths),
+                cv2.CAP_PROP_POS_FRAMES: self.position, cv2.CAP_PROP_FRAME_WIDTH: self.width,
+                cv2.CAP_PROP_FRAME_HEIGHT: self.height}.get(prop_id, 0)
+
+    def set(self, prop_id, value):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(min(max(value, 0), len(self.paths)))
+            return True
+        return False
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def release(self):
+        self.paths = []
+
+
+class VideoSource:
+    """
+    cv2.VideoCapture-like input (file, stream, camera, image directory or YouTube URL)
+    with frame skipping to target_fps, a decode-time resolution hint and reconnects
+    of network sources
+    """
+
+    def __init__(self, uri, target_fps=None, resolution=None, reconnect=True, max_retries=None):
+        """
+        Args:
+        uri (str): Path, URL, image directory or camera index
+        target_fps (float): Frames per second actually processed, None keeps every frame
+        resolution (int): Preferred frame height at decode time
+        reconnect (bool): Reopen network sources when they fail, but not a video of known length that ended
+        max_retries (int): Failed reconnects in a row before giving up, None retries forever
+        """
+        self.uri = uri
+        self.kind = get_source_kind(uri)
+        self.target_fps = target_fps
+        self.resolution = resolution
+        self.reconnect = reconnect and self.kind in ('stream', 'youtube')
+        self.max_retries = max_retries
+        self.stop_event = threading.Event()
+
+        # Statistics
+        self.frames_skipped = 0
+        self.reconnects = 0
+
+        # Source frames per output frame, and the fractional part carried between reads
+        self.frame_step = 1.0
+        self.step_credit = 0.0
+
+        self.cap = self._open()
+        self._update_frame_step()
+
+    def _open(self):
+        if self.kind == 'youtube':
+            return open_youtube(self.uri, self.resolution)
+        if self.kind == 'images':
+            return ImageDirectoryCapture(self.uri, fps=self.target_fps or 10.0, resolution=self.resolution)
+        if self.kind == 'camera':
+            cap = cv2.VideoCapture(int(self.uri))
+            if self.resolution:
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution)
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution * 16 // 9)
+            return cap
+        if self.kind == 'stream':
+            cap = cv2.VideoCapture(self.uri, cv2.CAP_FFMPEG)
+            # Live streams should not pile frames up in the backend
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            return cap
+        return cv2.VideoCapture(self.uri)
+
+    def _update_frame_step(self):
+        source_fps = self.cap.get(cv2.CAP_PROP_FPS)
+        if self.target_fps and source_fps and source_fps > self.target_fps:
+            self.frame_step = source_fps / self.target_fps
+        else:
+            self.frame_step = 1.0
+
+    def _reopen(self):
+        """Reopen a failed network source with an exponential backoff, returns False when giving up"""
+        failures = 0
+        while not self.stop_event.is_set():
+            delay = min(2 ** failures, MAX_RECONNECT_DELAY)
+            print(f"Video source {self.uri} failed, reconnecting in {delay}s")
+            if self.stop_event.wait(delay):
+                return False
+
+            self.cap.release()
+            try:
+                self.cap = self._open()
+            except Exception as e:
+                print(f"Error reopening video source {self.uri}: {e}")
+            if self.cap.isOpened():
+                self.reconnects += 1
+                self._update_frame_step()
+                return True
+
+            failures += 1
+            if self.max_retries is not None and failures >= self.max_retries:
+                return False
+        return False
+
+    def _at_end(self):
+        """True when a video with a known frame count has been read to the end, live streams never end"""
+        frame_count = self.cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        return frame_count > 0 and self.cap.get(cv2.CAP_PROP_POS_FRAMES) >= frame_count - 1
+
+    def grab(self):
+        return self.cap.grab()
+
+    def retrieve(self, image=None):
+        return self.cap.retrieve(image)
+
+    def read(self, image=None):
+        """Next frame at the target FPS, the frames in between are grabbed but never retrieved"""
+        self.step_credit += self.frame_step
+        advance = int(self.step_credit)
+        self.step_credit -= advance
+
+        while True:
+            ret = True
+            for _ in range(advance - 1):
+                ret = self.cap.grab()
+                if not ret:
+                    break
+                self.frames_skipped += 1
+            if ret:
+                ret, frame = self.cap.read(image)
+                if ret:
+                    return True, frame
+
+            if not self.reconnect or self._at_end() or not self._reopen():
+                return False, None
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FPS:
+            # The pacing code sees the rate frames actually come out at
+            return self.cap.get(prop_id) / self.frame_step
+        return self.cap.get(prop_id)
+
+    def set(self, prop_id, value):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            self.step_credit = 0.0
+        return self.cap.set(prop_id, value)
+
+    def isOpened(self):
+        return self.cap.isOpened() or (self.reconnect and not self.stop_event.is_set())
+
+    def release(self):
+        self.stop_event.set()
+        self.cap.release()
+
+
+def open_source(uri, target_fps=None, resolution=None, reconnect=True):
+    """Open a lane source, see VideoSource. Module level so capture processes can pickle it"""
+    return VideoSource(uri, target_fps=target_fps, resolution=resolution, reconnect=reconnect)
@@ -1,5 +1,10 @@
 # main.py
+import argparse
+
 from utils import TrafficMonitor
+from utils.metrics import REGISTRY, MetricsServer
+from utils.scheduling_policy import POLICIES, make_policy
+from utils.timeseries_store import TimeSeriesStore
 
 video = [
     'https://www.youtube.com/watch?v=SYJQZFVGh90', # 0
@@ -29,6 +34,38 @@ video = [
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Smart traffic light control")
+    parser.add_argument('--headless', action='store_true',
+                        help="no window and no drawing, only counting and light control")
+    parser.add_argument('--render-every', type=int, default=1,
+                        help="preview mode: render and show the grid every N ticks (press 'r' to render now)")
+    parser.add_argument('--capture-processes', action='store_true',
+                        help="decode every lane in its own process, frames are shared through shared memory")
+    parser.add_argument('--target-fps', type=float, default=None,
+                        help="frames per second processed per lane, skipped frames are never converted or copied")
+    parser.add_argument('--resolution', type=int, default=720,
+                        help="preferred frame height at decode time (YouTube stream, camera, image directory)")
+    parser.add_argument('--policy', default='reward', choices=list(POLICIES),
+                        help="light scheduling: reward (odd/even lanes in turn, reward rule) or max_pressure "
+                             "(queue discharge with lookahead)")
+    parser.add_argument('--store', default=None,
+                        help="keep the lane counts and light changes in this SQLite file (see lane_history.py)")
+    parser.add_argument('--motion-gate', action='store_true',
+                        help="reuse the last detections of a lane while its frame does not change")
+    parser.add_argument('--motion-refresh', type=int, default=30,
+                        help="with --motion-gate, run detection at least every N frames of a lane")
+    parser.add_argument('--track', action='store_true',
+                        help="count the tracked vehicles of each lane instead of the detections of every frame")
+    parser.add_argument('--detect-every', type=int, default=1,
+                        help="run detection on every Nth frame of a lane, the tracker predicts the others (implies "
+                             "--track)")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics (and /metrics.json, /profiler)")
+    args = parser.parse_args()
+
+    metrics_server = MetricsServer(REGISTRY, port=args.metrics_port) if args.metrics_port else None
+    store = TimeSeriesStore(args.store) if args.store else None
+
     # Video URLs for 4 lanes
     video_urls = [
         video[2],
@@ -37,13 +74,33 @@ def main():
         video[8],
     ]
 
+    # Optional lane polygons, (x, y) normalized to the frame size, None to use the whole frame
+    # e.g. [(0.35, 0.3), (0.65, 0.3), (1.0, 1.0), (0.0, 1.0)]
+    lane_rois = [None, None, None, None]
+
+    # Optional stop line per lane, two (x, y) points normalized to the frame size, counted when tracking
+    # e.g. [(0.0, 0.8), (1.0, 0.8)]
+    stop_lines = [None, None, None, None]
+
     # Path to YOLO model
     model_path = "models/yolov8m.onnx"
     firebase_credentials = "credential/smart-traffic-light-03-firebase-adminsdk-mzf6v-45aa726e71.json"
 
     # Create and run traffic monitor
-    monitor = TrafficMonitor(video_urls, model_path, firebase_credentials)
+    monitor = TrafficMonitor(video_urls, model_path, firebase_credentials,
+                             headless=args.headless, render_every=args.render_every, lane_rois=lane_rois,
+                             capture_processes=args.capture_processes, target_fps=args.target_fps,
+                             resolution=args.resolution, policy=make_policy(args.policy), store=store,
+                             motion_gate={'refresh_interval': args.motion_refresh} if args.motion_gate else None,
+                             tracking={} if args.track else None, detect_every=args.detect_every,
+                             stop_lines=stop_lines)
     monitor.run()
 
+    if store:
+        store.close()
+
+    if metrics_server:
+        metrics_server.close()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
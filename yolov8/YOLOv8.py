@@ -1,16 +1,26 @@
 import time
 import cv2
 import numpy as np
-import onnxruntime
 
 from yolov8.utils import xywh2xyxy, draw_detections, multiclass_nms
+from yolov8.preprocessing import Preprocessor
+from yolov8.session import SessionConfig, BoundSession, create_session
 
 
 class YOLOv8:
 
-    def __init__(self, path, conf_thres=0.7, iou_thres=0.5):
+    def __init__(self, path, conf_thres=0.7, iou_thres=0.5, letterbox=False, classes=None, session_config=None,
+                 metrics=None):
         self.conf_threshold = conf_thres
         self.iou_threshold = iou_thres
+        self.letterbox = letterbox
+        self.session_config = session_config or SessionConfig()
+
+        # Optional registry with observe(name, seconds, **labels), e.g. utils.metrics.MetricsRegistry
+        self.metrics = metrics
+
+        # Optional class whitelist, only these class scores are decoded from the model output
+        self.classes = None if classes is None else np.array(sorted(classes), dtype=np.int64)
 
         # Initialize model
         self.initialize_model(path)
@@ -19,12 +29,20 @@ class YOLOv8:
         return self.detect_objects(image)
 
     def initialize_model(self, path):
-        self.session = onnxruntime.InferenceSession(path,
-                                                    providers=onnxruntime.get_available_providers())
+        self.session, self.startup_time, self.optimized_model_cached = create_session(path, self.session_config)
         # Get model info
         self.get_input_details()
         self.get_output_details()
 
+        # IOBinding runs write into output buffers reused across calls
+        self.bound_session = None
+        if self.session_config.io_binding:
+            self.bound_session = BoundSession(self.session, self.input_names[0], self.output_names)
+
+        # Preprocessing writes into a reused input buffer
+        self.preprocessor = Preprocessor(self.input_width, self.input_height, letterbox=self.letterbox)
+        self.input_buffer = np.empty((self.batch_size, 3, self.input_height, self.input_width), dtype=np.float32)
+
 
     def detect_objects(self, image):
         input_tensor = self.prepare_input(image)
@@ -36,45 +54,101 @@ class YOLOv8:
 
         return self.boxes, self.scores, self.class_ids
 
+    def detect_batch(self, images):
+        """Detect objects on several images with as few session.run calls as possible
+
+        Args:
+        images (list): BGR images, they may have different resolutions
+
+        Returns:
+        list: (boxes, scores, class_ids) tuple for each image
+        """
+        if len(images) == 0:
+            return []
+
+        image_sizes = [image.shape[:2] for image in images]
+
+        # Models exported with a fixed batch size must be fed in chunks of that size
+        preprocess_start = time.perf_counter()
+        chunk_size = len(images) if self.dynamic_batch else self.batch_size
+        num_chunks = -(-len(images) // chunk_size)
+        input_tensor = self.get_input_buffer(num_chunks * chunk_size)
+        for i, image in enumerate(images):
+            self.preprocessor(image, out=input_tensor[i])
+        self.observe('preprocess', preprocess_start)
+
+        # Each chunk is post-processed before the next run, which may reuse the output buffers
+        results = []
+        for start in range(0, len(images), chunk_size):
+            chunk = input_tensor[start:start + chunk_size]
+            num_images = min(chunk_size, len(images) - start)
+            outputs = self.inference(chunk)[0]
+
+            # Post-process each image with its own rescale factors
+            postprocess_start = time.perf_counter()
+            for i in range(num_images):
+                self.img_height, self.img_width = image_sizes[start + i]
+                results.append(self.process_output([outputs[i]]))
+            self.observe('postprocess', postprocess_start)
+
+        self.boxes, self.scores, self.class_ids = results[-1]
+        return results
+
+    def get_input_buffer(self, batch_size):
+        # Grow the preallocated input buffer when a larger batch is requested
+        if self.input_buffer.shape[0] < batch_size:
+            self.input_buffer = np.empty((batch_size, 3, self.input_height, self.input_width), dtype=np.float32)
+        return self.input_buffer[:batch_size]
+
     def prepare_input(self, image):
         self.img_height, self.img_width = image.shape[:2]
 
-        input_img = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-        # Resize input image
-        input_img = cv2.resize(input_img, (self.input_width, self.input_height))
-
-        # Scale input pixel values to 0 to 1
-        input_img = input_img / 255.0
-        input_img = input_img.transpose(2, 0, 1)
-        input_tensor = input_img[np.newaxis, :, :, :].astype(np.float32)
+        # Resize, BGR->RGB, 0..1 scaling and NCHW layout straight into the input buffer
+        input_tensor = self.get_input_buffer(self.batch_size)
+        self.preprocessor(image, out=input_tensor[0])
 
         return input_tensor
 
 
     def inference(self, input_tensor):
         start = time.perf_counter()
-        outputs = self.session.run(self.output_names, {self.input_names[0]: input_tensor})
+        if self.bound_session is not None:
+            outputs = self.bound_session.run(input_tensor)
+        else:
+            outputs = self.session.run(self.output_names, {self.input_names[0]: input_tensor})
 
-        # print(f"Inference time: {(time.perf_counter() - start)*1000:.2f} ms")
+        self.observe('inference', start)
         return outputs
 
+    def observe(self, stage, start):
+        if self.metrics is not None:
+            self.metrics.observe('detector_stage_seconds', time.perf_counter() - start, stage=stage)
+
     def process_output(self, output):
-        predictions = np.squeeze(output[0]).T
+        # Raw output is (4 + num_classes, num_anchors), it is read in place without transposing
+        predictions = np.squeeze(output[0])
+
+        # The best class is taken over all classes, so an anchor whose top class is not
+        # whitelisted is dropped rather than reported as its best whitelisted class
+        class_scores = predictions[4:]
 
         # Filter out object confidence scores below threshold
-        scores = np.max(predictions[:, 4:], axis=1)
-        predictions = predictions[scores > self.conf_threshold, :]
-        scores = scores[scores > self.conf_threshold]
+        scores = np.max(class_scores, axis=0)
+        keep = np.flatnonzero(scores > self.conf_threshold)
 
-        if len(scores) == 0:
+        # Get the class with the highest confidence, for the surviving anchors only
+        class_ids = np.argmax(class_scores[:, keep], axis=0)
+        if self.classes is not None:
+            whitelisted = np.isin(class_ids, self.classes)
+            keep, class_ids = keep[whitelisted], class_ids[whitelisted]
+
+        if len(keep) == 0:
             return [], [], []
 
-        # Get the class with the highest confidence
-        class_ids = np.argmax(predictions[:, 4:], axis=1)
+        scores = scores[keep]
 
-        # Get bounding boxes for each object
-        boxes = self.extract_boxes(predictions)
+        # Get bounding boxes for the surviving anchors only
+        boxes = self.extract_boxes(predictions[:4, keep].T)
 
         # Apply non-maxima suppression to suppress weak, overlapping bounding boxes
         # indices = nms(boxes, scores, self.iou_threshold)
@@ -96,11 +170,9 @@ class YOLOv8:
 
     def rescale_boxes(self, boxes):
 
-        # Rescale boxes to original image dimensions
-        input_shape = np.array([self.input_width, self.input_height, self.input_width, self.input_height])
-        boxes = np.divide(boxes, input_shape, dtype=np.float32)
-        boxes *= np.array([self.img_width, self.img_height, self.img_width, self.img_height])
-        return boxes
+        # Rescale boxes to original image dimensions (undoing the letterbox padding if used)
+        boxes = boxes.astype(np.float32)
+        return self.preprocessor.rescale_boxes(boxes, self.img_height, self.img_width)
 
     def draw_detections(self, image, draw_scores=True, mask_alpha=0.4):
 
@@ -112,6 +184,9 @@ class YOLOv8:
         self.input_names = [model_inputs[i].name for i in range(len(model_inputs))]
 
         self.input_shape = model_inputs[0].shape
+        # The batch dimension is a string (or None) when it was exported as dynamic
+        self.dynamic_batch = not isinstance(self.input_shape[0], int)
+        self.batch_size = 1 if self.dynamic_batch else self.input_shape[0]
         self.input_height = self.input_shape[2]
         self.input_width = self.input_shape[3]
 
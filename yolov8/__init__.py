@@ -1 +1,4 @@
 from .YOLOv8 import YOLOv8
+from .inference_server import InferenceServer
+from .session import SessionConfig
+from .tracker import Tracker
@@ -0,0 +1,207 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class InferenceRequest:
+
+    def __init__(self, client, images):
+        self.client = client
+        self.images = images
+        self.submit_time = time.perf_counter()
+        self.future = Future()
+
+
+class InferenceClient:
+    """Handle used by one requester (e.g. an intersection), it can replace a YOLOv8 detector"""
+
+    def __init__(self, server, name):
+        self.server = server
+        self.name = name
+        self.queue = deque()
+
+        # Statistics
+        self.requests = 0
+        self.frames = 0
+        self.total_wait = 0.0
+
+    def __call__(self, image):
+        return self.detect_batch([image])[0]
+
+    def submit(self, images):
+        """Queue images for detection, returns a Future of the list of (boxes, scores, class_ids)"""
+        return self.server.submit(self, list(images))
+
+    def detect_batch(self, images, timeout=None):
+        if len(images) == 0:
+            return []
+        return self.submit(images).result(timeout)
+
+    def close(self):
+        self.server.disconnect(self)
+
+
+class InferenceServer:
+    """
+    Shared YOLOv8 session serving many clients with dynamic micro-batching
+
+    Requests from all clients are merged into one detect_batch call as soon as
+    max_batch_size images are waiting or the oldest request has waited
+    max_delay seconds, whichever comes first. Clients are served round robin,
+    so a busy client cannot starve the others.
+    """
+
+    def __init__(self, detector, max_batch_size=8, max_delay=0.01):
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self.clients = []
+        self.next_client = 0
+        self.pending_frames = 0
+        self.condition = threading.Condition()
+
+        # Statistics
+        self.batches = 0
+        self.batched_frames = 0
+        self.max_queue_depth = 0
+        self.inference_time = 0.0
+
+        self.stopped = False
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def connect(self, name):
+        with self.condition:
+            client = InferenceClient(self, name)
+            self.clients.append(client)
+            return client
+
+    def disconnect(self, client):
+        with self.condition:
+            if client in self.clients:
+                self.clients.remove(client)
+            for request in client.queue:
+                request.future.cancel()
+            self.pending_frames -= sum(len(request.images) for request in client.queue)
+            client.queue.clear()
+
+    def submit(self, client, images):
+        request = InferenceRequest(client, images)
+        with self.condition:
+            if self.stopped:
+                raise RuntimeError("Inference server is stopped")
+            client.queue.append(request)
+            self.pending_frames += len(images)
+            self.max_queue_depth = max(self.max_queue_depth, self.pending_frames)
+            self.condition.notify_all()
+        return request.future
+
+    def _oldest_submit_time(self):
+        return min(client.queue[0].submit_time for client in self.clients if client.queue)
+
+    def _take_batch(self):
+        """Take whole requests round robin across clients until the batch is full"""
+        batch = []
+        num_frames = 0
+        order = self.clients[self.next_client:] + self.clients[:self.next_client]
+
+        progress = True
+        while progress and num_frames < self.max_batch_size:
+            progress = False
+            for client in order:
+                if not client.queue:
+                    continue
+                request_frames = len(client.queue[0].images)
+                # A request larger than max_batch_size is still sent, alone
+                if batch and num_frames + request_frames > self.max_batch_size:
+                    continue
+                batch.append(client.queue.popleft())
+                num_frames += request_frames
+                progress = True
+
+        # The next batch starts with the client after the first one served now
+        if batch and batch[0].client in self.clients:
+            self.next_client = (self.clients.index(batch[0].client) + 1) % len(self.clients)
+        self.pending_frames -= num_frames
+        return batch
+
+    def _serve(self):
+        while True:
+            with self.condition:
+                while not self.stopped and self.pending_frames == 0:
+                    self.condition.wait()
+                if self.stopped and self.pending_frames == 0:
+                    return
+
+                # Wait for a full batch, but never past the oldest request's deadline
+                deadline = self._oldest_submit_time() + self.max_delay
+                while not self.stopped and self.pending_frames < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                batch = self._take_batch()
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        images = [image for request in batch for image in request.images]
+        start = time.perf_counter()
+        try:
+            results = self.detector.detect_batch(images)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        end = time.perf_counter()
+
+        self.batches += 1
+        self.batched_frames += len(images)
+        self.inference_time += end - start
+
+        offset = 0
+        for request in batch:
+            num_images = len(request.images)
+            client = request.client
+            client.requests += 1
+            client.frames += num_images
+            client.total_wait += start - request.submit_time
+            request.future.set_result(results[offset:offset + num_images])
+            offset += num_images
+
+    def get_stats(self):
+        """Queue depth, batching and per-client fairness metrics"""
+        with self.condition:
+            clients = list(self.clients)
+            queue_depth = self.pending_frames
+        total_frames = sum(client.frames for client in clients) or 1
+        return {
+            'queue_depth': queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'batches': self.batches,
+            'mean_batch_size': self.batched_frames / self.batches if self.batches else 0.0,
+            'mean_inference_ms': 1000 * self.inference_time / self.batches if self.batches else 0.0,
+            'clients': {
+                client.name: {
+                    'requests': client.requests,
+                    'frames': client.frames,
+                    'pending_requests': len(client.queue),
+                    'mean_wait_ms': 1000 * client.total_wait / client.requests if client.requests else 0.0,
+                    'share': client.frames / total_frames,
+                } for client in clients
+            },
+        }
+
+    def close(self):
+        """Serve what is queued, then stop the server thread"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
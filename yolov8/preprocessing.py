@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+
+PAD_VALUE = 114
+
+
+class Preprocessor:
+    """Fill a float32 NCHW input buffer in place from BGR frames
+
+    The resize writes into a reused uint8 canvas and a single pass per channel
+    does the BGR->RGB swap, the HWC->CHW transpose and the 0..1 normalization,
+    so no full-frame temporary arrays are created per frame.
+    """
+
+    def __init__(self, input_width, input_height, letterbox=False, pad_value=PAD_VALUE):
+        self.input_width = input_width
+        self.input_height = input_height
+        self.letterbox = letterbox
+        self.pad_value = pad_value
+
+        self.canvas = np.full((input_height, input_width, 3), pad_value, dtype=np.uint8)
+        self.canvas_resolution = None
+
+        # (img_height, img_width) -> (scale_x, scale_y, pad_x, pad_y, new_width, new_height)
+        self.transforms = {}
+
+    def get_transform(self, img_height, img_width):
+        """Scale and padding used to map an image of the given size to the model input"""
+        key = (img_height, img_width)
+        transform = self.transforms.get(key)
+        if transform is None:
+            if self.letterbox:
+                scale = min(self.input_width / img_width, self.input_height / img_height)
+                new_width = int(round(img_width * scale))
+                new_height = int(round(img_height * scale))
+                pad_x = (self.input_width - new_width) // 2
+                pad_y = (self.input_height - new_height) // 2
+                transform = (scale, scale, pad_x, pad_y, new_width, new_height)
+            else:
+                transform = (self.input_width / img_width, self.input_height / img_height,
+                             0, 0, self.input_width, self.input_height)
+            self.transforms[key] = transform
+        return transform
+
+    def __call__(self, image, out=None):
+        """Write the preprocessed image into out, a (3, input_height, input_width) float32 array"""
+        if out is None:
+            out = np.empty((3, self.input_height, self.input_width), dtype=np.float32)
+
+        img_height, img_width = image.shape[:2]
+        _, _, pad_x, pad_y, new_width, new_height = self.get_transform(img_height, img_width)
+
+        # Only repaint the padding when the source resolution changes
+        if self.letterbox and self.canvas_resolution != (img_height, img_width):
+            self.canvas.fill(self.pad_value)
+            self.canvas_resolution = (img_height, img_width)
+
+        # Resize straight into the canvas (or its letterbox region)
+        cv2.resize(image, (new_width, new_height),
+                   dst=self.canvas[pad_y:pad_y + new_height, pad_x:pad_x + new_width],
+                   interpolation=cv2.INTER_LINEAR)
+
+        # BGR -> RGB, HWC -> CHW and scaling to 0..1 in one pass per channel
+        for channel in range(3):
+            np.multiply(self.canvas[:, :, 2 - channel], np.float32(1 / 255.0), out=out[channel])
+
+        return out
+
+    def rescale_boxes(self, boxes, img_height, img_width):
+        """Map xywh boxes from model input coordinates back to the original image, in place"""
+        scale_x, scale_y, pad_x, pad_y, _, _ = self.get_transform(img_height, img_width)
+        boxes[:, 0] -= pad_x
+        boxes[:, 1] -= pad_y
+        boxes[:, [0, 2]] /= scale_x
+        boxes[:, [1, 3]] /= scale_y
+        return boxes
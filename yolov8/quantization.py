@@ -0,0 +1,174 @@
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import onnx
+import onnxruntime
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                      quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from yolov8.preprocessing import Preprocessor
+
+# Nodes of the Detect head in models exported by ultralytics. The head concatenates
+# box coordinates (0..640) with class scores (0..1), one INT8 scale for both would
+# wipe out the scores, so it stays in FP32.
+DETECT_HEAD_PREFIX = '/model.22/'
+
+
+def sample_frames(video_paths, num_frames, offset=0.0):
+    """
+    Take frames evenly spread over the videos
+
+    Args:
+    video_paths (list): Recorded lane videos
+    num_frames (int): Total number of frames, split evenly between the videos
+    offset (float): Shift of the sampling positions in steps (0..1), e.g. 0.5 gives
+                    frames between the ones sampled with 0.0
+
+    Returns:
+    list: BGR frames
+    """
+    frames = []
+    per_video = -(-num_frames // len(video_paths))
+    for path in video_paths:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise IOError(f"Could not open video {path}")
+
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        step = max(frame_count / per_video, 1.0)
+        positions = sorted({int((i + offset) * step) for i in range(per_video) if (i + offset) * step < frame_count})
+        for position in positions:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+            ret, frame = cap.read()
+            if ret:
+                frames.append(frame)
+        cap.release()
+    return frames[:num_frames]
+
+
+class FrameCalibrationReader(CalibrationDataReader):
+    """Feed lane frames to the calibrator, preprocessed exactly like YOLOv8 does at run time"""
+
+    def __init__(self, model_path, frames, letterbox=False):
+        session = onnxruntime.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch_size = model_input.shape[0] if isinstance(model_input.shape[0], int) else 1
+        input_height, input_width = model_input.shape[2:4]
+
+        preprocessor = Preprocessor(input_width, input_height, letterbox=letterbox)
+        self.batches = []
+        for start in range(0, len(frames) - batch_size + 1, batch_size):
+            input_tensor = np.empty((batch_size, 3, input_height, input_width), dtype=np.float32)
+            for i, frame in enumerate(frames[start:start + batch_size]):
+                preprocessor(frame, out=input_tensor[i])
+            self.batches.append(input_tensor)
+        self.position = 0
+
+    def get_next(self):
+        if self.position >= len(self.batches):
+            return None
+        self.position += 1
+        return {self.input_name: self.batches[self.position - 1]}
+
+    def rewind(self):
+        self.position = 0
+
+
+def quantize_model(model_path, output_path, frames, letterbox=False, per_channel=True,
+                   calibration_method='minmax', nodes_to_exclude=None):
+    """
+    Build a static INT8 model calibrated on lane frames
+
+    The model is written in QDQ format with FP32 input and output, so YOLOv8 loads it
+    like the original model.
+
+    Args:
+    model_path (str): FP32 ONNX model
+    output_path (str): Where the INT8 model is saved
+    frames (list): BGR calibration frames, see sample_frames()
+    letterbox (bool): Calibrate with the letterbox preprocessing
+    per_channel (bool): One weight scale per output channel, better accuracy for conv layers
+    calibration_method (str): 'minmax', 'entropy' or 'percentile'
+    nodes_to_exclude (list): Nodes kept in FP32, the Detect head by default
+    """
+    methods = {'minmax': CalibrationMethod.MinMax, 'entropy': CalibrationMethod.Entropy,
+               'percentile': CalibrationMethod.Percentile}
+    if calibration_method not in methods:
+        raise ValueError(f"Unknown calibration method {calibration_method}")
+    if not frames:
+        raise ValueError("No calibration frames")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Shape inference and graph cleanup make the quantization more complete
+        preprocessed_path = os.path.join(tmp_dir, 'preprocessed.onnx')
+        quant_pre_process(model_path, preprocessed_path, skip_symbolic_shape=True)
+
+        if nodes_to_exclude is None:
+            graph = onnx.load(preprocessed_path).graph
+            nodes_to_exclude = [node.name for node in graph.node if node.name.startswith(DETECT_HEAD_PREFIX)]
+
+        reader = FrameCalibrationReader(preprocessed_path, frames, letterbox=letterbox)
+        quantize_static(preprocessed_path, output_path, reader,
+                        quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8,
+                        per_channel=per_channel,
+                        calibrate_method=methods[calibration_method],
+                        nodes_to_exclude=nodes_to_exclude)
+    return output_path
+
+
+def count_classes(class_ids, classes):
+    return np.array([np.count_nonzero(np.asarray(class_ids) == class_id) for class_id in classes])
+
+
+def compare_models(reference, candidate, frames, classes):
+    """
+    Compare the per-class detection counts and the latency of two detectors
+
+    Args:
+    reference (YOLOv8): Detector of the FP32 model
+    candidate (YOLOv8): Detector of the INT8 model
+    frames (list): BGR frames, better not the calibration frames
+    classes (dict): class id -> name of the classes that are counted
+
+    Returns:
+    dict: count agreement per class and latency of each model
+    """
+    class_ids = list(classes)
+    counts = {'reference': [], 'candidate': []}
+    times = {'reference': [], 'candidate': []}
+    for frame in frames:
+        for name, detector in (('reference', reference), ('candidate', candidate)):
+            start = time.perf_counter()
+            _, _, detected = detector(frame)
+            times[name].append(time.perf_counter() - start)
+            counts[name].append(count_classes(detected, class_ids))
+
+    reference_counts = np.array(counts['reference']).reshape(-1, len(class_ids))
+    candidate_counts = np.array(counts['candidate']).reshape(-1, len(class_ids))
+    errors = np.abs(candidate_counts - reference_counts)
+
+    report = {'frames': len(frames), 'classes': {}}
+    for i, class_id in enumerate(class_ids):
+        report['classes'][classes[class_id]] = {
+            'exact_agreement': float(np.mean(errors[:, i] == 0)),
+            'mean_abs_error': float(errors[:, i].mean()),
+            'reference_total': int(reference_counts[:, i].sum()),
+            'candidate_total': int(candidate_counts[:, i].sum()),
+        }
+    total_errors = np.abs(candidate_counts.sum(axis=1) - reference_counts.sum(axis=1))
+    report['total'] = {
+        'exact_agreement': float(np.mean(total_errors == 0)),
+        'mean_abs_error': float(total_errors.mean()),
+    }
+    for name in ('reference', 'candidate'):
+        latency = np.array(times[name][1:] or times[name]) * 1000
+        report[f'{name}_latency_ms'] = {'p50': float(np.percentile(latency, 50)),
+                                        'p95': float(np.percentile(latency, 95))}
+    return report
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+import onnxruntime
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    'sequential': onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+
+class SessionConfig:
+    """ONNX Runtime settings for the YOLOv8 session, the defaults match a plain InferenceSession"""
+
+    def __init__(self, intra_op_threads=0, inter_op_threads=0, execution_mode='sequential',
+                 optimization_level='all', optimized_model_dir=None, io_binding=False, providers=None):
+        """
+        Args:
+        intra_op_threads (int): Threads used inside an operator, 0 lets ONNX Runtime decide
+        inter_op_threads (int): Threads used across operators in parallel execution mode, 0 lets ONNX Runtime decide
+        execution_mode (str): 'sequential' or 'parallel'
+        optimization_level (str): 'disable', 'basic', 'extended' or 'all'
+        optimized_model_dir (str): Save the optimized graph here and load it on the next start
+        io_binding (bool): Run through IOBinding with preallocated input and output buffers
+        providers (list): Execution providers, all available ones by default
+        """
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode {execution_mode}")
+        if optimization_level not in GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(f"Unknown graph optimization level {optimization_level}")
+
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.execution_mode = execution_mode
+        self.optimization_level = optimization_level
+        self.optimized_model_dir = optimized_model_dir
+        self.io_binding = io_binding
+        self.providers = providers or onnxruntime.get_available_providers()
+
+    def __repr__(self):
+        return (f"SessionConfig(intra={self.intra_op_threads}, inter={self.inter_op_threads}, "
+                f"mode={self.execution_mode}, optimization={self.optimization_level}, "
+                f"io_binding={self.io_binding})")
+
+    def session_options(self):
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        options.execution_mode = EXECUTION_MODES[self.execution_mode]
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[self.optimization_level]
+        return options
+
+    def optimized_model_path(self, model_path):
+        """Cache file for the optimized graph, it changes with the model, the settings and the runtime"""
+        stat = os.stat(model_path)
+        key = '|'.join([os.path.abspath(model_path), str(stat.st_size), str(stat.st_mtime_ns),
+                        self.optimization_level, ','.join(self.providers), onnxruntime.__version__])
+        digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        return os.path.join(self.optimized_model_dir, f"{name}.{self.optimization_level}.{digest}.onnx")
+
+
+def create_session(path, config=None):
+    """
+    Create an InferenceSession, reusing the cached optimized graph when there is one
+
+    Returns:
+    tuple: (session, startup time in seconds, True if the cached optimized model was loaded)
+    """
+    config = config or SessionConfig()
+    options = config.session_options()
+    start = time.perf_counter()
+
+    cached = False
+    optimized_path = temp_path = None
+    if config.optimized_model_dir and config.optimization_level != 'disable':
+        optimized_path = config.optimized_model_path(path)
+        if os.path.exists(optimized_path):
+            # The graph is already optimized, skip the optimization passes
+            options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS['disable']
+            path = optimized_path
+            cached = True
+        else:
+            # Workers starting together all save the graph: each one writes its own file and renames it
+            # into place, so the cache file is never seen half written
+            os.makedirs(config.optimized_model_dir, exist_ok=True)
+            temp_path = f"{os.path.splitext(optimized_path)[0]}.{os.getpid()}.tmp.onnx"
+            options.optimized_model_filepath = temp_path
+
+    try:
+        session = onnxruntime.InferenceSession(path, sess_options=options, providers=config.providers)
+        if temp_path and os.path.exists(temp_path):
+            os.replace(temp_path, optimized_path)
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+    return session, time.perf_counter() - start, cached
+
+
+class BoundSession:
+    """
+    Run a session through IOBinding with preallocated buffers
+
+    Input tensors are bound without copying and outputs are written into
+    buffers allocated once per batch size, so a run allocates no new arrays.
+    The returned outputs are reused by the next run with the same batch size.
+    """
+
+    def __init__(self, session, input_name, output_names):
+        self.session = session
+        self.input_name = input_name
+        self.output_names = output_names
+        self.output_shapes = [output.shape for output in session.get_outputs()]
+        self.binding = session.io_binding()
+
+        # batch size -> list of output buffers
+        self.output_buffers = {}
+
+    def get_output_buffers(self, batch_size):
+        buffers = self.output_buffers.get(batch_size)
+        if buffers is None:
+            buffers = []
+            for shape in self.output_shapes:
+                shape = [batch_size] + list(shape[1:])
+                if not all(isinstance(dim, int) for dim in shape):
+                    # Dynamic output dimensions, let ONNX Runtime allocate this output
+                    buffers = None
+                    break
+                buffers.append(np.empty(shape, dtype=np.float32))
+            self.output_buffers[batch_size] = buffers
+        return buffers
+
+    def run(self, input_tensor):
+        input_tensor = np.ascontiguousarray(input_tensor)
+        self.binding.bind_cpu_input(self.input_name, input_tensor)
+
+        buffers = self.get_output_buffers(input_tensor.shape[0])
+        for i, name in enumerate(self.output_names):
+            if buffers is None:
+                self.binding.bind_output(name, 'cpu')
+            else:
+                self.binding.bind_output(name, 'cpu', element_type=np.float32, shape=buffers[i].shape,
+                                         buffer_ptr=buffers[i].ctypes.data)
+
+        self.session.run_with_iobinding(self.binding)
+
+        if buffers is None:
+            return self.binding.copy_outputs_to_cpu()
+        return buffers
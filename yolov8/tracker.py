@@ -0,0 +1,278 @@
+import numpy as np
+
+from yolov8.utils import compute_iou_matrix
+
+# Constant velocity model of SORT, state (cx, cy, area, aspect ratio, vx, vy, v_area), one step per frame
+TRANSITION = np.eye(7)
+TRANSITION[[0, 1, 2], [4, 5, 6]] = 1
+INITIAL_COVARIANCE = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+PROCESS_NOISE = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 1e-4])
+MEASUREMENT_NOISE = np.diag([1.0, 1.0, 10.0, 10.0])
+
+
+def boxes_to_measurements(boxes):
+    # (x1, y1, x2, y2) -> (cx, cy, area, aspect ratio)
+    width = boxes[:, 2] - boxes[:, 0]
+    height = boxes[:, 3] - boxes[:, 1]
+    return np.stack([boxes[:, 0] + width / 2, boxes[:, 1] + height / 2, width * height,
+                     width / np.maximum(height, 1e-6)], axis=1)
+
+
+def states_to_boxes(states):
+    # (cx, cy, area, aspect ratio, ...) -> (x1, y1, x2, y2)
+    width = np.sqrt(np.maximum(states[:, 2] * states[:, 3], 0))
+    height = states[:, 2] / np.maximum(width, 1e-6)
+    return np.stack([states[:, 0] - width / 2, states[:, 1] - height / 2,
+                     states[:, 0] + width / 2, states[:, 1] + height / 2], axis=1)
+
+
+def candidate_pairs(boxes1, boxes2, margin):
+    """
+    Pairs (rows, cols) of boxes1 grown by margin times their size on each side that intersect boxes2
+
+    margin is a number, or one number per box of boxes1.
+
+    The boxes are swept along the axis where they are spread out the most, so
+    only the boxes that overlap on that axis are compared instead of all pairs.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if len(boxes1) == 0 or len(boxes2) == 0:
+        return empty, empty
+    sizes = np.concatenate([boxes1[:, 2:] - boxes1[:, :2], boxes2[:, 2:] - boxes2[:, :2]])
+    margin = np.asarray(margin, dtype=np.float64).reshape(-1, 1)
+    grown = boxes1 + np.tile(boxes1[:, 2:] - boxes1[:, :2], 2) * margin * np.array([-1, -1, 1, 1])
+    spread = np.ptp(np.concatenate([boxes1[:, :2], boxes2[:, :2]]), axis=0) / np.maximum(sizes.mean(axis=0), 1e-6)
+    axis = int(np.argmax(spread))
+
+    # boxes2 whose start lies between (start - longest boxes2 side) and the end of each grown box
+    order = np.argsort(boxes2[:, axis], kind='stable')
+    starts = boxes2[order, axis]
+    longest = (boxes2[:, axis + 2] - boxes2[:, axis]).max()
+    first = np.searchsorted(starts, grown[:, axis] - longest, side='left')
+    last = np.searchsorted(starts, grown[:, axis + 2], side='left')
+    counts = np.maximum(last - first, 0)
+    if counts.sum() == 0:
+        return empty, empty
+    rows = np.repeat(np.arange(len(boxes1)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols = order[np.repeat(first, counts) + offsets]
+
+    intersects = ((grown[rows, 0] < boxes2[cols, 2]) & (grown[rows, 2] > boxes2[cols, 0]) &
+                  (grown[rows, 1] < boxes2[cols, 3]) & (grown[rows, 3] > boxes2[cols, 1]))
+    return rows[intersects], cols[intersects]
+
+
+def greedy_match(rows, cols, costs, used_rows, used_cols):
+    """Take the pairs (rows, cols) of lowest cost first, every row and column used once, marks them used"""
+    matches = []
+    for i in np.argsort(costs, kind='stable').tolist():
+        row, col = rows[i], cols[i]
+        if not used_rows[row] and not used_cols[col]:
+            used_rows[row] = used_cols[col] = True
+            matches.append(i)
+    return rows[matches], cols[matches]
+
+
+class Tracker:
+    """
+    SORT-style tracker: one constant velocity Kalman filter per vehicle, all
+    tracks updated together as arrays. predict() advances the tracks on frames
+    without detections. unique_count counts confirmed tracks, crossing_count the
+    confirmed tracks whose bottom center crossed the stop line.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_distance=1.0, min_hits=3, max_age=10, stop_line=None):
+        """
+        Args:
+        iou_threshold (float): Minimum IoU between a predicted box and a detection to match them
+        max_distance (float): Largest center distance, in square roots of the track area and per frame since
+                              the last match of the track, between a track and a detection matched without
+                              enough IoU
+        min_hits (int): Matched detections before a track is reported and counted
+        max_age (int): Frames a track is kept without a matched detection
+        stop_line (tuple): ((x1, y1), (x2, y2)) in the coordinates of the boxes, no crossing count if None
+        """
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.min_hits = min_hits
+        self.max_age = max_age
+        self.stop_line = None if stop_line is None else np.asarray(stop_line, dtype=np.float64).reshape(2, 2)
+
+        self.states = np.empty((0, 7))
+        self.covariances = np.empty((0, 7, 7))
+        self.ids = np.empty(0, dtype=np.int64)
+        self.class_ids = np.empty(0, dtype=np.int64)
+        self.scores = np.empty(0)
+        self.hits = np.empty(0, dtype=np.int64)
+        self.frames_since_update = np.empty(0, dtype=np.int64)
+        self.missed = np.empty(0, dtype=bool)
+        self.sides = np.empty(0)
+        self.crossed = np.empty(0, dtype=bool)
+
+        self.next_id = 1
+        self.frames = 0
+        self.unique_count = 0
+        self.crossing_count = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def predict(self):
+        """
+        Move every track one frame ahead
+
+        Returns:
+        tuple: (boxes, scores, class_ids, track_ids) of the reported tracks
+        """
+        self._predict()
+        return self.get_tracks()
+
+    def _predict(self):
+        self.frames += 1
+        if len(self.ids):
+            # The area must not become negative
+            self.states[self.states[:, 2] + self.states[:, 6] <= 0, 6] = 0
+            self.states = self.states @ TRANSITION.T
+            self.covariances = TRANSITION @ self.covariances @ TRANSITION.T + PROCESS_NOISE
+            self.frames_since_update += 1
+            self._remove(self.frames_since_update > self.max_age)
+            self._count_crossings()
+
+    def update(self, boxes, scores, class_ids):
+        """
+        Move every track one frame ahead and correct it with the detections of that frame
+
+        Args:
+        boxes (np.ndarray): (N, 4) detections as x1, y1, x2, y2
+        scores, class_ids: Score and class of each detection
+
+        Returns:
+        tuple: (boxes, scores, class_ids, track_ids) of the reported tracks
+        """
+        self._predict()
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float64)
+        class_ids = np.asarray(class_ids, dtype=np.int64)
+
+        rows, cols = self._associate(boxes)
+
+        self.missed[:] = True
+        if len(rows):
+            self._correct(rows, boxes_to_measurements(boxes[cols]))
+            self.class_ids[rows] = class_ids[cols]
+            self.scores[rows] = scores[cols]
+            self.hits[rows] += 1
+            self.frames_since_update[rows] = 0
+            self.missed[rows] = False
+            # Tracks that crossed the line before they were confirmed are counted now
+            newly_confirmed = rows[self.hits[rows] == self.min_hits]
+            self.unique_count += len(newly_confirmed)
+            self.crossing_count += int(np.count_nonzero(self.crossed[newly_confirmed]))
+
+        unmatched = np.ones(len(boxes), dtype=bool)
+        unmatched[cols] = False
+        self._add(boxes[unmatched], scores[unmatched], class_ids[unmatched])
+        return self.get_tracks()
+
+    def _associate(self, boxes):
+        """
+        Matching (track rows, detection cols)
+
+        Predicted boxes and detections are matched by IoU, highest first. The tracks
+        and detections left over are then matched by the distance between their
+        centers, relative to the track size, nearest first: a track that has no
+        velocity estimate yet may be far from its next detection when the detector
+        runs only every few frames. The gate grows with the frames since the last
+        match of the track, as far as the vehicle may have moved in the meantime.
+        """
+        track_boxes = states_to_boxes(self.states)
+        gates = self.max_distance * np.maximum(self.frames_since_update, 1)
+        rows, cols = candidate_pairs(track_boxes, boxes, gates)
+        used_rows = np.zeros(len(track_boxes), dtype=bool)
+        used_cols = np.zeros(len(boxes), dtype=bool)
+        if len(rows) == 0:
+            return rows, cols
+
+        ious = compute_iou_matrix(track_boxes[rows], boxes[cols], pairwise=True)
+        good = ious >= self.iou_threshold
+        iou_rows, iou_cols = greedy_match(rows[good], cols[good], -ious[good], used_rows, used_cols)
+
+        left = ~used_rows[rows] & ~used_cols[cols]
+        rows, cols = rows[left], cols[left]
+        track_centers = (track_boxes[rows, :2] + track_boxes[rows, 2:]) / 2
+        centers = (boxes[cols, :2] + boxes[cols, 2:]) / 2
+        distances = np.hypot(*(track_centers - centers).T) / np.sqrt(np.maximum(self.states[rows, 2], 1e-6))
+        near = distances <= gates[rows]
+        distance_rows, distance_cols = greedy_match(rows[near], cols[near], distances[near], used_rows, used_cols)
+        return np.concatenate([iou_rows, distance_rows]), np.concatenate([iou_cols, distance_cols])
+
+    def get_tracks(self):
+        """(boxes, scores, class_ids, track_ids) of the confirmed tracks matched on their last detection"""
+        reported = (self.hits >= self.min_hits) & ~self.missed
+        return (states_to_boxes(self.states[reported]), self.scores[reported], self.class_ids[reported],
+                self.ids[reported])
+
+    def _correct(self, rows, measurements):
+        # Kalman update of the matched tracks, the measurement is the first 4 state values
+        states = self.states[rows]
+        covariances = self.covariances[rows]
+        innovation_covariances = covariances[:, :4, :4] + MEASUREMENT_NOISE
+        gains = np.linalg.solve(innovation_covariances, covariances[:, :4, :]).transpose(0, 2, 1)
+        residuals = measurements - states[:, :4]
+        self.states[rows] = states + (gains @ residuals[:, :, None])[:, :, 0]
+        self.covariances[rows] = covariances - gains @ covariances[:, :4, :]
+
+    def _add(self, boxes, scores, class_ids):
+        count = len(boxes)
+        if count == 0:
+            return
+        states = np.zeros((count, 7))
+        states[:, :4] = boxes_to_measurements(boxes)
+        self.states = np.concatenate([self.states, states])
+        self.covariances = np.concatenate([self.covariances, np.broadcast_to(INITIAL_COVARIANCE, (count, 7, 7))])
+        self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + count)])
+        self.next_id += count
+        self.class_ids = np.concatenate([self.class_ids, class_ids])
+        self.scores = np.concatenate([self.scores, scores])
+        self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int64)])
+        self.frames_since_update = np.concatenate([self.frames_since_update, np.zeros(count, dtype=np.int64)])
+        self.missed = np.concatenate([self.missed, np.zeros(count, dtype=bool)])
+        self.sides = np.concatenate([self.sides, self._get_sides(states)])
+        self.crossed = np.concatenate([self.crossed, np.zeros(count, dtype=bool)])
+        if self.min_hits <= 1:
+            self.unique_count += count
+
+    def _remove(self, dropped):
+        if not dropped.any():
+            return
+        kept = ~dropped
+        for name in ('states', 'covariances', 'ids', 'class_ids', 'scores', 'hits', 'frames_since_update',
+                     'missed', 'sides', 'crossed'):
+            setattr(self, name, getattr(self, name)[kept])
+
+    def _get_sides(self, states):
+        # Sign of the bottom-center point of each box relative to the stop line, 0 without a stop line
+        if self.stop_line is None:
+            return np.zeros(len(states))
+        (x1, y1), (x2, y2) = self.stop_line
+        boxes = states_to_boxes(states)
+        anchor_x = (boxes[:, 0] + boxes[:, 2]) / 2
+        return np.sign((x2 - x1) * (boxes[:, 3] - y1) - (y2 - y1) * (anchor_x - x1))
+
+    def _count_crossings(self):
+        if self.stop_line is None:
+            return
+        sides = self._get_sides(self.states)
+        crossing = (sides * self.sides < 0) & ~self.crossed
+        self.crossing_count += int(np.count_nonzero(crossing & (self.hits >= self.min_hits)))
+        self.crossed |= crossing
+        # A point exactly on the line keeps the side it came from
+        self.sides = np.where(sides != 0, sides, self.sides)
+
+    def get_stats(self):
+        return {
+            'frames': self.frames,
+            'active_tracks': len(self.ids),
+            'unique_count': self.unique_count,
+            'crossing_count': self.crossing_count,
+        }
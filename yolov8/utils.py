@@ -15,6 +15,11 @@ class_names = ['person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'tra
 rng = np.random.default_rng(3)
 colors = rng.uniform(0, 255, size=(len(class_names), 3))
 
+# Candidates kept before NMS (YOLOv8 produces at most 8400 boxes for a 640x640 input)
+MAX_NMS_CANDIDATES = 30000
+# Rows of the IoU matrix computed at once
+NMS_BLOCK_SIZE = 128
+
 
 def nms(boxes, scores, iou_threshold):
     # Sort by score
@@ -37,20 +42,50 @@ def nms(boxes, scores, iou_threshold):
 
     return keep_boxes
 
-def multiclass_nms(boxes, scores, class_ids, iou_threshold):
+def multiclass_nms(boxes, scores, class_ids, iou_threshold, max_candidates=MAX_NMS_CANDIDATES):
+    # All classes are suppressed in a single pass (see batched_nms)
+    return batched_nms(boxes, scores, class_ids, iou_threshold, max_candidates)
+
+def batched_nms(boxes, scores, class_ids, iou_threshold, max_candidates=MAX_NMS_CANDIDATES,
+                block_size=NMS_BLOCK_SIZE):
+    if len(scores) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Sort by score and keep only the best candidates
+    sorted_indices = np.argsort(scores)[::-1][:max_candidates]
 
-    unique_class_ids = np.unique(class_ids)
+    # Shift each class to its own region so boxes of different classes never overlap
+    class_boxes = boxes[sorted_indices].astype(np.float64)
+    offsets = np.asarray(class_ids)[sorted_indices] * (class_boxes.max() - min(class_boxes.min(), 0) + 1)
+    class_boxes += offsets[:, None]
 
+    num_boxes = len(sorted_indices)
+    suppressed = np.zeros(num_boxes, dtype=bool)
     keep_boxes = []
-    for class_id in unique_class_ids:
-        class_indices = np.where(class_ids == class_id)[0]
-        class_boxes = boxes[class_indices,:]
-        class_scores = scores[class_indices]
 
-        class_keep_boxes = nms(class_boxes, class_scores, iou_threshold)
-        keep_boxes.extend(class_indices[class_keep_boxes])
+    # Boxes are handled one block at a time, which bounds the size of the IoU matrix
+    for block_start in range(0, num_boxes, block_size):
+        block_end = min(block_start + block_size, num_boxes)
 
-    return keep_boxes
+        # Only the boxes that survived the previous blocks are compared
+        candidates = block_start + np.flatnonzero(~suppressed[block_start:])
+        block_ids = candidates[candidates < block_end]
+        if len(block_ids) == 0:
+            continue
+
+        overlaps = compute_overlaps(class_boxes[block_ids], class_boxes[candidates], iou_threshold)
+
+        # Greedy suppression inside the block, in score order
+        block_keep = np.ones(len(block_ids), dtype=bool)
+        for row in range(len(block_ids)):
+            if block_keep[row]:
+                block_keep[row + 1:] &= ~overlaps[row, row + 1:len(block_ids)]
+        keep_boxes.extend(block_ids[block_keep])
+
+        # The kept boxes of this block suppress the remaining boxes in one step
+        suppressed[candidates[len(block_ids):]] |= overlaps[block_keep, len(block_ids):].any(axis=0)
+
+    return sorted_indices[keep_boxes]
 
 def compute_iou(box, boxes):
     # Compute xmin, ymin, xmax, ymax for both boxes
@@ -73,6 +108,42 @@ def compute_iou(box, boxes):
     return iou
 
 
+def compute_iou_matrix(boxes1, boxes2, pairwise=False):
+    # IoU between every box of boxes1 and every box of boxes2, shape (len(boxes1), len(boxes2))
+    # With pairwise=True, boxes1[i] is only compared with boxes2[i]
+    if not pairwise:
+        boxes1, boxes2 = boxes1[:, None, :], boxes2[None, :, :]
+
+    xmin = np.maximum(boxes1[..., 0], boxes2[..., 0])
+    ymin = np.maximum(boxes1[..., 1], boxes2[..., 1])
+    xmax = np.minimum(boxes1[..., 2], boxes2[..., 2])
+    ymax = np.minimum(boxes1[..., 3], boxes2[..., 3])
+
+    intersection_area = np.maximum(0, xmax - xmin) * np.maximum(0, ymax - ymin)
+
+    boxes1_area = (boxes1[..., 2] - boxes1[..., 0]) * (boxes1[..., 3] - boxes1[..., 1])
+    boxes2_area = (boxes2[..., 2] - boxes2[..., 0]) * (boxes2[..., 3] - boxes2[..., 1])
+    union_area = boxes1_area + boxes2_area - intersection_area
+
+    return intersection_area / union_area
+
+
+def compute_overlaps(boxes1, boxes2, iou_threshold):
+    # Boolean matrix of the box pairs with IoU >= iou_threshold
+    # Most pairs do not intersect at all, so the IoU is only computed for the ones that do
+    x1, _, x2, _ = np.ascontiguousarray(boxes2.T)
+    rows, cols = np.nonzero((boxes1[:, 0, None] < x2) & (boxes1[:, 2, None] > x1))
+
+    intersects = (boxes1[rows, 1] < boxes2[cols, 3]) & (boxes1[rows, 3] > boxes2[cols, 1])
+    rows, cols = rows[intersects], cols[intersects]
+
+    overlaps = np.zeros((len(boxes1), len(boxes2)), dtype=bool)
+    if len(rows):
+        ious = compute_iou_matrix(boxes1[rows], boxes2[cols], pairwise=True)
+        overlaps[rows, cols] = ious >= iou_threshold
+    return overlaps
+
+
 def xywh2xyxy(x):
     # Convert bounding box (x, y, w, h) to bounding box (x1, y1, x2, y2)
     y = np.copy(x)
@@ -85,24 +156,28 @@ def xywh2xyxy(x):
 
 def draw_detections(image, boxes, scores, class_ids, mask_alpha=0.3):
     det_img = image.copy()
+    return draw_detections_inplace(det_img, boxes, scores, class_ids, mask_alpha)
+
 
+def draw_detections_inplace(image, boxes, scores, class_ids, mask_alpha=0.3):
+    # Draws straight into image (which may be a view of a larger canvas) without copying it
     img_height, img_width = image.shape[:2]
     font_size = min([img_height, img_width]) * 0.0006
     text_thickness = int(min([img_height, img_width]) * 0.001)
 
-    det_img = draw_masks(det_img, boxes, class_ids, mask_alpha)
+    draw_masks(image, boxes, class_ids, mask_alpha)
 
     # Draw bounding boxes and labels of detections
     for class_id, box, score in zip(class_ids, boxes, scores):
         color = colors[class_id]
 
-        draw_box(det_img, box, color)
+        draw_box(image, box, color)
 
         label = class_names[class_id]
         caption = f'{label} {int(score * 100)}%'
-        draw_text(det_img, caption, box, color, font_size, text_thickness)
+        draw_text(image, caption, box, color, font_size, text_thickness)
 
-    return det_img
+    return image
 
 
 def draw_box( image: np.ndarray, box: np.ndarray, color: tuple[int, int, int] = (0, 0, 255),
@@ -124,15 +199,20 @@ def draw_text(image: np.ndarray, text: str, box: np.ndarray, color: tuple[int, i
     return cv2.putText(image, text, (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, font_size, (255, 255, 255), text_thickness, cv2.LINE_AA)
 
 def draw_masks(image: np.ndarray, boxes: np.ndarray, classes: np.ndarray, mask_alpha: float = 0.3) -> np.ndarray:
-    mask_img = image.copy()
+    img_height, img_width = image.shape[:2]
 
-    # Draw bounding boxes and labels of detections
+    # Blend each box region in place, the rest of the image is never touched
     for box, class_id in zip(boxes, classes):
         color = colors[class_id]
 
         x1, y1, x2, y2 = box.astype(int)
+        x1, y1 = max(x1, 0), max(y1, 0)
+        x2, y2 = min(x2 + 1, img_width), min(y2 + 1, img_height)
+        if x2 <= x1 or y2 <= y1:
+            continue
 
-        # Draw fill rectangle in mask image
-        cv2.rectangle(mask_img, (x1, y1), (x2, y2), color, -1)
+        roi = image[y1:y2, x1:x2]
+        cv2.convertScaleAbs(roi, dst=roi, alpha=1 - mask_alpha)
+        cv2.add(roi, (*(color * mask_alpha), 0), dst=roi)
 
-    return cv2.addWeighted(mask_img, mask_alpha, image, 1 - mask_alpha, 0)
+    return image